@@ -1,14 +1,102 @@
 from django.contrib import admin
-from django.contrib.auth.models import User
+from django.contrib.auth import get_user_model
+from django.db.models import Q
+
+User = get_user_model()
 
 # Unregister only if registered
 if admin.site.is_registered(User):
     admin.site.unregister(User)
 
 
+# ----------------------------------------------------------------------
+# Filters on the denormalized UserOrderStats row. `stats_prefix` is the
+# lookup path from the listed model to the stats row.
+# ----------------------------------------------------------------------
+class OrdersCountFilter(admin.SimpleListFilter):
+    title = "orders placed"
+    parameter_name = "orders_count"
+    stats_prefix = "order_stats__"
+    ranges = {
+        "0": (0, 0),
+        "1": (1, 1),
+        "2-5": (2, 5),
+        "6+": (6, None),
+    }
+
+    def lookups(self, request, model_admin):
+        return [(key, key) for key in self.ranges]
+
+    def queryset(self, request, queryset):
+        if self.value() not in self.ranges:
+            return queryset
+        low, high = self.ranges[self.value()]
+        field = self.stats_prefix + "orders_count"
+        if low == 0:
+            # No stats row yet means no orders either
+            return queryset.filter(Q(**{f"{field}__isnull": True}) | Q(**{field: 0}))
+        queryset = queryset.filter(**{f"{field}__gte": low})
+        if high is not None:
+            queryset = queryset.filter(**{f"{field}__lte": high})
+        return queryset
+
+
+class LifetimeRevenueFilter(admin.SimpleListFilter):
+    title = "lifetime revenue"
+    parameter_name = "lifetime_revenue"
+    stats_prefix = "order_stats__"
+    ranges = {
+        "< 100": (None, 100),
+        "100 - 1000": (100, 1000),
+        "1000+": (1000, None),
+    }
+
+    def lookups(self, request, model_admin):
+        return [(key, key) for key in self.ranges]
+
+    def queryset(self, request, queryset):
+        if self.value() not in self.ranges:
+            return queryset
+        low, high = self.ranges[self.value()]
+        field = self.stats_prefix + "lifetime_revenue"
+        if low is not None:
+            queryset = queryset.filter(**{f"{field}__gte": low})
+        if high is not None:
+            queryset = queryset.filter(**{f"{field}__lt": high})
+        return queryset
+
+
 @admin.register(User)
 class CustomUserAdmin(admin.ModelAdmin):
-    list_display = ("id", "username", "email", "is_staff", "is_active")
+    list_display = (
+        "id",
+        "username",
+        "email",
+        "is_staff",
+        "is_active",
+        "orders_count",
+        "lifetime_revenue",
+        "last_order_at",
+    )
     search_fields = ("username", "email")
-    list_filter = ("is_staff", "is_active")
+    list_filter = ("is_staff", "is_active", OrdersCountFilter, LifetimeRevenueFilter)
+    list_select_related = ("order_stats",)
     ordering = ("username",)
+
+    def _stats(self, obj):
+        return getattr(obj, "order_stats", None)
+
+    @admin.display(ordering="order_stats__orders_count")
+    def orders_count(self, obj):
+        stats = self._stats(obj)
+        return stats.orders_count if stats else 0
+
+    @admin.display(ordering="order_stats__lifetime_revenue")
+    def lifetime_revenue(self, obj):
+        stats = self._stats(obj)
+        return stats.lifetime_revenue if stats else 0
+
+    @admin.display(ordering="order_stats__last_order_at")
+    def last_order_at(self, obj):
+        stats = self._stats(obj)
+        return stats.last_order_at if stats else None
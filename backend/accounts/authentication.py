@@ -0,0 +1,84 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+TOKEN_VERSION_CLAIM = "token_version"
+IS_STAFF_CLAIM = "is_staff"
+
+# Cached for users that no longer exist or were deactivated
+_NO_VALID_USER = -1
+
+
+def _token_version_key(user_id):
+    return f"accounts:token_version:{user_id}"
+
+
+def get_token_version(user_id):
+    """
+    Return the current token version of an active user, or None.
+
+    The value is served from the cache and only read from the database on a
+    miss, so authenticating a request normally costs no query at all.
+    """
+    key = _token_version_key(user_id)
+    version = cache.get(key)
+
+    if version is None:
+        row = (
+            get_user_model()
+            .objects.filter(pk=user_id)
+            .values_list("token_version", "is_active")
+            .first()
+        )
+        version = row[0] if row and row[1] else _NO_VALID_USER
+        cache.set(key, version, settings.TOKEN_VERSION_CACHE_TIMEOUT)
+
+    return None if version == _NO_VALID_USER else version
+
+
+def forget_token_version(user_id):
+    """Drop the cached version so the next request re-reads it."""
+    cache.delete(_token_version_key(user_id))
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that trusts the signed claims instead of loading the
+    user row on every request.
+
+    Notes:
+        - `is_staff` and `token_version` are read from the token.
+        - The returned user defers every other column until it is accessed.
+        - A token whose version differs from the user's current one is
+          rejected, so `User.revoke_tokens()` takes effect immediately
+          (within every process sharing the cache).
+        - Tokens issued without these claims fall back to the regular lookup.
+    """
+
+    def get_user(self, validated_token):
+        if (
+            TOKEN_VERSION_CLAIM not in validated_token
+            or IS_STAFF_CLAIM not in validated_token
+        ):
+            return super().get_user(validated_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken("Token contained no recognizable user identification") from e
+
+        current_version = get_token_version(user_id)
+        if current_version is None:
+            raise AuthenticationFailed("User not found", code="user_not_found")
+
+        if validated_token[TOKEN_VERSION_CLAIM] != current_version:
+            raise AuthenticationFailed("Token has been revoked", code="token_revoked")
+
+        return self.user_model.from_token_claims(
+            user_id,
+            is_staff=validated_token[IS_STAFF_CLAIM],
+            token_version=current_version,
+        )
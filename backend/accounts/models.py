@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, router
+from django.db.models import F
 
 
 class User(AbstractUser):
@@ -17,5 +18,126 @@ class User(AbstractUser):
     # Stripe customer ID (optional for future)
     stripe_customer_id = models.CharField(max_length=255, blank=True)
 
+    # Embedded in every JWT; bumping it revokes all previously issued tokens
+    token_version = models.PositiveIntegerField(default=0)
+
+    # Columns taken from signed token claims (or the token version cache)
+    # instead of the database; never written back from such an instance
+    CLAIM_FIELDS = ("is_staff", "is_active", "token_version")
+
     def __str__(self):
         return self.username
+
+    @classmethod
+    def from_token_claims(cls, user_id, is_staff, token_version):
+        """
+        Build a user instance from validated token claims without a query.
+
+        Every column other than the claimed ones is deferred, so the row is
+        only fetched if a view actually reads one of them.
+        """
+        pk = cls._meta.pk.to_python(user_id)
+        user = cls.from_db(
+            router.db_for_read(cls),
+            ["id", "is_staff", "is_active", "token_version"],
+            [pk, bool(is_staff), True, token_version],
+        )
+        user._from_token_claims = True
+        return user
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        # Load every deferred column at once on the first access instead of
+        # issuing one query per field touched by a serializer.
+        if fields is not None and getattr(self, "_from_token_claims", False):
+            deferred = self.get_deferred_fields()
+            if deferred and set(fields) <= deferred:
+                fields = deferred
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so save() can tell when staff status changes
+        instance._loaded_is_staff = instance.__dict__.get("is_staff")
+        return instance
+
+    def _staff_changed(self, update_fields):
+        """Whether this save writes a different is_staff than the stored one."""
+        if self._state.adding or getattr(self, "_from_token_claims", False):
+            return False
+        if "is_staff" in self.get_deferred_fields():
+            return False
+        if update_fields is not None and "is_staff" not in update_fields:
+            return False
+        previous = getattr(self, "_loaded_is_staff", None)
+        if previous is None:
+            previous = (
+                User.objects.filter(pk=self.pk).values_list("is_staff", flat=True).first()
+            )
+        return previous is not None and previous != self.is_staff
+
+    def save(self, *args, **kwargs):
+        from .authentication import forget_token_version
+
+        # is_staff is a token claim: tokens issued before a promotion or a
+        # demotion must stop working
+        staff_changed = self._staff_changed(kwargs.get("update_fields"))
+        if (
+            getattr(self, "_from_token_claims", False)
+            and kwargs.get("update_fields") is None
+            and not self._state.adding
+        ):
+            # Never write claimed values back: they may be stale by now.
+            deferred = self.get_deferred_fields()
+            kwargs["update_fields"] = [
+                field.attname
+                for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.attname not in self.CLAIM_FIELDS
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+        self._loaded_is_staff = self.__dict__.get("is_staff")
+        if staff_changed:
+            self.revoke_tokens()
+        else:
+            forget_token_version(self.pk)
+
+    def revoke_tokens(self):
+        """Invalidate every access and refresh token issued so far."""
+        from .authentication import forget_token_version
+
+        User.objects.filter(pk=self.pk).update(token_version=F("token_version") + 1)
+        self.refresh_from_db(fields=["token_version"])
+        forget_token_version(self.pk)
+
+
+class UserOrderStats(models.Model):
+    """
+    Per-customer order figures, kept up to date from order status changes
+    (orders.reports.record_user_order_stats, an outbox handler) instead of
+    aggregating Order for every admin page or segment.
+
+    Fields:
+        orders_count (int): Orders placed, whatever became of them.
+        sold_orders_count (int): Orders currently PAID, SHIPPED or DELIVERED.
+        lifetime_revenue (Decimal): Total of those sold orders.
+        last_order_at (DateTime): When the latest order was placed.
+    """
+
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True, related_name="order_stats"
+    )
+    orders_count = models.PositiveIntegerField(default=0, db_index=True)
+    sold_orders_count = models.PositiveIntegerField(default=0)
+    lifetime_revenue = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0, db_index=True
+    )
+    last_order_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "user order stats"
+
+    def __str__(self):
+        return f"{self.user_id}: {self.orders_count} order(s)"
@@ -1,6 +1,15 @@
 from rest_framework import serializers
 from django.contrib.auth.password_validation import validate_password
 from django.contrib.auth import get_user_model
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import (
+    TokenObtainPairSerializer,
+    TokenRefreshSerializer,
+)
+from rest_framework_simplejwt.settings import api_settings
+
+from .authentication import IS_STAFF_CLAIM, TOKEN_VERSION_CLAIM, get_token_version
+from .models import UserOrderStats
 
 User = get_user_model()
 
@@ -47,7 +56,16 @@ class RegisterSerializer(serializers.ModelSerializer):
         return User.objects.create_user(**validated_data)
 
 
+class UserOrderStatsSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UserOrderStats
+        fields = ["orders_count", "sold_orders_count", "lifetime_revenue", "last_order_at"]
+
+
 class UserSerializer(serializers.ModelSerializer):
+    # Read from the denormalized UserOrderStats row (zeros before any order)
+    order_stats = serializers.SerializerMethodField()
+
     class Meta:
         model = User
         fields = [
@@ -62,9 +80,17 @@ class UserSerializer(serializers.ModelSerializer):
             "country",
             "postal_code",
             "newsletter",
+            "order_stats",
         ]
         read_only_fields = ["id", "username", "email"]
 
+    def get_order_stats(self, obj):
+        try:
+            stats = obj.order_stats
+        except UserOrderStats.DoesNotExist:
+            stats = UserOrderStats(user=obj)
+        return UserOrderStatsSerializer(stats).data
+
 
 class UpdateUserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -86,3 +112,36 @@ class ChangePasswordSerializer(serializers.Serializer):
     new_password = serializers.CharField(
         write_only=True, required=True, validators=[validate_password]
     )
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """
+    Issues tokens carrying the claims trusted by ClaimsJWTAuthentication.
+
+    Claims added to the refresh token are copied into every access token
+    derived from it.
+    """
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token[IS_STAFF_CLAIM] = user.is_staff
+        token[TOKEN_VERSION_CLAIM] = user.token_version
+        return token
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Refuses to refresh tokens revoked through the user's token version.
+    """
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs["refresh"])
+        version = refresh.payload.get(TOKEN_VERSION_CLAIM)
+
+        if version is not None:
+            user_id = refresh.payload.get(api_settings.USER_ID_CLAIM)
+            if version != get_token_version(user_id):
+                raise AuthenticationFailed("Token has been revoked", "token_revoked")
+
+        return super().validate(attrs)
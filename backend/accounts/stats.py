@@ -0,0 +1,47 @@
+"""
+Denormalized per-customer order statistics (UserOrderStats).
+
+Each order event adjusts the customer's single row with `F()` updates, so
+admin listings and segments read three columns instead of aggregating
+every order of every user. The orders app feeds it from its outbox
+(orders.reports.record_user_order_stats) and can rebuild it from scratch.
+"""
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .models import UserOrderStats
+
+
+def record_orders(user_id, placed=0, sold=0, revenue=0, placed_at=None):
+    """
+    Add `placed` new orders (placed at `placed_at`), and `sold` orders
+    worth `revenue` (negative for refunds), to a customer's statistics.
+    """
+    rows = UserOrderStats.objects.filter(user_id=user_id)
+    changes = {
+        "orders_count": F("orders_count") + placed,
+        "sold_orders_count": F("sold_orders_count") + sold,
+        "lifetime_revenue": F("lifetime_revenue") + revenue,
+        "updated_at": timezone.now(),
+    }
+    if placed_at is not None:
+        changes["last_order_at"] = Greatest(
+            Coalesce("last_order_at", Value(placed_at)), Value(placed_at)
+        )
+    if rows.update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            UserOrderStats.objects.create(
+                user_id=user_id,
+                orders_count=placed,
+                sold_orders_count=sold,
+                lifetime_revenue=revenue,
+                last_order_at=placed_at,
+            )
+    except IntegrityError:
+        # Created concurrently since our UPDATE
+        rows.update(**changes)
@@ -1,4 +1,6 @@
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import override_settings
 from rest_framework.test import APITestCase
 from rest_framework import status
 
@@ -45,3 +47,133 @@ class ProfileAndPasswordTests(APITestCase):
             format="json",
         )
         self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ClaimsJWTAuthenticationTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username="jwtuser", email="jwt@example.com", password="jwtpass123"
+        )
+
+    def login(self):
+        resp = self.client.post(
+            "/api/auth/login/",
+            {"username": "jwtuser", "password": "jwtpass123"},
+            format="json",
+        )
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        return resp.data
+
+    def test_authenticated_read_skips_user_lookup(self):
+        tokens = self.login()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+
+        # warm the token version cache
+        self.client.get("/api/my/orders/")
+        # only the orders count query remains
+        with self.assertNumQueries(1):
+            resp = self.client.get("/api/my/orders/")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+
+    def test_user_fields_are_loaded_lazily(self):
+        tokens = self.login()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+
+        resp = self.client.get("/api/auth/me/")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.data["email"], "jwt@example.com")
+
+    def test_revoke_tokens_rejects_access_and_refresh(self):
+        tokens = self.login()
+        self.user.revoke_tokens()
+
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+        resp = self.client.get("/api/auth/me/")
+        self.assertEqual(resp.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.client.credentials()
+        resp = self.client.post(
+            "/api/auth/refresh/", {"refresh": tokens["refresh"]}, format="json"
+        )
+        self.assertEqual(resp.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_demotion_revokes_staff_tokens(self):
+        self.user.is_staff = True
+        self.user.save()
+        tokens = self.login()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+        resp = self.client.get("/api/admin/orders/")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+
+        self.user.is_staff = False
+        self.user.save()
+        resp = self.client.get("/api/admin/orders/")
+        self.assertEqual(resp.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.client.credentials()
+        resp = self.client.post(
+            "/api/auth/refresh/", {"refresh": tokens["refresh"]}, format="json"
+        )
+        self.assertEqual(resp.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        # A new token carries the demoted claim
+        tokens = self.login()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+        resp = self.client.get("/api/admin/orders/")
+        self.assertEqual(resp.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_saving_a_claims_user_keeps_a_concurrent_revocation(self):
+        tokens = self.login()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+        # A profile update authenticated before the revocation commits
+        claims_user = User.from_token_claims(
+            self.user.pk, is_staff=False, token_version=self.user.token_version
+        )
+        User.objects.get(pk=self.user.pk).revoke_tokens()
+        claims_user.city = "Elsewhere"
+        claims_user.save()
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.token_version, 1)
+        self.assertEqual(self.user.city, "Elsewhere")
+        resp = self.client.get("/api/auth/me/")
+        self.assertEqual(resp.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_change_password_revokes_tokens(self):
+        tokens = self.login()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+
+        resp = self.client.post(
+            "/api/auth/change-password/",
+            {"old_password": "jwtpass123", "new_password": "newStrongPass456"},
+            format="json",
+        )
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password("newStrongPass456"))
+        self.assertFalse(self.user.is_staff)
+
+        resp = self.client.get("/api/auth/me/")
+        self.assertEqual(resp.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(
+        REST_FRAMEWORK={
+            "DEFAULT_THROTTLE_RATES": {"login_user": "2/min", "login_ip": "100/min"}
+        }
+    )
+    def test_login_is_throttled_before_password_check(self):
+        for _ in range(2):
+            self.client.post(
+                "/api/auth/login/",
+                {"username": "jwtuser", "password": "wrong"},
+                format="json",
+            )
+
+        with self.assertNumQueries(0):
+            resp = self.client.post(
+                "/api/auth/login/",
+                {"username": "JWTuser", "password": "jwtpass123"},
+                format="json",
+            )
+        self.assertEqual(resp.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
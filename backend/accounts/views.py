@@ -3,6 +3,9 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 from django.contrib.auth import get_user_model
+from rest_framework_simplejwt.views import TokenObtainPairView
+
+from backend.throttling import IPTokenBucketThrottle, UsernameTokenBucketThrottle
 
 from .serializers import (
     RegisterSerializer,
@@ -29,6 +32,16 @@ class RegisterViewSet(viewsets.GenericViewSet):
         )
 
 
+class LoginView(TokenObtainPairView):
+    """
+    JWT login, throttled per username and per IP before the password is
+    checked.
+    """
+
+    throttle_classes = [UsernameTokenBucketThrottle, IPTokenBucketThrottle]
+    throttle_scope = "login"
+
+
 class ProfileView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -69,4 +82,6 @@ class ChangePasswordView(APIView):
 
         user.set_password(new_password)
         user.save()
+        # Sessions opened with the old password must not outlive it
+        user.revoke_tokens()
         return Response({"detail": "Password updated successfully"})
@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_asgi_application()
+
+# Build the in-process product suggestion index before the first request
+from products.suggest import warm_up  # noqa: E402
+
+warm_up()
@@ -37,12 +37,28 @@ SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=60),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=7),
     "AUTH_HEADER_TYPES": ("Bearer",),
+    "TOKEN_OBTAIN_SERIALIZER": "accounts.serializers.ClaimsTokenObtainPairSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "accounts.serializers.ClaimsTokenRefreshSerializer",
+}
+
+# Seconds a user's token version stays cached. Revocation is immediate for
+# every process sharing the cache, so use a shared backend in production.
+TOKEN_VERSION_CACHE_TIMEOUT = 300
+
+# Cache (override via environment variables, e.g. a Redis URL in production)
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
+    }
 }
 
 # REST Framework Configuration
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "accounts.authentication.ClaimsJWTAuthentication",
     ),
     "DEFAULT_FILTER_BACKENDS": [
         "django_filters.rest_framework.DjangoFilterBackend",
@@ -51,11 +67,115 @@ REST_FRAMEWORK = {
     ],
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 10,
+    # Token-bucket rates ("<capacity>/<period>") used by backend.throttling,
+    # keyed by "<throttle_scope>_<user|ip>"
+    "DEFAULT_THROTTLE_RATES": {
+        "cart_user": "60/min",
+        "cart_ip": "300/min",
+        "checkout_user": "10/min",
+        "checkout_ip": "60/min",
+        "login_user": "5/min",
+        "login_ip": "30/min",
+    },
 }
 
+# Product listing facets (?facets=category,price)
+PRODUCT_PRICE_FACET_BOUNDARIES = [25, 50, 100, 250, 500]
+PRODUCT_FACETS_CACHE_TIMEOUT = 300
+
+# Search-as-you-type (GET /api/products/suggest/, see products/suggest.py)
+PRODUCT_SUGGEST_LIMIT = 10
+PRODUCT_SUGGEST_MAX_LIMIT = 50
+PRODUCT_SUGGEST_REFRESH_SECONDS = 30
+
+# Batch lookup (GET /api/products/batch/): max products per request
+PRODUCT_BATCH_MAX_SIZE = 100
+
+# Lifetime of the per-product cache entries (serialized fragments and the
+# batch endpoint's compact rows, see products/fragments.py)
+PRODUCT_FRAGMENT_CACHE_TIMEOUT = 300
+
+# Scheme and host of product image URLs in API responses (media_url in
+# products/serializers.py); never taken from the request, since product
+# representations are cached and shared
+MEDIA_BASE_URL = os.getenv("MEDIA_BASE_URL", "http://localhost:8000")
+
+# Admin bulk price/stock changes: products per UPDATE and per request
+PRODUCT_BULK_UPDATE_CHUNK_SIZE = 500
+PRODUCT_BULK_UPDATE_MAX = 10000
+
+# "Frequently bought together" (`build_related_products`): neighbours kept
+# per product, and how long a payment is given to commit before an
+# incremental build reads past it
+RELATED_PRODUCTS_TOP_K = 10
+RELATED_PRODUCTS_SETTLE_MINUTES = 5
+
+# Pre-rendered anonymous product list pages (`build_catalog_snapshots`,
+# served by products.middleware.CatalogSnapshotMiddleware). The first
+# ordering is the list's default one. BASE_URL is the host written into the
+# pages' next/previous links. Off by default: while off, pages are neither
+# served nor invalidated (tests switch them on with override_settings).
+CATALOG_SNAPSHOTS_ENABLED = os.getenv("CATALOG_SNAPSHOTS_ENABLED", "0") == "1"
+CATALOG_SNAPSHOT_DIR = os.getenv("CATALOG_SNAPSHOT_DIR", BASE_DIR / "catalog_snapshots")
+CATALOG_SNAPSHOT_ORDERINGS = ["name", "-name", "price", "-price", "-units_sold"]
+CATALOG_SNAPSHOT_BASE_URL = os.getenv("CATALOG_SNAPSHOT_BASE_URL", "http://localhost:8000")
+
+# Admin bulk status changes: orders per transaction and per request
+ORDER_BULK_STATUS_CHUNK_SIZE = 200
+ORDER_BULK_STATUS_MAX = 5000
+
+# Lifetime of cached closed sales report buckets (orders/reports.py); a
+# report version bump orphans the old ones, so they must expire
+ORDER_REPORT_CACHE_TIMEOUT = int(os.getenv("ORDER_REPORT_CACHE_TIMEOUT", 7 * 24 * 3600))
+
+# Lifetime of the cached GET /api/cart/summary/ totals (dropped on changes)
+CART_SUMMARY_CACHE_TIMEOUT = 300
+
+# Transactional outbox (see orders/outbox.py): topic -> handler import paths
+OUTBOX_HANDLERS = {
+    # Keep products.ProductSalesStats and accounts.UserOrderStats up to date
+    "*": [
+        "orders.reports.record_product_sales",
+        "orders.reports.record_user_order_stats",
+    ],
+}
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_RETRY_BASE_SECONDS = 30
+OUTBOX_RETRY_MAX_SECONDS = 3600
+
+# Cart -> order conversion (see orders/checkout.py): "pessimistic" row
+# locks or "optimistic" version checks with bounded retries
+CHECKOUT_STRATEGY = os.getenv("CHECKOUT_STRATEGY", "pessimistic")
+CHECKOUT_OPTIMISTIC_RETRIES = 3
+CHECKOUT_RETRY_BACKOFF_SECONDS = 0.02
+
+# Idempotency-Key support on checkout/pay (see orders/idempotency.py):
+# how long responses are replayed, how long a retry waits for the first
+# request, and after how long an unfinished first request is abandoned
+IDEMPOTENCY_KEY_TTL_HOURS = 24
+IDEMPOTENCY_WAIT_SECONDS = 10
+IDEMPOTENCY_LOCK_SECONDS = 60
+
+# PENDING orders older than this are cancelled by `expire_pending_orders`.
+# It may not go below the lifetime of a Stripe Checkout Session (24h), or
+# payments would routinely complete for already cancelled orders.
+PENDING_ORDER_TTL_HOURS = 48
+STRIPE_CHECKOUT_SESSION_HOURS = 24
+
+# DELIVERED/CANCELLED orders older than this are moved by `archive_orders`
+ORDER_ARCHIVE_AFTER_MONTHS = 12
+
 # Stripe configuration (override via environment variables)
 STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY", "")
 STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET", "")
+# Empty keeps the SDK default; point it at `manage.py fake_stripe` for offline runs
+STRIPE_API_BASE = os.getenv("STRIPE_API_BASE", "")
+STRIPE_CONNECT_TIMEOUT_SECONDS = 3
+STRIPE_READ_TIMEOUT_SECONDS = 10
+STRIPE_MAX_NETWORK_RETRIES = 2
+STRIPE_POOL_MAXSIZE = 10
+STRIPE_BREAKER_FAILURE_THRESHOLD = 5
+STRIPE_BREAKER_RESET_SECONDS = 30
 
 # Application definition
 INSTALLED_APPS = [
@@ -73,6 +193,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "products.middleware.CatalogSnapshotMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -107,7 +228,12 @@ WSGI_APPLICATION = "backend.wsgi.application"
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        "NAME": os.getenv("SQLITE_PATH", BASE_DIR / "db.sqlite3"),
+        "OPTIONS": {
+            # IMMEDIATE makes concurrent writers queue on the busy timeout
+            # instead of failing when a read transaction starts writing
+            "transaction_mode": os.getenv("SQLITE_TRANSACTION_MODE", "DEFERRED"),
+        },
     }
 }
 
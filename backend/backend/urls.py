@@ -1,12 +1,9 @@
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from rest_framework_simplejwt.views import (
-    TokenObtainPairView,
-    TokenRefreshView,
-)
+from rest_framework_simplejwt.views import TokenRefreshView
 
-from accounts.views import RegisterViewSet, ProfileView, ChangePasswordView
+from accounts.views import RegisterViewSet, LoginView, ProfileView, ChangePasswordView
 from products.views import ProductViewSet, CategoryViewSet
 from orders.views import (
     CartViewSet,
@@ -35,7 +32,7 @@ urlpatterns = [
     # Admin panel
     path("admin/", admin.site.urls),
     # Auth
-    path("api/auth/login/", TokenObtainPairView.as_view(), name="token_obtain_pair"),
+    path("api/auth/login/", LoginView.as_view(), name="token_obtain_pair"),
     path("api/auth/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
     path("api/auth/me/", ProfileView.as_view(), name="auth_me"),
     path("api/auth/change-password/", ChangePasswordView.as_view(), name="auth_change_password"),
@@ -1,5 +1,15 @@
 from django.contrib import admin
-from .models import Cart, CartItem, Order, OrderItem
+from accounts.admin import LifetimeRevenueFilter, OrdersCountFilter
+
+from .models import (
+    ArchivedOrder,
+    Cart,
+    CartItem,
+    IdempotencyKey,
+    Order,
+    OrderItem,
+    OutboxMessage,
+)
 
 
 # ----------------------------------------------------------------------
@@ -24,13 +34,30 @@ class CartAdmin(admin.ModelAdmin):
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 0
-    readonly_fields = ("product", "quantity", "unit_price")
+    readonly_fields = ("product", "product_name", "product_sku", "quantity", "unit_price")
+
+
+class CustomerOrdersCountFilter(OrdersCountFilter):
+    title = "customer's orders placed"
+    parameter_name = "customer_orders_count"
+    stats_prefix = "user__order_stats__"
+
+
+class CustomerLifetimeRevenueFilter(LifetimeRevenueFilter):
+    title = "customer's lifetime revenue"
+    parameter_name = "customer_lifetime_revenue"
+    stats_prefix = "user__order_stats__"
 
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = ("id", "user", "status", "total_amount", "created_at", "paid_at")
-    list_filter = ("status", "created_at")
+    list_filter = (
+        "status",
+        "created_at",
+        CustomerOrdersCountFilter,
+        CustomerLifetimeRevenueFilter,
+    )
     search_fields = ("user__username", "id")
     inlines = [OrderItemInline]
 
@@ -49,5 +76,48 @@ class CartItemAdmin(admin.ModelAdmin):
 # ----------------------------------------------------------------------
 @admin.register(OrderItem)
 class OrderItemAdmin(admin.ModelAdmin):
-    list_display = ("id", "order", "product", "quantity", "unit_price")
-    search_fields = ("order__id", "product__name")
+    list_display = ("id", "order", "product_name", "product_sku", "quantity", "unit_price")
+    search_fields = ("order__id", "product_name", "product_sku")
+
+
+# ----------------------------------------------------------------------
+# Outbox messages (read-only, written by order flows)
+# ----------------------------------------------------------------------
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ("id", "topic", "status", "attempts", "created_at", "dispatched_at")
+    list_filter = ("status", "topic")
+    readonly_fields = (
+        "topic",
+        "payload",
+        "attempts",
+        "created_at",
+        "dispatched_at",
+        "last_error",
+    )
+
+
+# ----------------------------------------------------------------------
+# Archived orders (read-only, written by `archive_orders`)
+# ----------------------------------------------------------------------
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    list_display = ("id", "user", "status", "total_amount", "created_at", "archived_at")
+    list_filter = ("status",)
+    search_fields = ("user__username", "id")
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+# ----------------------------------------------------------------------
+# Stored Idempotency-Key responses (read-only)
+# ----------------------------------------------------------------------
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    list_display = ("key", "user", "response_status", "created_at", "expires_at")
+    list_filter = ("response_status",)
+    search_fields = ("key", "user__username")
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,127 @@
+"""
+Cold storage for closed orders.
+
+`archive_orders()` moves old DELIVERED/CANCELLED orders into ArchivedOrder in
+chunked transactions. The admin order listing only looks at the archive
+when the requested date range reaches back past the archive horizon (the
+newest archived order date), so everyday queries never touch it; a
+customer's own history includes archived orders unless `date_after`
+starts after the horizon.
+"""
+
+from datetime import date
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max
+from django.utils.dateparse import parse_date
+
+from .models import ArchivedOrder, Order, OrderItem
+from .reports import bump_report_version
+
+ARCHIVABLE_STATUSES = ("DELIVERED", "CANCELLED")
+HORIZON_CACHE_KEY = "orders:archive_horizon"
+HORIZON_CACHE_TIMEOUT = 3600
+
+
+def get_archive_horizon():
+    """Return the date of the newest archived order, or None."""
+    horizon = cache.get(HORIZON_CACHE_KEY)
+    if horizon is None:
+        newest = ArchivedOrder.objects.aggregate(newest=Max("created_at"))["newest"]
+        # An empty string caches "nothing archived yet"
+        horizon = newest.date().isoformat() if newest else ""
+        cache.set(HORIZON_CACHE_KEY, horizon, HORIZON_CACHE_TIMEOUT)
+    return date.fromisoformat(horizon) if horizon else None
+
+
+def archive_needed(query_params, default=False):
+    """
+    True if a `date_after` filter reaches into the archived period. Without
+    `date_after` the answer is `default` (as long as anything is archived).
+    """
+    date_after = parse_date(query_params.get("date_after") or "")
+    if date_after is None and not default:
+        return False
+    horizon = get_archive_horizon()
+    if horizon is None:
+        return False
+    return date_after is None or date_after <= horizon
+
+
+def archive_chunk(ids):
+    """Move the archivable orders among `ids`; return how many moved."""
+    with transaction.atomic():
+        orders = list(
+            Order.objects.select_for_update(skip_locked=True)
+            .filter(id__in=ids, status__in=ARCHIVABLE_STATUSES)
+            .prefetch_related("items")
+        )
+        if not orders:
+            return 0
+
+        ArchivedOrder.objects.bulk_create(
+            [
+                ArchivedOrder(
+                    id=order.id,
+                    user_id=order.user_id,
+                    status=order.status,
+                    total_amount=order.total_amount,
+                    shipping_address=order.shipping_address,
+                    created_at=order.created_at,
+                    paid_at=order.paid_at,
+                    stripe_session_id=order.stripe_session_id,
+                    items=[
+                        {
+                            "product_id": item.product_id,
+                            "quantity": item.quantity,
+                            "unit_price": str(item.unit_price),
+                            # The product row may change or go away later
+                            **{
+                                field: getattr(item, field)
+                                for field in OrderItem.SNAPSHOT_FIELDS
+                            },
+                        }
+                        for item in order.items.all()
+                    ],
+                )
+                for order in orders
+            ]
+        )
+        # Deleting the orders cascades to their items
+        Order.objects.filter(id__in=[order.id for order in orders]).delete()
+
+    return len(orders)
+
+
+def archive_orders(cutoff, chunk_size=500, on_chunk=None):
+    """
+    Archive closed orders created before `cutoff`, one chunk per transaction.
+
+    `on_chunk(moved_so_far)` is called after every chunk (e.g. to pause or
+    report progress). Returns the number of archived orders.
+    """
+    candidates = Order.objects.filter(
+        status__in=ARCHIVABLE_STATUSES, created_at__lt=cutoff
+    )
+    last_id = 0
+    moved = 0
+
+    while True:
+        ids = list(
+            candidates.filter(id__gt=last_id)
+            .order_by("id")
+            .values_list("id", flat=True)[:chunk_size]
+        )
+        if not ids:
+            break
+        last_id = ids[-1]
+        moved += archive_chunk(ids)
+        if on_chunk:
+            on_chunk(moved)
+
+    if moved:
+        cache.delete(HORIZON_CACHE_KEY)
+        # Orders changed tables: retire the cached report buckets
+        bump_report_version()
+    return moved
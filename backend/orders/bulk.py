@@ -0,0 +1,163 @@
+"""
+Bulk order status changes for the admin (see AdminOrderViewSet.bulk_set_status).
+
+Orders are processed in id order, ORDER_BULK_STATUS_CHUNK_SIZE per
+transaction. Within a chunk the stock of every order being paid is checked
+against the locked stock once, then deducted (or given back, for
+cancelled paid orders) with one call per product instead of one per item.
+The status change itself is one UPDATE per chunk. Orders that cannot make
+the move are reported and left alone; the other orders of their chunk
+still go through.
+
+Only forward transitions are applied in bulk (ALLOWED_TRANSITIONS); the
+single-order set-status action stays the tool for corrections.
+"""
+
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from products.inventory import InsufficientStock, available_stock, deduct_stock, restock
+
+from .models import Order, OrderItem
+from .outbox import enqueue_order_statuses
+from .reports import note_status_change
+
+ALLOWED_TRANSITIONS = {
+    "PENDING": {"PAID", "CANCELLED"},
+    "PAID": {"SHIPPED", "CANCELLED"},
+    "SHIPPED": {"DELIVERED"},
+    "DELIVERED": set(),
+    "CANCELLED": set(),
+}
+
+UPDATED, UNCHANGED, SKIPPED, FAILED = "updated", "unchanged", "skipped", "failed"
+
+
+def bulk_set_status(order_ids, new_status, chunk_size=None):
+    """
+    Move the given orders to `new_status`. Returns one report row per id:
+    {"id", "result", "old_status", "detail"?}.
+    """
+    chunk_size = chunk_size or settings.ORDER_BULK_STATUS_CHUNK_SIZE
+    order_ids = sorted(set(order_ids))
+    report = []
+    for start in range(0, len(order_ids), chunk_size):
+        chunk = order_ids[start : start + chunk_size]
+        try:
+            report.extend(_apply_chunk(chunk, new_status))
+        except InsufficientStock as exc:
+            # Sharded stock moved between the check and the deduction
+            report.extend(
+                {
+                    "id": pk,
+                    "result": FAILED,
+                    "detail": f"Stock changed during the update ({exc.product.name}), retry",
+                }
+                for pk in chunk
+            )
+    return report
+
+
+def _lines_by_order(orders):
+    lines = defaultdict(list)
+    items = OrderItem.objects.filter(order__in=orders).select_related("product")
+    for item in items:
+        lines[item.order_id].append((item.product, item.quantity))
+    return lines
+
+
+def _fit_stock(orders, lines):
+    """
+    Split orders being paid into those the locked stock covers (in id
+    order) and {order id: product name} of those it does not.
+    """
+    products = {product.pk: product for order in orders for product, _ in lines[order.pk]}
+    remaining = available_stock(list(products.values()), lock=True)
+    covered, short = [], {}
+    for order in orders:
+        needed = defaultdict(int)
+        for product, quantity in lines[order.pk]:
+            needed[product.pk] += quantity
+        missing = [pk for pk, units in needed.items() if units > remaining.get(pk, 0)]
+        if missing:
+            short[order.pk] = products[missing[0]].name
+            continue
+        for pk, units in needed.items():
+            remaining[pk] -= units
+        covered.append(order)
+    return covered, short
+
+
+def _aggregate(orders, lines):
+    return [line for order in orders for line in lines[order.pk]]
+
+
+def _apply_chunk(order_ids, new_status):
+    with transaction.atomic():
+        orders = {
+            order.pk: order
+            for order in Order.objects.select_for_update().filter(id__in=order_ids).order_by("id")
+        }
+        report, moving = {}, []
+        for pk in order_ids:
+            order = orders.get(pk)
+            if order is None:
+                report[pk] = {"id": pk, "result": SKIPPED, "detail": "Order not found"}
+            elif order.status == new_status:
+                report[pk] = {"id": pk, "result": UNCHANGED, "old_status": order.status}
+            elif new_status not in ALLOWED_TRANSITIONS.get(order.status, ()):
+                report[pk] = {
+                    "id": pk,
+                    "result": SKIPPED,
+                    "old_status": order.status,
+                    "detail": f"Cannot move from {order.status} to {new_status}",
+                }
+            else:
+                moving.append(order)
+
+        paying = [order for order in moving if new_status == "PAID"]
+        refunding = [
+            order for order in moving if order.status == "PAID" and new_status == "CANCELLED"
+        ]
+        lines = _lines_by_order(paying + refunding) if paying or refunding else {}
+
+        if paying:
+            covered, short = _fit_stock(paying, lines)
+            for pk, product_name in short.items():
+                report[pk] = {
+                    "id": pk,
+                    "result": FAILED,
+                    "old_status": orders[pk].status,
+                    "detail": f"Not enough stock available ({product_name})",
+                }
+            moving = [order for order in moving if order.pk not in short]
+            # deduct_stock/restock sum the lines per product
+            deduct_stock(_aggregate(covered, lines))
+        if refunding:
+            restock(_aggregate(refunding, lines))
+
+        if moving:
+            changes = {"status": new_status}
+            if new_status == "PAID":
+                changes["paid_at"] = Coalesce("paid_at", Value(timezone.now()))
+            Order.objects.filter(id__in=[order.pk for order in moving]).update(**changes)
+
+            old_statuses = {}
+            for order in moving:
+                old_statuses[order.pk] = order.status
+                order.status = new_status
+                report[order.pk] = {
+                    "id": order.pk,
+                    "result": UPDATED,
+                    "old_status": old_statuses[order.pk],
+                }
+            enqueue_order_statuses((order, old_statuses[order.pk]) for order in moving)
+            for order in moving:
+                note_status_change(order, old_statuses[order.pk])
+
+    return [report[pk] for pk in order_ids]
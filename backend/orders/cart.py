@@ -0,0 +1,51 @@
+"""
+Cart summary for the header badge (GET /api/cart/summary/).
+
+One aggregate over the user's cart items gives the line count, the number
+of units and the subtotal at current prices. The result is cached per user
+and per catalog version (price changes bump it); every cart mutation goes
+through checkout.touch_cart, which drops the entry after commit.
+"""
+
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Sum
+
+from products.cache import get_catalog_version
+
+from .models import CartItem
+
+
+def summary_cache_key(user_id, version=None):
+    version = get_catalog_version() if version is None else version
+    return f"orders:cart_summary:{version}:{user_id}"
+
+
+def cart_summary(user_id):
+    """{"item_count", "quantity", "subtotal"} of a user's cart."""
+    key = summary_cache_key(user_id)
+    summary = cache.get(key)
+    if summary is None:
+        totals = CartItem.objects.filter(cart__user_id=user_id).aggregate(
+            lines=Count("id"),
+            units=Sum("quantity"),
+            amount=Sum(
+                F("quantity") * F("product__price"),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            ),
+        )
+        summary = {
+            "item_count": totals["lines"],
+            "quantity": totals["units"] or 0,
+            "subtotal": totals["amount"] or Decimal("0"),
+        }
+        cache.set(key, summary, settings.CART_SUMMARY_CACHE_TIMEOUT)
+    return summary
+
+
+def forget_cart_summary(user_id):
+    """Drop a user's cached summary once the current transaction commits."""
+    transaction.on_commit(lambda: cache.delete(summary_cache_key(user_id)))
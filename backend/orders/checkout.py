@@ -0,0 +1,200 @@
+"""
+Cart -> order conversion.
+
+Two strategies, selected with settings.CHECKOUT_STRATEGY:
+
+- "pessimistic" locks the cart, its items and the unsharded product rows
+  with SELECT ... FOR UPDATE for the whole transaction. Simple, but every
+  checkout touching the same products waits in line, and SQLite ignores
+  the locks altogether.
+- "optimistic" takes no locks. It reads the cart's `version`, validates
+  stock with plain reads, writes the order, then claims the cart with
+  `UPDATE cart SET version = version + 1 WHERE version = <read>`. If the cart
+  changed in between (a concurrent add, a double submit) nothing matched,
+  the transaction rolls back and the checkout is retried a bounded number
+  of times.
+
+Neither strategy reserves stock: it is taken when the order is paid
+(`mark_paid`, the Stripe webhook transition), with conditional updates in
+products.inventory.deduct_stock.
+"""
+
+import random
+import time
+
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from products.inventory import InsufficientStock, available_stock, deduct_stock
+
+from .cart import forget_cart_summary
+from .models import Cart, CartItem, Order, OrderItem
+from .outbox import enqueue_order_status
+from .reports import note_status_change
+
+STRATEGIES = ("pessimistic", "optimistic")
+
+
+class CheckoutError(Exception):
+    """The cart cannot be turned into an order (missing or empty)."""
+
+
+class CheckoutConflict(Exception):
+    """The cart kept changing under an optimistic checkout."""
+
+
+def touch_cart(cart_id, user_id=None):
+    """
+    Bump a cart's version; call inside the transaction that changes its
+    items so concurrent optimistic checkouts of the old contents retry.
+    Also drops the owner's cached cart summary (looked up when `user_id`
+    is not given).
+    """
+    Cart.objects.filter(pk=cart_id).update(version=F("version") + 1)
+    if user_id is None:
+        user_id = Cart.objects.filter(pk=cart_id).values_list("user_id", flat=True).first()
+    forget_cart_summary(user_id)
+
+
+def place_order(user, shipping_address, strategy=None):
+    """
+    Turn the user's cart into a PENDING order and empty the cart.
+
+    Raises CheckoutError, InsufficientStock or (optimistic strategy only)
+    CheckoutConflict. The order's `checkout_attempts` tells how many tries
+    it took.
+    """
+    strategy = strategy or settings.CHECKOUT_STRATEGY
+    if strategy == "optimistic":
+        return _place_order_optimistic(user, shipping_address)
+    if strategy == "pessimistic":
+        return _place_order_pessimistic(user, shipping_address)
+    raise ValueError(f"Unknown checkout strategy: {strategy}")
+
+
+def _create_order(user, shipping_address, cart_items, stock_by_product):
+    for item in cart_items:
+        available = stock_by_product.get(item.product_id, 0)
+        if item.quantity > available:
+            raise InsufficientStock(item.product, item.quantity, available)
+
+    order = Order.objects.create(
+        user=user,
+        status="PENDING",
+        total_amount=sum(item.product.price * item.quantity for item in cart_items),
+        shipping_address=shipping_address,
+    )
+    order_items = []
+    for item in cart_items:
+        order_item = OrderItem(
+            order=order,
+            product=item.product,
+            quantity=item.quantity,
+            unit_price=item.product.price,
+        )
+        order_item.snapshot_product(item.product)
+        order_items.append(order_item)
+    OrderItem.objects.bulk_create(order_items)
+    enqueue_order_status(order, old_status=None)
+    return order
+
+
+def _place_order_pessimistic(user, shipping_address):
+    with transaction.atomic():
+        try:
+            cart = Cart.objects.select_for_update().get(user=user)
+        except Cart.DoesNotExist:
+            raise CheckoutError("Cart does not exist")
+        cart_items = list(cart.items.select_related("product").select_for_update())
+        if not cart_items:
+            raise CheckoutError("Cart is empty")
+
+        # Unsharded product rows stay locked until commit
+        stock_by_product = available_stock(
+            [item.product for item in cart_items], lock=True
+        )
+        order = _create_order(user, shipping_address, cart_items, stock_by_product)
+        cart.items.all().delete()
+        touch_cart(cart.pk, user.pk)
+        order.checkout_attempts = 1
+        return order
+
+
+def _is_lock_timeout(exc):
+    # SQLite reports writer contention as an error instead of waiting forever
+    return connection.vendor == "sqlite" and "locked" in str(exc)
+
+
+def _place_order_optimistic(user, shipping_address):
+    retries = settings.CHECKOUT_OPTIMISTIC_RETRIES
+    for attempt in range(retries + 1):
+        if attempt:
+            # Jittered backoff so colliding checkouts do not collide again
+            time.sleep(
+                random.uniform(0, settings.CHECKOUT_RETRY_BACKOFF_SECONDS * attempt)
+            )
+        try:
+            order = _try_place_order(user, shipping_address)
+        except CheckoutConflict:
+            continue
+        except OperationalError as exc:
+            if not _is_lock_timeout(exc):
+                raise
+        else:
+            order.checkout_attempts = attempt + 1
+            return order
+    raise CheckoutConflict("Cart changed during checkout, please retry")
+
+
+def _try_place_order(user, shipping_address):
+    cart = Cart.objects.filter(user=user).values_list("pk", "version").first()
+    if cart is None:
+        raise CheckoutError("Cart does not exist")
+    cart_id, version = cart
+
+    with transaction.atomic():
+        cart_items = list(
+            CartItem.objects.filter(cart_id=cart_id).select_related("product")
+        )
+        if not cart_items:
+            if Cart.objects.filter(pk=cart_id, version=version).exists():
+                raise CheckoutError("Cart is empty")
+            raise CheckoutConflict()
+
+        stock_by_product = available_stock([item.product for item in cart_items])
+        order = _create_order(user, shipping_address, cart_items, stock_by_product)
+
+        # Claim the cart: fails if anything changed it since we read `version`
+        if not Cart.objects.filter(pk=cart_id, version=version).update(
+            version=F("version") + 1
+        ):
+            raise CheckoutConflict()
+        CartItem.objects.filter(pk__in=[item.pk for item in cart_items]).delete()
+        forget_cart_summary(user.pk)
+        return order
+
+
+def mark_paid(order_id, session_id=""):
+    """
+    Move a PENDING order to PAID, deducting its stock in the same
+    transaction. Returns the order (left alone unless it was PENDING), or
+    None if it does not exist; raises InsufficientStock.
+    """
+    with transaction.atomic():
+        order = Order.objects.select_for_update().filter(pk=order_id).first()
+        if order is None or order.status != "PENDING":
+            return order
+
+        items = list(order.items.select_related("product"))
+        deduct_stock([(item.product, item.quantity) for item in items])
+
+        old_status = order.status
+        order.status = "PAID"
+        order.paid_at = order.paid_at or timezone.now()
+        order.stripe_session_id = session_id or order.stripe_session_id
+        order.save(update_fields=["status", "paid_at", "stripe_session_id"])
+        enqueue_order_status(order, old_status)
+        note_status_change(order, old_status)
+    return order
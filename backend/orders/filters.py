@@ -1,5 +1,5 @@
 import django_filters
-from .models import Order
+from .models import ArchivedOrder, Order
 
 
 class OrderFilter(django_filters.FilterSet):
@@ -27,3 +27,12 @@ class OrderFilter(django_filters.FilterSet):
             "date_after",
             "date_before",
         ]
+
+
+class ArchivedOrderFilter(OrderFilter):
+    """
+    Same filters as OrderFilter, applied to archived orders.
+    """
+
+    class Meta(OrderFilter.Meta):
+        model = ArchivedOrder
@@ -0,0 +1,149 @@
+"""
+`Idempotency-Key` support for retried POSTs (checkout, payment).
+
+The first request with a key claims a row by inserting it (the unique
+constraint decides the winner), runs the view and stores the response.
+Retries with the same key replay that response without running the view;
+a retry arriving while the first request is still running polls the row
+until the response is there, instead of racing it.
+
+Server errors (5xx), conflicts (409) and exceptions are not stored: the row
+is released so the client can retry for real. Rows expire after IDEMPOTENCY_KEY_TTL_HOURS
+and are removed by `purge_idempotency_keys`.
+"""
+
+import hashlib
+import json
+import time
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+
+
+def fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, cls=DjangoJSONEncoder)
+    raw = f"{request.method} {request.path}\n{body}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _claim(user, key, digest):
+    """
+    Try to insert the in-progress row. Returns (True, None) when this request
+    owns the key, else (False, existing row or None if it just vanished).
+    """
+    now = timezone.now()
+    # An expired row, or one abandoned by a crashed request, is free again
+    IdempotencyKey.objects.filter(user=user, key=key, expires_at__lte=now).delete()
+    try:
+        with transaction.atomic():
+            IdempotencyKey.objects.create(
+                user=user,
+                key=key,
+                fingerprint=digest,
+                expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS),
+            )
+        return True, None
+    except IntegrityError:
+        return False, IdempotencyKey.objects.filter(user=user, key=key).first()
+
+
+def _wait_for_response(record):
+    """Poll an in-flight row until its response is stored (or time is up)."""
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+    delay = 0.05
+    while record is not None and record.response_status is None:
+        if time.monotonic() >= deadline:
+            break
+        time.sleep(delay)
+        delay = min(delay * 2, 0.5)
+        record = IdempotencyKey.objects.filter(pk=record.pk).first()
+    return record
+
+
+def idempotent(view):
+    """Decorator for viewset actions honouring the Idempotency-Key header."""
+
+    @wraps(view)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view(self, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {"detail": f"{HEADER} must be at most {MAX_KEY_LENGTH} characters"},
+                status=400,
+            )
+
+        digest = fingerprint(request)
+        for _ in range(3):
+            owned, record = _claim(request.user, key, digest)
+            if owned:
+                return _run_and_store(view, self, request, key, args, kwargs)
+            if record is None:
+                continue
+            if record.fingerprint != digest:
+                return Response(
+                    {"detail": f"{HEADER} was already used for a different request"},
+                    status=422,
+                )
+
+            record = _wait_for_response(record)
+            if record is None:
+                # The first request failed and released the key: run it now
+                continue
+            if record.response_status is None:
+                break
+            response = Response(record.response_body, status=record.response_status)
+            response["Idempotent-Replayed"] = "true"
+            return response
+
+        return Response(
+            {"detail": f"A request with this {HEADER} is still in progress"},
+            status=409,
+        )
+
+    return wrapper
+
+
+def _run_and_store(view, viewset, request, key, args, kwargs):
+    rows = IdempotencyKey.objects.filter(user=request.user, key=key)
+    try:
+        response = view(viewset, request, *args, **kwargs)
+    except Exception:
+        rows.delete()
+        raise
+
+    if response.status_code >= 500 or response.status_code == 409:
+        rows.delete()
+    else:
+        rows.update(
+            response_status=response.status_code,
+            response_body=response.data,
+            expires_at=timezone.now()
+            + timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS),
+        )
+    return response
+
+
+def purge_expired(chunk_size=1000):
+    """Delete expired rows in small chunks; return how many were removed."""
+    removed = 0
+    while True:
+        ids = list(
+            IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).values_list(
+                "pk", flat=True
+            )[:chunk_size]
+        )
+        if not ids:
+            return removed
+        removed += IdempotencyKey.objects.filter(pk__in=ids).delete()[0]
@@ -0,0 +1,44 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from orders.archive import archive_orders
+
+
+class Command(BaseCommand):
+    help = "Move DELIVERED and CANCELLED orders older than N months to the archive."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--months",
+            type=int,
+            default=settings.ORDER_ARCHIVE_AFTER_MONTHS,
+            help="Age in months (default: settings.ORDER_ARCHIVE_AFTER_MONTHS).",
+        )
+        parser.add_argument("--chunk-size", type=int, default=500)
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=0.05,
+            help="Seconds to sleep between chunks.",
+        )
+
+    def handle(self, *args, **options):
+        # Months are approximated as 30 days
+        cutoff = timezone.now() - timedelta(days=30 * options["months"])
+        started = time.monotonic()
+
+        def on_chunk(moved):
+            if options["verbosity"] > 1:
+                self.stdout.write(f"{moved} order(s) archived so far")
+            time.sleep(options["pause"])
+
+        moved = archive_orders(cutoff, options["chunk_size"], on_chunk=on_chunk)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(f"Archived {moved} order(s) in {elapsed:.2f}s.")
+        )
@@ -0,0 +1,77 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from orders.models import ArchivedOrder, OrderItem
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy product name, SKU, slug and image onto order items (live and "
+        "archived) created before they were snapshotted at checkout (uses the "
+        "current product)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        last_id, updated = 0, 0
+        while True:
+            items = list(
+                OrderItem.objects.filter(pk__gt=last_id, product_name="")
+                .select_related("product")
+                .order_by("pk")[:chunk_size]
+            )
+            if not items:
+                break
+            for item in items:
+                item.snapshot_product(item.product)
+            with transaction.atomic():
+                OrderItem.objects.bulk_update(items, OrderItem.SNAPSHOT_FIELDS)
+            last_id = items[-1].pk
+            updated += len(items)
+
+        archived = self.backfill_archived(chunk_size)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Backfilled {updated} order item(s) and {archived} archived order(s)."
+            )
+        )
+
+    def backfill_archived(self, chunk_size):
+        """Fill the snapshot keys of archived items whose product still exists."""
+        last_id, updated = 0, 0
+        while True:
+            orders = list(
+                ArchivedOrder.objects.filter(pk__gt=last_id)
+                .only("id", "items")
+                .order_by("pk")[:chunk_size]
+            )
+            if not orders:
+                break
+            last_id = orders[-1].pk
+            stale = [
+                order
+                for order in orders
+                if any("product_name" not in item for item in order.items)
+            ]
+            products = Product.objects.in_bulk(
+                {item["product_id"] for order in stale for item in order.items}
+            )
+            for order in stale:
+                for item in order.items:
+                    product = products.get(item["product_id"])
+                    if "product_name" in item or product is None:
+                        continue
+                    snapshot = OrderItem()
+                    snapshot.snapshot_product(product)
+                    item.update(
+                        {field: getattr(snapshot, field) for field in OrderItem.SNAPSHOT_FIELDS}
+                    )
+            if stale:
+                with transaction.atomic():
+                    ArchivedOrder.objects.bulk_update(stale, ["items"])
+                updated += len(stale)
+        return updated
@@ -0,0 +1,71 @@
+import time
+from datetime import timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from orders.models import OrderItem
+from orders.reports import SOLD_STATUSES
+from products.models import RelatedProductsBuild
+from products.recommendations import add_baskets, rebuild_pairs
+
+
+def sold_baskets(paid_until, paid_after=None):
+    """
+    Product ids of each sold order paid in (paid_after, paid_until].
+    Without `paid_after`, sold orders lacking a payment date are included.
+    """
+    items = OrderItem.objects.filter(order__status__in=SOLD_STATUSES).exclude(
+        order__paid_at__gt=paid_until
+    )
+    if paid_after is not None:
+        items = items.filter(order__paid_at__gt=paid_after)
+    rows = items.order_by("order_id").values_list("order_id", "product_id")
+    return [
+        [product_id for _, product_id in group]
+        for _, group in groupby(rows.iterator(chunk_size=5000), key=lambda r: r[0])
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the 'frequently bought together' tables from sold orders. "
+        "Only orders paid since the previous run are read unless --full."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Recount the whole order history instead of updating.",
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        # Leave recent payments alone: their transactions may not be
+        # committed yet, and the next run resumes from here
+        until = timezone.now() - timedelta(
+            minutes=settings.RELATED_PRODUCTS_SETTLE_MINUTES
+        )
+        last = RelatedProductsBuild.objects.order_by("-orders_until").first()
+        full = options["full"] or last is None
+
+        if full:
+            baskets = sold_baskets(until)
+            counts = rebuild_pairs(baskets)
+        else:
+            baskets = sold_baskets(until, paid_after=last.orders_until)
+            counts = add_baskets(baskets)
+
+        RelatedProductsBuild.objects.create(
+            full=full, orders_until=until, orders=len(baskets)
+        )
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{'Rebuilt' if full else 'Updated'} from {len(baskets)} order(s), "
+                f"{len(counts)} product pair(s) in {elapsed:.2f}s."
+            )
+        )
@@ -0,0 +1,144 @@
+import os
+import sys
+import tempfile
+import subprocess
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from orders.checkout import STRATEGIES
+from orders.stress import check_invariants, run_workers, setup_scenario
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Run concurrent add-to-cart -> create_order -> PAID workers on a few hot "
+        "products with each checkout strategy, check the stock invariants and "
+        "report throughput, latencies, retries and lock errors. By default it "
+        "runs against a fresh file-backed SQLite database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=8)
+        parser.add_argument("--rounds", type=int, default=20)
+        parser.add_argument("--stock", type=int, default=100, help="Units per product.")
+        parser.add_argument("--hot-products", type=int, default=2)
+        parser.add_argument("--stock-shards", type=int, default=0)
+        parser.add_argument(
+            "--strategy",
+            choices=STRATEGIES,
+            action="append",
+            help="Strategy to run (repeatable, default: all).",
+        )
+        parser.add_argument(
+            "--processes",
+            action="store_true",
+            help="Run workers as processes instead of threads.",
+        )
+        parser.add_argument(
+            "--immediate",
+            action="store_true",
+            help="Open SQLite transactions with BEGIN IMMEDIATE.",
+        )
+        parser.add_argument(
+            "--in-place",
+            action="store_true",
+            help=(
+                "Use the configured database instead of a temporary SQLite "
+                "file (test data is removed afterwards)."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        if not options["in_place"]:
+            return self.run_isolated(options)
+
+        if options["processes"] and connection.vendor == "sqlite":
+            if str(connection.settings_dict["NAME"]).startswith(("file:", ":memory:")):
+                raise CommandError("Processes need a file-backed database.")
+
+        failed = False
+        for strategy in options["strategy"] or STRATEGIES:
+            products, user_ids = setup_scenario(
+                options["workers"],
+                options["stock"],
+                options["hot_products"],
+                options["stock_shards"],
+            )
+            try:
+                stats = run_workers(
+                    strategy,
+                    products,
+                    user_ids,
+                    options["rounds"],
+                    processes=options["processes"],
+                )
+                problems = check_invariants(
+                    products, options["stock"], user_ids, stats.counts["added"]
+                )
+            finally:
+                get_user_model().objects.filter(pk__in=user_ids).delete()
+                Product.objects.filter(pk__in=[p.pk for p in products]).delete()
+
+            self.report(strategy, stats)
+            for problem in problems:
+                failed = True
+                self.stderr.write(f"{strategy:>12}: {problem}")
+
+        if failed:
+            raise CommandError("Invariant violations found.")
+        self.stdout.write(self.style.SUCCESS("No invariant violations."))
+
+    def report(self, strategy, stats):
+        counts = stats.counts
+
+        def ms(phase, pct):
+            return f"{stats.percentile(phase, pct) * 1000:.1f}"
+
+        self.stdout.write(
+            f"{strategy:>12}: {counts['orders']} order(s) in "
+            f"{counts['seconds']:.2f}s ({counts['throughput']:.1f}/s), "
+            f"{counts['paid']} paid, {counts['out_of_stock']} out of stock\n"
+            f"{'':>12}  checkout p50/p95 {ms('checkout', 50)}/{ms('checkout', 95)} ms, "
+            f"pay p50/p95 {ms('pay', 50)}/{ms('pay', 95)} ms\n"
+            f"{'':>12}  {counts['retries']} retries, {counts['conflicts']} conflicts, "
+            f"{counts['lock_errors']} lock errors "
+            f"({sum(stats.timings['lock_error']):.2f}s in rounds aborted by them)"
+        )
+
+    def run_isolated(self, options):
+        """Migrate a temporary SQLite file and re-run in a child process."""
+        forwarded = ["--in-place"]
+        for name in ("workers", "rounds", "stock", "hot_products", "stock_shards"):
+            forwarded += [f"--{name.replace('_', '-')}", str(options[name])]
+        for strategy in options["strategy"] or []:
+            forwarded += ["--strategy", strategy]
+        if options["processes"]:
+            forwarded.append("--processes")
+
+        manage = [sys.executable, str(settings.BASE_DIR / "manage.py")]
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(
+                os.environ,
+                SQLITE_PATH=os.path.join(tmp, "stress.sqlite3"),
+                # The throwaway catalog must not mark real snapshots dirty
+                CATALOG_SNAPSHOTS_ENABLED="0",
+                CATALOG_SNAPSHOT_DIR=os.path.join(tmp, "catalog_snapshots"),
+            )
+            if options["immediate"]:
+                env["SQLITE_TRANSACTION_MODE"] = "IMMEDIATE"
+
+            subprocess.run(manage + ["migrate", "-v0"], env=env, check=True)
+            child = subprocess.run(
+                manage + ["checkout_stress"] + forwarded,
+                env=env,
+                capture_output=True,
+                text=True,
+            )
+        self.stdout.write(child.stdout, ending="")
+        self.stderr.write(child.stderr, ending="")
+        if child.returncode:
+            raise CommandError("Stress run failed.")
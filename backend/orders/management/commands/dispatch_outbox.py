@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from orders.outbox import dispatch_batch
+
+
+class Command(BaseCommand):
+    help = "Deliver pending outbox messages to their configured handlers."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep polling instead of exiting once the outbox is drained.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1.0,
+            help="Seconds to sleep between polls when idle (with --loop).",
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            handled = dispatch_batch(options["batch_size"])
+            total += handled
+
+            if handled:
+                continue
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
+
+        self.stdout.write(self.style.SUCCESS(f"Handled {total} outbox message(s)."))
@@ -0,0 +1,124 @@
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from orders.models import Order
+from orders.outbox import enqueue_order_statuses
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Cancel abandoned PENDING orders in small chunks. Rows locked by a "
+        "running checkout are skipped, and throughput can be capped so the "
+        "sweep never competes with live traffic."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than",
+            type=float,
+            default=settings.PENDING_ORDER_TTL_HOURS,
+            help=(
+                "Age in hours (default: settings.PENDING_ORDER_TTL_HOURS, at "
+                "least settings.STRIPE_CHECKOUT_SESSION_HOURS)."
+            ),
+        )
+        parser.add_argument("--chunk-size", type=int, default=500)
+        parser.add_argument(
+            "--max-rate",
+            type=float,
+            default=0,
+            help="Maximum orders cancelled per second (0 = unlimited).",
+        )
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=0.05,
+            help="Seconds to sleep between chunks.",
+        )
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        if options["older_than"] < settings.STRIPE_CHECKOUT_SESSION_HOURS:
+            # A checkout session opened for the order could still be paid
+            raise CommandError(
+                f"--older-than must be at least {settings.STRIPE_CHECKOUT_SESSION_HOURS} "
+                "hours (the Stripe Checkout Session lifetime)."
+            )
+        cutoff = timezone.now() - timedelta(hours=options["older_than"])
+        chunk_size = options["chunk_size"]
+        max_rate = options["max_rate"]
+
+        candidates = Order.objects.filter(status="PENDING", created_at__lt=cutoff)
+        if options["dry_run"]:
+            self.stdout.write(f"{candidates.count()} order(s) would be cancelled.")
+            return
+
+        started = time.monotonic()
+        last_id = 0
+        processed = 0
+        chunks = 0
+
+        while True:
+            ids = list(
+                candidates.filter(id__gt=last_id)
+                .order_by("id")
+                .values_list("id", flat=True)[:chunk_size]
+            )
+            if not ids:
+                break
+            last_id = ids[-1]
+
+            processed += self.cancel_chunk(ids)
+            chunks += 1
+
+            elapsed = time.monotonic() - started
+            rate = processed / elapsed if elapsed else 0
+            logger.info(
+                "expire_pending_orders chunk=%d processed=%d rate=%.1f/s",
+                chunks,
+                processed,
+                rate,
+            )
+
+            delay = options["pause"]
+            if max_rate:
+                # Sleep until the average rate is back under the cap
+                delay = max(delay, processed / max_rate - elapsed)
+            time.sleep(delay)
+
+        elapsed = time.monotonic() - started
+        rate = processed / elapsed if elapsed else 0
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Cancelled {processed} order(s) in {chunks} chunk(s), "
+                f"{elapsed:.2f}s ({rate:.1f} rows/s)."
+            )
+        )
+
+    def cancel_chunk(self, ids):
+        """Cancel the still-PENDING orders among `ids`; return how many."""
+        with transaction.atomic():
+            orders = list(
+                Order.objects.select_for_update(skip_locked=True)
+                .filter(id__in=ids, status="PENDING")
+                .only("id", "user_id", "status", "total_amount", "created_at")
+            )
+            if not orders:
+                return 0
+
+            Order.objects.filter(id__in=[order.id for order in orders]).update(
+                status="CANCELLED"
+            )
+            for order in orders:
+                order.status = "CANCELLED"
+            enqueue_order_statuses((order, "PENDING") for order in orders)
+
+        return len(orders)
@@ -0,0 +1,208 @@
+import hashlib
+import hmac
+import json
+import logging
+import secrets
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+logger = logging.getLogger(__name__)
+
+
+def sign_payload(payload, secret, timestamp=None):
+    """Build a Stripe-Signature header value for `payload` (bytes)."""
+    timestamp = int(timestamp or time.time())
+    signed = f"{timestamp}.".encode() + payload
+    digest = hmac.new(secret.encode(), signed, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={digest}"
+
+
+def unflatten_form(body):
+    """Turn Stripe's form encoding (metadata[order_id]=1) into nested dicts."""
+    data = {}
+    for key, value in parse_qsl(body, keep_blank_values=True):
+        parts = key.replace("]", "").split("[")
+        target = data
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = value
+    return data
+
+
+class FakeStripeServer(ThreadingHTTPServer):
+    """
+    Just enough of the Stripe API for the checkout flow:
+
+    - POST /v1/checkout/sessions creates a session.
+    - POST /fake/sessions/<id>/complete (or GET the session `url`) "pays" it
+      and sends a signed checkout.session.completed webhook.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, webhook_url, webhook_secret, latency, auto_complete):
+        super().__init__(address, FakeStripeHandler)
+        self.webhook_url = webhook_url
+        self.webhook_secret = webhook_secret
+        self.latency = latency
+        self.auto_complete = auto_complete
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def create_session(self, params):
+        session_id = f"cs_fake_{secrets.token_hex(12)}"
+        host, port = self.server_address[:2]
+        session = {
+            "id": session_id,
+            "object": "checkout.session",
+            "mode": params.get("mode", "payment"),
+            "status": "open",
+            "payment_status": "unpaid",
+            "metadata": params.get("metadata", {}),
+            "success_url": params.get("success_url"),
+            "cancel_url": params.get("cancel_url"),
+            "url": f"http://{host}:{port}/fake/sessions/{session_id}/complete",
+        }
+        with self.lock:
+            self.sessions[session_id] = session
+        return session
+
+    def complete_session(self, session_id):
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is None or session["status"] == "complete":
+                return session
+            session.update(status="complete", payment_status="paid")
+
+        event = {
+            "id": f"evt_fake_{secrets.token_hex(12)}",
+            "object": "event",
+            "type": "checkout.session.completed",
+            "data": {"object": session},
+        }
+        payload = json.dumps(event).encode()
+        request = urllib.request.Request(
+            self.webhook_url,
+            data=payload,
+            headers={
+                "Content-Type": "application/json",
+                "Stripe-Signature": sign_payload(payload, self.webhook_secret),
+            },
+        )
+        try:
+            urllib.request.urlopen(request, timeout=10).close()
+        except OSError as exc:
+            logger.warning("Webhook delivery for %s failed: %s", session_id, exc)
+        return session
+
+
+class FakeStripeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length).decode()
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        body = self.read_body()
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        if path == "/v1/checkout/sessions":
+            session = self.server.create_session(unflatten_form(body))
+            if self.server.auto_complete:
+                threading.Thread(
+                    target=self.server.complete_session,
+                    args=(session["id"],),
+                    daemon=True,
+                ).start()
+            return self.send_json(200, session)
+
+        if path.startswith("/fake/sessions/") and path.endswith("/complete"):
+            return self.complete(path)
+
+        self.send_json(404, {"error": {"message": f"Unknown route {path}"}})
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path.startswith("/fake/sessions/") and path.endswith("/complete"):
+            return self.complete(path)
+        self.send_json(404, {"error": {"message": f"Unknown route {path}"}})
+
+    def complete(self, path):
+        session_id = path.split("/")[3]
+        session = self.server.complete_session(session_id)
+        if session is None:
+            return self.send_json(404, {"error": {"message": "No such session"}})
+        self.send_json(200, session)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class Command(BaseCommand):
+    help = (
+        "Run a local fake Stripe API for offline load tests of the pay -> "
+        "webhook flow. Start the app with STRIPE_API_BASE=http://<addr>:<port>."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--addr", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=12111)
+        parser.add_argument(
+            "--webhook-url",
+            default="http://127.0.0.1:8000/api/payments/stripe/webhook/",
+        )
+        parser.add_argument(
+            "--webhook-secret",
+            default=settings.STRIPE_WEBHOOK_SECRET,
+            help="Defaults to settings.STRIPE_WEBHOOK_SECRET.",
+        )
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=0.0,
+            help="Seconds added to every API call, to mimic network latency.",
+        )
+        parser.add_argument(
+            "--auto-complete",
+            action="store_true",
+            help="Pay every session right away and send its webhook.",
+        )
+        parser.add_argument("--verbose", action="store_true")
+
+    def handle(self, *args, **options):
+        server = FakeStripeServer(
+            (options["addr"], options["port"]),
+            webhook_url=options["webhook_url"],
+            webhook_secret=options["webhook_secret"],
+            latency=options["latency"],
+            auto_complete=options["auto_complete"],
+        )
+        server.verbose = options["verbose"]
+
+        self.stdout.write(
+            f"Fake Stripe listening on http://{options['addr']}:{options['port']}"
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from orders.reports import rebuild_user_order_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute every customer's order statistics from live and archived "
+        "orders (dispatch the outbox first so no change is counted twice)."
+    )
+
+    def handle(self, *args, **options):
+        count = rebuild_user_order_stats()
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt order statistics for {count} customer(s).")
+        )
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from orders.reports import rebuild_product_sales
+from products.sales import refresh_windows
+
+
+class Command(BaseCommand):
+    help = (
+        "Slide the rolling 7/30-day product sales windows (run daily), or "
+        "rebuild all product sales statistics from the sold orders."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Recompute everything from live orders (archived orders are lost).",
+        )
+
+    def handle(self, *args, **options):
+        if options["rebuild"]:
+            count = rebuild_product_sales()
+            self.stdout.write(
+                self.style.SUCCESS(f"Rebuilt sales statistics for {count} product(s).")
+            )
+            return
+
+        changed = refresh_windows()
+        self.stdout.write(
+            self.style.SUCCESS(f"Refreshed sales windows of {changed} product(s).")
+        )
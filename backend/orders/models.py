@@ -1,5 +1,7 @@
 from django.db import models
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
 from products.models import Product
 
 
@@ -14,11 +16,14 @@ class Cart(models.Model):
         user (OneToOneField): The owner of the cart.
         created_at (DateTime): Timestamp when the cart is created.
         updated_at (DateTime): Timestamp when the cart was last modified.
+        version (PositiveInteger): Bumped on every change to the cart's
+            items; optimistic checkouts only convert the version they read.
     """
 
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    version = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return f"Cart ({self.user.username})"
@@ -72,6 +77,9 @@ class Order(models.Model):
     paid_at = models.DateTimeField(null=True, blank=True)
     stripe_session_id = models.CharField(max_length=255, blank=True)
 
+    class Meta:
+        indexes = [models.Index(fields=["status", "created_at"])]
+
     def __str__(self):
         return f"Order #{self.id} - {self.status}"
 
@@ -82,19 +90,144 @@ class OrderItem(models.Model):
 
     IMPORTANT:
     The price is stored as `unit_price` so that the order remains accurate
-    even if the product price changes in the future.
+    even if the product price changes in the future. Likewise the product's
+    name, SKU, slug and image are copied at checkout, so orders show what
+    was bought and render without reading the catalog tables. Run
+    `backfill_order_item_snapshots` for items created before these fields.
 
     Fields:
         order (ForeignKey): Reference to the parent order.
         product (ForeignKey): Product purchased.
         quantity (PositiveInteger): Number of units purchased.
         unit_price (Decimal): Price of the product at purchase time.
+        product_name, product_sku, product_slug (Char): Product at purchase time.
+        product_image (Char): Storage name of the product image at purchase time.
     """
 
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="items")
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField()
     unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    product_name = models.CharField(max_length=200, blank=True)
+    product_sku = models.CharField(max_length=50, blank=True)
+    product_slug = models.CharField(max_length=50, blank=True)
+    product_image = models.CharField(max_length=100, blank=True)
+
+    SNAPSHOT_FIELDS = ["product_name", "product_sku", "product_slug", "product_image"]
+
+    def snapshot_product(self, product):
+        """Copy the product details shown on orders onto this item."""
+        self.product_name = product.name
+        self.product_sku = product.sku
+        self.product_slug = product.slug
+        self.product_image = product.image.name or ""
+
+    def __str__(self):
+        return f"{self.quantity} × {self.product_name} @ {self.unit_price}"
+
+
+class OutboxMessage(models.Model):
+    """
+    Side effect (email, analytics, ERP sync...) recorded by an order flow.
+
+    Messages are written in the same transaction as the change they describe,
+    so they exist if and only if that change committed. The
+    `dispatch_outbox` command delivers them afterwards, outside any request.
+
+    Fields:
+        topic (CharField): Event name, e.g. "order.paid".
+        payload (JSONField): Event data passed to the handlers.
+        status (CharField): PENDING until delivered (DONE) or given up (FAILED).
+        attempts (PositiveInteger): Delivery attempts so far.
+        available_at (DateTime): Earliest time of the next attempt.
+        dispatched_at (DateTime): Timestamp of the successful delivery.
+        last_error (TextField): Error raised by the last failed attempt.
+    """
+
+    STATUS_CHOICES = [
+        ("PENDING", "Pending"),
+        ("DONE", "Done"),
+        ("FAILED", "Failed"),
+    ]
+
+    topic = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="PENDING")
+    attempts = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    available_at = models.DateTimeField(default=timezone.now)
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "available_at"])]
+
+    def __str__(self):
+        return f"{self.topic} #{self.id} - {self.status}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    First response to a request sent with an `Idempotency-Key` header.
+
+    Retries with the same key are answered from here instead of running the
+    view again (see orders/idempotency.py).
+
+    Fields:
+        user (ForeignKey): Keys are scoped per user.
+        key (CharField): Client supplied key.
+        fingerprint (CharField): Hash of method, path and body; reusing a
+            key for a different request is rejected.
+        response_status (PositiveSmallInteger): Null while the first request
+            is still running.
+        response_body (JSONField): Response data to replay.
+        expires_at (DateTime): Row is ignored and purged after this.
+    """
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "key"], name="unique_idempotency_key"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}:{self.key} ({self.response_status or 'in progress'})"
+
+
+class ArchivedOrder(models.Model):
+    """
+    Compact copy of a closed (DELIVERED or CANCELLED) order moved out of the
+    live tables by the `archive_orders` command.
+
+    The original order id is kept as primary key, and the order items are
+    stored inline as JSON instead of separate rows.
+
+    Fields:
+        items (JSONField): [{"product_id", "quantity", "unit_price",
+            *OrderItem.SNAPSHOT_FIELDS}, ...]
+        archived_at (DateTime): When the order was archived.
+        (other fields mirror Order)
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    total_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    shipping_address = models.TextField()
+    created_at = models.DateTimeField(db_index=True)
+    paid_at = models.DateTimeField(null=True, blank=True)
+    stripe_session_id = models.CharField(max_length=255, blank=True)
+    items = models.JSONField(default=list)
+    archived_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return f"{self.quantity} × {self.product.name} @ {self.unit_price}"
+        return f"Archived order #{self.id} - {self.status}"
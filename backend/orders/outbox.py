@@ -0,0 +1,116 @@
+"""
+Transactional outbox for order side effects.
+
+Order flows call `enqueue()` inside their `transaction.atomic()` block; the
+`dispatch_outbox` management command later hands each message to the
+callables configured in `settings.OUTBOX_HANDLERS`:
+
+    OUTBOX_HANDLERS = {
+        "order.paid": ["myapp.emails.send_receipt"],
+        "*": ["myapp.analytics.track"],
+    }
+
+Handlers receive `(topic, payload)`. A failing message is retried with
+exponential backoff and marked FAILED after OUTBOX_MAX_ATTEMPTS.
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(topic, payload):
+    """Record a message; call inside the transaction of the change itself."""
+    return OutboxMessage.objects.create(topic=topic, payload=payload)
+
+
+def order_status_message(order, old_status):
+    """Build (without saving) the "order.<status>" message for a change."""
+    return OutboxMessage(
+        topic=f"order.{order.status.lower()}",
+        payload={
+            "order_id": order.id,
+            "user_id": order.user_id,
+            "old_status": old_status,
+            "status": order.status,
+            "total_amount": str(order.total_amount),
+            "created_at": order.created_at.isoformat(),
+        },
+    )
+
+
+def enqueue_order_status(order, old_status):
+    """Record an "order.<status>" message for an order status change."""
+    message = order_status_message(order, old_status)
+    message.save()
+    return message
+
+
+def enqueue_order_statuses(changes, batch_size=500):
+    """Record messages for many `(order, old_status)` changes at once."""
+    return OutboxMessage.objects.bulk_create(
+        [order_status_message(order, old_status) for order, old_status in changes],
+        batch_size=batch_size,
+    )
+
+
+def get_handlers(topic):
+    paths = settings.OUTBOX_HANDLERS.get(topic, []) + settings.OUTBOX_HANDLERS.get(
+        "*", []
+    )
+    return [import_string(path) for path in paths]
+
+
+def retry_delay(attempts):
+    """Exponential backoff: base * 2^(attempts - 1), capped."""
+    delay = settings.OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1)
+    return timedelta(seconds=min(delay, settings.OUTBOX_RETRY_MAX_SECONDS))
+
+
+def dispatch_batch(batch_size=100):
+    """
+    Deliver up to `batch_size` due messages and return how many were handled.
+
+    Rows are claimed with SKIP LOCKED where the database supports it, so
+    several dispatchers can run side by side without delivering twice.
+    """
+    with transaction.atomic():
+        messages = list(
+            OutboxMessage.objects.select_for_update(skip_locked=True)
+            .filter(status="PENDING", available_at__lte=timezone.now())
+            .order_by("id")[:batch_size]
+        )
+
+        for message in messages:
+            message.attempts += 1
+            try:
+                # Savepoint: a failing handler leaves no partial writes behind
+                with transaction.atomic():
+                    for handler in get_handlers(message.topic):
+                        handler(message.topic, message.payload)
+            except Exception as exc:
+                logger.exception("Outbox message %s failed", message.id)
+                message.last_error = repr(exc)
+                if message.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+                    message.status = "FAILED"
+                else:
+                    message.available_at = timezone.now() + retry_delay(message.attempts)
+            else:
+                message.status = "DONE"
+                message.dispatched_at = timezone.now()
+                message.last_error = ""
+
+        OutboxMessage.objects.bulk_update(
+            messages,
+            ["status", "attempts", "available_at", "dispatched_at", "last_error"],
+        )
+
+    return len(messages)
@@ -0,0 +1,175 @@
+"""
+Payments client layer.
+
+Every call to Stripe goes through `gateway`, which:
+- reuses pooled HTTP connections (one `requests.Session` per process),
+- bounds each request with strict connect/read timeouts,
+- lets the Stripe SDK retry transient failures (it reuses an idempotency
+  key across retries, so they are safe),
+- stops calling Stripe for a while once it keeps failing (circuit breaker),
+  so a provider outage does not pile up blocked checkout workers.
+
+Point STRIPE_API_BASE at `manage.py fake_stripe` to exercise the whole
+pay -> webhook flow offline.
+"""
+
+import threading
+import time
+
+from django.conf import settings
+
+try:  # Stripe is optional; provide placeholder to allow tests without the package installed.
+    import stripe  # type: ignore
+except ImportError:  # pragma: no cover
+    class _StripePlaceholder:
+        class error:
+            class StripeError(Exception):
+                ...
+
+            class SignatureVerificationError(StripeError):
+                ...
+
+            class APIConnectionError(StripeError):
+                ...
+
+            class RateLimitError(StripeError):
+                ...
+
+            class APIError(StripeError):
+                ...
+
+        class Webhook:
+            @staticmethod
+            def construct_event(*args, **kwargs):
+                raise ImportError("stripe package not installed")
+
+        class checkout:
+            class Session:
+                @staticmethod
+                def create(*args, **kwargs):
+                    raise ImportError("stripe package not installed")
+
+    stripe = _StripePlaceholder()
+
+try:  # requests ships with the Stripe SDK
+    import requests
+    from requests.adapters import HTTPAdapter
+except ImportError:  # pragma: no cover
+    requests = None
+
+
+class PaymentsUnavailable(Exception):
+    """The payment provider is unreachable or the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Minimal in-process circuit breaker.
+
+    After `failure_threshold` consecutive failures the circuit opens and
+    calls fail fast for `reset_timeout` seconds. The first call after that
+    is let through as a probe: success closes the circuit, failure opens it
+    again.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout, timer=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.timer = timer
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self.timer() - self.opened_at >= self.reset_timeout:
+                # Half-open: let this call probe, keep the rest failing fast
+                self.opened_at = self.timer()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = self.timer()
+
+
+class StripeGateway:
+    """
+    Thin wrapper around the Stripe SDK used by the order views.
+    """
+
+    # Errors worth retrying later; anything else is a bad request on our side
+    TRANSIENT_ERRORS = (
+        stripe.error.APIConnectionError,
+        stripe.error.RateLimitError,
+        stripe.error.APIError,
+    )
+
+    def __init__(self):
+        self.breaker = CircuitBreaker(
+            settings.STRIPE_BREAKER_FAILURE_THRESHOLD,
+            settings.STRIPE_BREAKER_RESET_SECONDS,
+        )
+        self._configured = False
+        self._lock = threading.Lock()
+
+    def _configure(self):
+        """Install the pooled HTTP client once per process."""
+        with self._lock:
+            if self._configured:
+                return
+
+            if requests is not None and hasattr(stripe, "RequestsClient"):
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=settings.STRIPE_POOL_MAXSIZE,
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                stripe.default_http_client = stripe.RequestsClient(
+                    timeout=(
+                        settings.STRIPE_CONNECT_TIMEOUT_SECONDS,
+                        settings.STRIPE_READ_TIMEOUT_SECONDS,
+                    ),
+                    session=session,
+                )
+
+            stripe.max_network_retries = settings.STRIPE_MAX_NETWORK_RETRIES
+            if settings.STRIPE_API_BASE:
+                stripe.api_base = settings.STRIPE_API_BASE
+            self._configured = True
+
+    def create_checkout_session(self, **params):
+        """
+        Create a Checkout session.
+
+        Raises PaymentsUnavailable on transient failures or while the
+        circuit is open; other Stripe errors propagate unchanged.
+        """
+        if not self.breaker.allow():
+            raise PaymentsUnavailable("Payment provider temporarily unavailable")
+
+        self._configure()
+        try:
+            session = stripe.checkout.Session.create(
+                api_key=settings.STRIPE_SECRET_KEY, **params
+            )
+        except self.TRANSIENT_ERRORS as exc:
+            self.breaker.record_failure()
+            raise PaymentsUnavailable(str(exc)) from exc
+
+        self.breaker.record_success()
+        return session
+
+
+gateway = StripeGateway()
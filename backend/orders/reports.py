@@ -0,0 +1,405 @@
+"""
+Bucketed sales report for the admin dashboard.
+
+Sales are grouped by day, week (starting Monday) or month of `created_at`
+in one query. A bucket that has already ended no longer changes in normal
+operation, so it is cached for ORDER_REPORT_CACHE_TIMEOUT; only the bucket
+containing "now" is recomputed on every request. The rare events that do
+change the past (late payments and refunds of orders created before today,
+archiving) bump a report version that retires every cached bucket at once.
+
+Archived orders keep their status, total and creation date, so they are
+counted too when the caller passes the archived queryset; their units come
+from the inline items.
+
+Per-product sales statistics (products.sales) and per-customer order
+statistics (accounts.stats) are fed from the same status transitions by
+`record_product_sales` and `record_user_order_stats`, outbox handlers.
+"""
+
+import hashlib
+import time
+from datetime import datetime, time as dt_time, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import (
+    Count,
+    DecimalField,
+    F,
+    IntegerField,
+    Max,
+    OuterRef,
+    Q,
+    Subquery,
+    Sum,
+)
+from django.db.models.functions import Coalesce, Trunc, TruncDate
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from accounts.models import UserOrderStats
+from accounts.stats import record_orders
+from products.models import ProductSalesDay, ProductSalesStats
+from products.sales import record_sales, refresh_windows
+
+from .models import ArchivedOrder, Order, OrderItem
+
+SOLD_STATUSES = ("PAID", "SHIPPED", "DELIVERED")
+BUCKET_KINDS = ("day", "week", "month")
+DEFAULT_SPANS = {"day": 30, "week": 12, "month": 12}
+MAX_BUCKETS = 400
+VERSION_KEY = "orders:report_version"
+
+
+def get_report_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(VERSION_KEY, version, None):
+            version = cache.get(VERSION_KEY, version)
+    return version
+
+
+def bump_report_version():
+    cache.set(VERSION_KEY, time.time_ns(), None)
+
+
+def note_status_change(order, old_status):
+    """
+    Retire cached buckets when an order created before today enters or
+    leaves the sold statuses (late payment, refund...).
+    """
+    was_sold = old_status in SOLD_STATUSES
+    is_sold = order.status in SOLD_STATUSES
+    if was_sold == is_sold:
+        return
+    today = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+    if order.created_at < today:
+        # After commit: a report computed meanwhile would otherwise cache
+        # the old figures under the new version
+        transaction.on_commit(bump_report_version)
+
+
+def bucket_start(day, kind):
+    if kind == "week":
+        return day - timedelta(days=day.weekday())
+    if kind == "month":
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(start, kind):
+    if kind == "week":
+        return start + timedelta(days=7)
+    if kind == "month":
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def default_range(kind, today=None):
+    """Default (from, to) dates: the last DEFAULT_SPANS[kind] buckets."""
+    today = today or timezone.localdate()
+    start = bucket_start(today, kind)
+    for _ in range(DEFAULT_SPANS[kind] - 1):
+        start = bucket_start(start - timedelta(days=1), kind)
+    return start, today
+
+
+def iter_buckets(first, last, kind):
+    start = bucket_start(first, kind)
+    while start <= last:
+        yield start
+        start = next_bucket(start, kind)
+
+
+def _aware(day):
+    return timezone.make_aware(datetime.combine(day, dt_time.min))
+
+
+def _empty(start):
+    return {
+        "period": start,
+        "orders": 0,
+        "revenue": Decimal("0"),
+        "units_sold": 0,
+    }
+
+
+def compute_buckets(queryset, kind, first, end, archived=None):
+    """
+    Aggregate sold orders created in [first, end) per bucket in one query
+    (plus one over the `archived` queryset of ArchivedOrder, if given).
+    Returns {bucket start date: row}.
+    """
+    units = (
+        OrderItem.objects.filter(order=OuterRef("pk"))
+        .values("order")
+        .annotate(total=Sum("quantity"))
+        .values("total")
+    )
+    rows = (
+        queryset.filter(
+            status__in=SOLD_STATUSES,
+            created_at__gte=_aware(first),
+            created_at__lt=_aware(end),
+        )
+        .order_by()
+        .annotate(
+            period=Trunc("created_at", kind),
+            units=Coalesce(Subquery(units, output_field=IntegerField()), 0),
+        )
+        .values("period")
+        .annotate(
+            orders=Count("id"),
+            revenue=Sum("total_amount"),
+            units_sold=Sum("units"),
+        )
+    )
+
+    buckets = {}
+    for row in rows:
+        start = timezone.localtime(row["period"]).date()
+        buckets[start] = {
+            "period": start,
+            "orders": row["orders"],
+            "revenue": row["revenue"] or Decimal("0"),
+            "units_sold": row["units_sold"] or 0,
+        }
+
+    if archived is not None:
+        rows = archived.filter(
+            status__in=SOLD_STATUSES,
+            created_at__gte=_aware(first),
+            created_at__lt=_aware(end),
+        ).values_list("created_at", "total_amount", "items")
+        for created_at, total_amount, items in rows.iterator():
+            start = bucket_start(timezone.localtime(created_at).date(), kind)
+            row = buckets.setdefault(start, _empty(start))
+            row["orders"] += 1
+            row["revenue"] += total_amount
+            row["units_sold"] += sum(item["quantity"] for item in items)
+    return buckets
+
+
+def sales_report(queryset, kind, first, last, cache_scope="", archived=None):
+    """
+    Return one row per bucket between the dates `first` and `last`
+    (inclusive), zero-filled, with orders, revenue, average order value and
+    units sold. Closed buckets are served from the cache when possible.
+
+    The first and last buckets only count orders within [first, last] when
+    the range starts or ends inside them; such partial buckets are labelled
+    with their bucket start but never cached.
+
+    `cache_scope` must identify any extra filtering applied to `queryset`
+    and `archived` (the same filters over ArchivedOrder, or None to leave
+    archived orders out).
+    """
+    starts = list(iter_buckets(first, last, kind))
+    now = timezone.localdate()
+    scope = hashlib.md5(cache_scope.encode()).hexdigest()
+    source = "live" if archived is None else "all"
+    version = get_report_version()
+    keys = {
+        start: f"orders:report:{version}:{source}:{kind}:{start.isoformat()}:{scope}"
+        for start in starts
+    }
+
+    end = last + timedelta(days=1)
+
+    def is_closed(start):
+        return next_bucket(start, kind) <= now
+
+    def is_partial(start):
+        return start < first or next_bucket(start, kind) > end
+
+    buckets = {}
+    for start in starts:
+        if is_partial(start) and start <= now:
+            lo, hi = max(start, first), min(next_bucket(start, kind), end)
+            row = compute_buckets(queryset, kind, lo, hi, archived).get(start)
+            buckets[start] = row or _empty(start)
+
+    full = [start for start in starts if start not in buckets]
+    cached = cache.get_many([keys[start] for start in full if is_closed(start)])
+    buckets.update({start: cached[keys[start]] for start in full if keys[start] in cached})
+
+    missing = [start for start in full if start not in buckets and start <= now]
+    if missing:
+        computed = compute_buckets(
+            queryset, kind, missing[0], next_bucket(missing[-1], kind), archived
+        )
+        to_cache = {}
+        for start in missing:
+            row = computed.get(start) or _empty(start)
+            buckets[start] = row
+            if is_closed(start):
+                to_cache[keys[start]] = row
+        cache.set_many(to_cache, settings.ORDER_REPORT_CACHE_TIMEOUT)
+
+    report = []
+    for start in starts:
+        row = dict(buckets.get(start) or _empty(start))
+        row["average_order_value"] = (
+            (row["revenue"] / row["orders"]).quantize(Decimal("0.01"))
+            if row["orders"]
+            else Decimal("0")
+        )
+        report.append(row)
+    return report
+
+
+# ---------------------------------------------------------------------
+# Per-product sales statistics
+# ---------------------------------------------------------------------
+
+
+def _line_revenue():
+    return Sum(
+        F("quantity") * F("unit_price"),
+        output_field=DecimalField(max_digits=14, decimal_places=2),
+    )
+
+
+def record_product_sales(topic, payload):
+    """
+    Outbox handler for "order.*" messages: add an order's items to the
+    product sales statistics when it becomes sold, remove them when a sold
+    order is cancelled (refund).
+    """
+    if not topic.startswith("order.") or "old_status" not in payload:
+        return
+    was_sold = payload["old_status"] in SOLD_STATUSES
+    is_sold = payload["status"] in SOLD_STATUSES
+    if was_sold == is_sold:
+        return
+
+    order = Order.objects.filter(id=payload["order_id"]).first()
+    if order is None:
+        return
+    lines = (
+        OrderItem.objects.filter(order=order)
+        .values("product_id")
+        .annotate(units=Sum("quantity"), revenue=_line_revenue())
+        .values_list("product_id", "units", "revenue")
+    )
+    record_sales(lines, order.paid_at or order.created_at, sign=1 if is_sold else -1)
+
+
+def rebuild_product_sales():
+    """
+    Recompute every product's sales statistics from the sold orders.
+    Returns the number of products with sales.
+
+    Orders already moved to the archive are not counted, so prefer
+    `refresh_windows()` once the statistics have been built.
+    """
+    items = OrderItem.objects.filter(order__status__in=SOLD_STATUSES).annotate(
+        sold_at=Coalesce("order__paid_at", "order__created_at")
+    )
+    days = (
+        items.annotate(day=TruncDate("sold_at"))
+        .values("product_id", "day")
+        .annotate(units=Sum("quantity"), revenue=_line_revenue())
+        .order_by()
+    )
+    totals = (
+        items.values("product_id")
+        .annotate(
+            units=Sum("quantity"), revenue=_line_revenue(), last=Max("sold_at")
+        )
+        .order_by()
+    )
+
+    with transaction.atomic():
+        ProductSalesDay.objects.all().delete()
+        ProductSalesStats.objects.all().delete()
+        ProductSalesDay.objects.bulk_create(
+            [
+                ProductSalesDay(
+                    product_id=row["product_id"],
+                    day=row["day"],
+                    units=row["units"],
+                    revenue=row["revenue"],
+                )
+                for row in days
+            ],
+            batch_size=1000,
+        )
+        stats = ProductSalesStats.objects.bulk_create(
+            [
+                ProductSalesStats(
+                    product_id=row["product_id"],
+                    units_sold=row["units"],
+                    revenue=row["revenue"],
+                    last_sold_at=row["last"],
+                )
+                for row in totals
+            ],
+            batch_size=1000,
+        )
+        refresh_windows()
+    return len(stats)
+
+
+def record_user_order_stats(topic, payload):
+    """
+    Outbox handler for "order.*" messages: count a newly placed order, and
+    add or remove an order's total when it becomes sold or is refunded.
+    """
+    if not topic.startswith("order.") or "old_status" not in payload:
+        return
+    placed = payload["old_status"] is None
+    was_sold = payload["old_status"] in SOLD_STATUSES
+    is_sold = payload["status"] in SOLD_STATUSES
+    if not placed and was_sold == is_sold:
+        return
+
+    sign = 0 if was_sold == is_sold else (1 if is_sold else -1)
+    placed_at = None
+    if placed:
+        placed_at = parse_datetime(payload.get("created_at") or "") or timezone.now()
+    record_orders(
+        payload["user_id"],
+        placed=1 if placed else 0,
+        sold=sign,
+        revenue=sign * Decimal(payload["total_amount"]),
+        placed_at=placed_at,
+    )
+
+
+def rebuild_user_order_stats():
+    """
+    Recompute every customer's order statistics from live and archived
+    orders. Returns the number of customers with orders.
+    """
+    totals = {}
+    for model in (Order, ArchivedOrder):
+        rows = (
+            model.objects.values("user_id")
+            .annotate(
+                orders=Count("id"),
+                sold=Count("id", filter=Q(status__in=SOLD_STATUSES)),
+                revenue=Sum("total_amount", filter=Q(status__in=SOLD_STATUSES)),
+                last=Max("created_at"),
+            )
+            .order_by()
+        )
+        for row in rows:
+            stats = totals.setdefault(
+                row["user_id"],
+                UserOrderStats(user_id=row["user_id"], lifetime_revenue=Decimal("0")),
+            )
+            stats.orders_count += row["orders"]
+            stats.sold_orders_count += row["sold"]
+            stats.lifetime_revenue += row["revenue"] or Decimal("0")
+            if stats.last_order_at is None or row["last"] > stats.last_order_at:
+                stats.last_order_at = row["last"]
+
+    with transaction.atomic():
+        UserOrderStats.objects.all().delete()
+        UserOrderStats.objects.bulk_create(totals.values(), batch_size=1000)
+    return len(totals)
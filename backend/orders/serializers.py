@@ -1,8 +1,8 @@
 from rest_framework import serializers
 
-from .models import Cart, CartItem, Order, OrderItem
+from .models import ArchivedOrder, Cart, CartItem, Order, OrderItem
 from products.models import Product
-from products.serializers import ProductSerializer
+from products.serializers import ProductFragmentField, media_url
 
 
 class AddToCartSerializer(serializers.Serializer):
@@ -42,10 +42,11 @@ class CartItemSerializer(serializers.ModelSerializer):
     """
     Represents a single item inside the user's cart.
 
-    Provides nested product information using ProductSerializer.
+    Provides nested product information as ProductSerializer renders it,
+    taken from the cached product fragments when the view passes them.
     """
 
-    product = ProductSerializer(read_only=True)
+    product = ProductFragmentField()
 
     class Meta:
         model = CartItem
@@ -68,21 +69,56 @@ class CartSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
+class CartSummarySerializer(serializers.Serializer):
+    """
+    Cart totals for the header badge.
+
+    Fields:
+        item_count (int): Number of cart lines.
+        quantity (int): Units over all lines.
+        subtotal (Decimal): Lines at current product prices.
+    """
+
+    item_count = serializers.IntegerField()
+    quantity = serializers.IntegerField()
+    subtotal = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+
+def ordered_product(product_id, snapshot):
+    """
+    The product of an order line as purchased, from the snapshot values
+    (OrderItem.SNAPSHOT_FIELDS) of a live or archived item.
+    """
+    return {
+        "id": product_id,
+        "name": snapshot.get("product_name", ""),
+        "sku": snapshot.get("product_sku", ""),
+        "slug": snapshot.get("product_slug", ""),
+        # Same URLs as the catalog's product images
+        "image": media_url(snapshot.get("product_image")),
+    }
+
+
 class OrderItemSerializer(serializers.ModelSerializer):
     """
     Represents a single item inside an order.
 
     Includes:
-        - Product snapshot (via ProductSerializer)
+        - Product as it was at purchase time (id, name, sku, slug, image),
+          read from the item's own snapshot columns, not the catalog
         - Quantity
         - Unit price at time of purchase
     """
 
-    product = ProductSerializer(read_only=True)
+    product = serializers.SerializerMethodField()
 
     class Meta:
         model = OrderItem
-        fields = "__all__"
+        fields = ["id", "order", "product", "quantity", "unit_price"]
+
+    def get_product(self, obj):
+        snapshot = {field: getattr(obj, field) for field in OrderItem.SNAPSHOT_FIELDS}
+        return ordered_product(obj.product_id, snapshot)
 
 
 class OrderSerializer(serializers.ModelSerializer):
@@ -101,6 +137,74 @@ class OrderSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
+class OrderSummarySerializer(serializers.ModelSerializer):
+    """
+    Order header for history listings.
+
+    Includes:
+        - Order metadata without the shipping address
+        - item_count: number of order lines, annotated in SQL by the view
+    """
+
+    item_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Order
+        fields = ["id", "status", "total_amount", "created_at", "paid_at", "item_count"]
+
+
+class ArchivedOrderSerializer(serializers.ModelSerializer):
+    """
+    Represents an archived order.
+
+    Includes:
+        - Order metadata (same fields as OrderSerializer)
+        - Items like OrderItemSerializer's (product as purchased, quantity,
+          unit_price), rendered from the inline JSON
+        - archived: always true
+    """
+
+    items = serializers.SerializerMethodField()
+    archived = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ArchivedOrder
+        exclude = ["archived_at"]
+
+    def get_items(self, obj):
+        return [
+            {
+                "product": ordered_product(item["product_id"], item),
+                "quantity": item["quantity"],
+                "unit_price": item["unit_price"],
+            }
+            for item in obj.items
+        ]
+
+    def get_archived(self, obj):
+        return True
+
+
+class ArchivedOrderSummarySerializer(serializers.ModelSerializer):
+    """
+    Archived counterpart of OrderSummarySerializer (item_count is read from
+    the inline items; archived: always true).
+    """
+
+    item_count = serializers.SerializerMethodField()
+    archived = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ArchivedOrder
+        fields = OrderSummarySerializer.Meta.fields + ["archived"]
+
+    def get_item_count(self, obj):
+        return len(obj.items)
+
+    def get_archived(self, obj):
+        return True
+
+
 class CreateOrderSerializer(serializers.Serializer):
     """
     Serializer used when creating a new order.
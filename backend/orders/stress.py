@@ -0,0 +1,222 @@
+"""
+Checkout contention harness (see `manage.py checkout_stress`).
+
+Every worker owns one customer and repeatedly puts one unit of a random
+product from a small hot set in its cart, checks out with the strategy under
+test and pays the order through `checkout.mark_paid`, the transition the
+Stripe webhook runs. Workers are threads or processes; afterwards
+`check_invariants` verifies nothing was oversold or lost.
+"""
+
+import multiprocessing
+import random
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+
+from django.contrib.auth import get_user_model
+from django.db import OperationalError, close_old_connections, connection, transaction
+from django.db.models import Sum
+
+from products.inventory import InsufficientStock, available_stock, reshard
+from products.models import Product
+
+from .checkout import CheckoutConflict, CheckoutError, mark_paid, place_order, touch_cart
+from .models import Cart, CartItem, Order, OrderItem
+
+
+class Stats:
+    """Counters and per-phase latencies of one or more workers."""
+
+    def __init__(self):
+        self.counts = Counter()
+        self.timings = defaultdict(list)
+
+    def merge(self, other):
+        self.counts.update(other.counts)
+        for phase, values in other.timings.items():
+            self.timings[phase].extend(values)
+        return self
+
+    def timed(self, phase, started):
+        self.timings[phase].append(time.perf_counter() - started)
+
+    def percentile(self, phase, pct):
+        values = sorted(self.timings.get(phase, []))
+        if not values:
+            return 0.0
+        return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def setup_scenario(workers, stock, hot_products=1, stock_shards=0):
+    """
+    Create `hot_products` products holding `stock` units each and one
+    customer (with a cart) per worker. Returns (products, user_ids).
+    """
+    tag = uuid.uuid4().hex[:8]
+    products = []
+    for index in range(hot_products):
+        product = Product.objects.create(
+            name=f"Stress {tag} {index}",
+            slug=f"stress-{tag}-{index}",
+            price=10,
+            stock=stock,
+            stock_shards=stock_shards,
+        )
+        if stock_shards:
+            reshard(product, total=stock)
+        products.append(product)
+
+    User = get_user_model()
+    user_ids = []
+    for index in range(workers):
+        user = User.objects.create_user(username=f"stress-{tag}-{index}")
+        Cart.objects.create(user=user)
+        user_ids.append(user.id)
+    return products, user_ids
+
+
+def checkout_round(user, products, strategy, stats):
+    """Add one unit of a hot product, check out and pay."""
+    counts = stats.counts
+    cart = Cart.objects.get(user=user)
+    with transaction.atomic():
+        touch_cart(cart.pk, user.pk)
+        CartItem.objects.create(cart=cart, product=random.choice(products), quantity=1)
+    counts["added"] += 1
+
+    started = time.perf_counter()
+    try:
+        order = place_order(user, "1 Stress St", strategy=strategy)
+    except InsufficientStock:
+        counts["out_of_stock"] += 1
+        return
+    except CheckoutConflict:
+        counts["conflicts"] += 1
+        return
+    except CheckoutError:
+        counts["empty_cart"] += 1
+        return
+    finally:
+        stats.timed("checkout", started)
+    counts["orders"] += 1
+    counts["retries"] += order.checkout_attempts - 1
+
+    started = time.perf_counter()
+    try:
+        # Units left behind by a failed round end up in this order too
+        mark_paid(order.pk, session_id=f"cs_stress_{order.pk}")
+    except InsufficientStock:
+        counts["payment_failed"] += 1
+    else:
+        counts["paid"] += 1
+    finally:
+        stats.timed("pay", started)
+
+
+def run_worker(user_id, product_ids, rounds, strategy):
+    """Thread/process body: `rounds` checkouts; errors are counted, not raised."""
+    close_old_connections()
+    stats = Stats()
+    user = products = None
+    try:
+        for _ in range(rounds):
+            started = time.perf_counter()
+            try:
+                if products is None:
+                    user = get_user_model().objects.get(pk=user_id)
+                    products = list(Product.objects.filter(pk__in=product_ids))
+                checkout_round(user, products, strategy, stats)
+            except OperationalError:
+                # Lock timeouts ("database is locked" on SQLite)
+                stats.counts["lock_errors"] += 1
+                stats.timed("lock_error", started)
+    finally:
+        connection.close()
+    return stats
+
+
+def run_workers(strategy, products, user_ids, rounds, processes=False):
+    """
+    Run one worker per user, as threads or (with `processes=True`) forked
+    processes, and return the merged Stats with `seconds` and `throughput`
+    counters.
+    """
+    product_ids = [product.pk for product in products]
+    jobs = [(user_id, product_ids, rounds, strategy) for user_id in user_ids]
+
+    started = time.perf_counter()
+    if processes:
+        # Children must not share the parent's database connection
+        connection.close()
+        context = multiprocessing.get_context("fork")
+        with context.Pool(len(jobs)) as pool:
+            results = pool.starmap(run_worker, jobs)
+    else:
+        results = [None] * len(jobs)
+
+        def target(index):
+            results[index] = run_worker(*jobs[index])
+
+        threads = [
+            threading.Thread(target=target, args=(index,)) for index in range(len(jobs))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    elapsed = time.perf_counter() - started
+
+    stats = Stats()
+    for result in results:
+        stats.merge(result)
+    stats.counts["seconds"] = elapsed
+    stats.counts["throughput"] = stats.counts["orders"] / elapsed if elapsed else 0
+    return stats
+
+
+def check_invariants(products, initial_stock, user_ids, added):
+    """
+    Return a list of human readable violations (empty when all is well).
+    `initial_stock` is per product; `added` is the number of units the
+    workers put in their carts.
+    """
+    problems = []
+    stock = available_stock(products)
+    paid = dict(
+        OrderItem.objects.filter(product__in=products, order__status="PAID")
+        .values("product_id")
+        .annotate(units=Sum("quantity"))
+        .values_list("product_id", "units")
+    )
+    for product in products:
+        left, sold = stock[product.pk], paid.get(product.pk, 0)
+        if left < 0:
+            problems.append(f"{product.name}: negative stock {left}")
+        if sold > initial_stock:
+            problems.append(f"{product.name}: oversold, {sold} > {initial_stock}")
+        if sold + left != initial_stock:
+            problems.append(
+                f"{product.name}: paid {sold} + stock {left} != initial {initial_stock}"
+            )
+
+    orders = Order.objects.filter(user_id__in=user_ids)
+    itemless = orders.exclude(items__isnull=False).count()
+    if itemless:
+        problems.append(f"{itemless} order(s) without items")
+
+    # Every unit put in a cart is either still there or in exactly one order
+    ordered = (
+        OrderItem.objects.filter(order__in=orders).aggregate(units=Sum("quantity"))
+    )["units"] or 0
+    in_carts = (
+        CartItem.objects.filter(cart__user_id__in=user_ids).aggregate(
+            units=Sum("quantity")
+        )
+    )["units"] or 0
+    if ordered + in_carts != added:
+        problems.append(
+            f"{added} unit(s) added but {ordered} ordered + {in_carts} in carts"
+        )
+    return problems
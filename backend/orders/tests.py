@@ -1,16 +1,52 @@
+import json
+import threading
+import unittest
+from datetime import datetime, time, timedelta
+from io import StringIO
+from types import SimpleNamespace
+
 from django.contrib.auth import get_user_model
-from django.test import override_settings
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.test import TransactionTestCase, override_settings
 from rest_framework.test import APITestCase
 from unittest.mock import patch
 
-from products.models import Product
-from orders.models import Order, OrderItem, Cart, CartItem
+from accounts.models import UserOrderStats
+from products.inventory import reshard
+from products.models import (
+    Product,
+    ProductSalesDay,
+    ProductSalesStats,
+    RelatedProductsBuild,
+)
+from products import recommendations
+from products.recommendations import cooccurrence
+from products.sales import refresh_windows
+from orders.models import (
+    ArchivedOrder,
+    Cart,
+    CartItem,
+    IdempotencyKey,
+    Order,
+    OrderItem,
+    OutboxMessage,
+)
+from orders.idempotency import fingerprint
+from orders.outbox import dispatch_batch
+from orders.stress import check_invariants, run_workers, setup_scenario
+from orders.payments import PaymentsUnavailable, StripeGateway, stripe
+from orders.management.commands.fake_stripe import FakeStripeServer, sign_payload
 
 User = get_user_model()
 
 
 class CartAndOrderTests(APITestCase):
     def setUp(self):
+        cache.clear()
         self.user = User.objects.create_user(username="user", password="123456")
         self.admin = User.objects.create_user(
             username="admin", password="admin123", is_staff=True
@@ -117,6 +153,41 @@ class CartAndOrderTests(APITestCase):
         self.product.refresh_from_db()
         self.assertEqual(self.product.stock, 5)
 
+    def test_admin_set_status_paid_uses_stock_shards(self):
+        self.product.stock_shards = 3
+        self.product.save()
+        reshard(self.product)
+
+        order = Order.objects.create(
+            user=self.user, total_amount=400, shipping_address="123 Street"
+        )
+        OrderItem.objects.create(
+            order=order, product=self.product, quantity=4, unit_price=100
+        )
+
+        self.authenticate(self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = self.client.post(
+                f"/api/admin/orders/{order.id}/set-status/", {"status": "PAID"}
+            )
+        self.assertEqual(resp.status_code, 200)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 1)
+
+        order2 = Order.objects.create(
+            user=self.user, total_amount=200, shipping_address="123 Street"
+        )
+        OrderItem.objects.create(
+            order=order2, product=self.product, quantity=2, unit_price=100
+        )
+        resp = self.client.post(
+            f"/api/admin/orders/{order2.id}/set-status/", {"status": "PAID"}
+        )
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.data["available_stock"], 1)
+        order2.refresh_from_db()
+        self.assertEqual(order2.status, "PENDING")
+
     def test_admin_report_structure(self):
         self.authenticate(self.admin)
         resp = self.client.get("/api/admin/orders/report/")
@@ -189,3 +260,1274 @@ class CartAndOrderTests(APITestCase):
         self.assertIsNotNone(order.paid_at)
         self.product.refresh_from_db()
         self.assertEqual(self.product.stock, 4)
+
+    @override_settings(STRIPE_WEBHOOK_SECRET="whsec_test_dummy")
+    @patch("orders.views.stripe.Webhook.construct_event")
+    def test_webhook_ignores_cancelled_orders(self, mock_construct_event):
+        order = Order.objects.create(
+            user=self.user, status="CANCELLED", total_amount=10, shipping_address="1 St"
+        )
+        OrderItem.objects.create(
+            order=order, product=self.product, quantity=1, unit_price=10
+        )
+        mock_construct_event.return_value = {
+            "type": "checkout.session.completed",
+            "data": {"object": {"id": "cs_late", "metadata": {"order_id": order.id}}},
+        }
+
+        with self.assertLogs("orders.views", level="ERROR") as logs:
+            resp = self.client.post(
+                "/api/payments/stripe/webhook/",
+                data="{}",
+                content_type="application/json",
+                HTTP_STRIPE_SIGNATURE="dummy",
+            )
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("refund needed", logs.output[0])
+        order.refresh_from_db()
+        self.assertEqual(order.status, "CANCELLED")
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 5)
+
+
+class CheckoutThrottleTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="buyer", password="123456")
+        self.product = Product.objects.create(
+            name="Hot Product", price=10, stock=100, slug="hot-product"
+        )
+        self.client.force_authenticate(self.user)
+
+    @override_settings(
+        REST_FRAMEWORK={
+            "DEFAULT_THROTTLE_RATES": {"cart_user": "2/min", "cart_ip": "100/min"}
+        }
+    )
+    def test_add_to_cart_is_throttled_per_user(self):
+        for _ in range(2):
+            resp = self.client.post(
+                "/api/cart/add/", {"product_id": self.product.id, "quantity": 1}
+            )
+            self.assertEqual(resp.status_code, 200)
+
+        with self.assertNumQueries(0):
+            resp = self.client.post(
+                "/api/cart/add/", {"product_id": self.product.id, "quantity": 1}
+            )
+        self.assertEqual(resp.status_code, 429)
+        self.assertIn("Retry-After", resp)
+
+        # Another user still has a full bucket
+        other = User.objects.create_user(username="other", password="123456")
+        self.client.force_authenticate(other)
+        resp = self.client.post(
+            "/api/cart/add/", {"product_id": self.product.id, "quantity": 1}
+        )
+        self.assertEqual(resp.status_code, 200)
+
+    @override_settings(
+        REST_FRAMEWORK={
+            "DEFAULT_THROTTLE_RATES": {"checkout_user": "100/min", "checkout_ip": "1/min"}
+        }
+    )
+    def test_create_order_is_throttled_per_ip(self):
+        self.client.post("/api/cart/add/", {"product_id": self.product.id})
+        first = self.client.post(
+            "/api/my/orders/create_order/", {"shipping_address": "1 St"}, format="json"
+        )
+        self.assertEqual(first.status_code, 201)
+
+        second = self.client.post(
+            "/api/my/orders/create_order/", {"shipping_address": "1 St"}, format="json"
+        )
+        self.assertEqual(second.status_code, 429)
+
+
+DELIVERED = []
+
+
+def record_handler(topic, payload):
+    DELIVERED.append((topic, payload["order_id"]))
+
+
+def failing_handler(topic, payload):
+    raise RuntimeError("ERP is down")
+
+
+class OutboxTests(APITestCase):
+    def setUp(self):
+        DELIVERED.clear()
+        self.user = User.objects.create_user(username="user", password="123456")
+        self.admin = User.objects.create_user(
+            username="admin", password="admin123", is_staff=True
+        )
+        self.product = Product.objects.create(
+            name="Outbox Product", price=10, stock=5, slug="outbox-product"
+        )
+        self.order = Order.objects.create(
+            user=self.user, total_amount=10, shipping_address="1 St"
+        )
+        OrderItem.objects.create(
+            order=self.order, product=self.product, quantity=1, unit_price=10
+        )
+
+    def test_status_change_is_recorded_in_outbox(self):
+        self.client.force_authenticate(self.admin)
+        self.client.post(
+            f"/api/admin/orders/{self.order.id}/set-status/", {"status": "PAID"}
+        )
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.topic, "order.paid")
+        self.assertEqual(message.payload["old_status"], "PENDING")
+
+    def test_failed_status_change_records_nothing(self):
+        self.product.stock = 0
+        self.product.save()
+        self.client.force_authenticate(self.admin)
+        resp = self.client.post(
+            f"/api/admin/orders/{self.order.id}/set-status/", {"status": "PAID"}
+        )
+        self.assertEqual(resp.status_code, 400)
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    @override_settings(OUTBOX_HANDLERS={"order.paid": ["orders.tests.record_handler"]})
+    def test_dispatch_delivers_messages(self):
+        self.client.force_authenticate(self.admin)
+        self.client.post(
+            f"/api/admin/orders/{self.order.id}/set-status/", {"status": "PAID"}
+        )
+
+        self.assertEqual(dispatch_batch(), 1)
+        self.assertEqual(DELIVERED, [("order.paid", self.order.id)])
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.status, "DONE")
+        self.assertIsNotNone(message.dispatched_at)
+        self.assertEqual(dispatch_batch(), 0)
+
+    @override_settings(
+        OUTBOX_HANDLERS={"*": ["orders.tests.failing_handler"]}, OUTBOX_MAX_ATTEMPTS=2
+    )
+    def test_dispatch_retries_with_backoff_then_fails(self):
+        message = OutboxMessage.objects.create(topic="order.paid", payload={"order_id": 1})
+
+        with self.assertLogs("orders.outbox", "ERROR"):
+            dispatch_batch()
+        message.refresh_from_db()
+        self.assertEqual(message.status, "PENDING")
+        self.assertEqual(message.attempts, 1)
+        self.assertIn("ERP is down", message.last_error)
+        # Not due again until the backoff elapses
+        self.assertEqual(dispatch_batch(), 0)
+
+        OutboxMessage.objects.update(available_at=message.created_at)
+        with self.assertLogs("orders.outbox", "ERROR"):
+            dispatch_batch()
+        message.refresh_from_db()
+        self.assertEqual(message.status, "FAILED")
+
+
+class PaymentsGatewayTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="payer", password="123456")
+        self.product = Product.objects.create(
+            name="Gateway Product", price=25, stock=5, slug="gateway-product"
+        )
+        self.order = Order.objects.create(
+            user=self.user, total_amount=50, shipping_address="1 St"
+        )
+        OrderItem.objects.create(
+            order=self.order, product=self.product, quantity=2, unit_price=25
+        )
+        self.client.force_authenticate(self.user)
+
+    @override_settings(
+        STRIPE_SECRET_KEY="sk_test_dummy",
+        STRIPE_BREAKER_FAILURE_THRESHOLD=2,
+        STRIPE_BREAKER_RESET_SECONDS=60,
+    )
+    def test_circuit_opens_after_repeated_failures(self):
+        gateway = StripeGateway()
+        error = stripe.error.APIConnectionError("connection refused")
+
+        with patch("orders.views.gateway", gateway), patch(
+            "orders.payments.stripe.checkout.Session.create", side_effect=error
+        ) as mock_create:
+            for _ in range(3):
+                resp = self.client.post(f"/api/my/orders/{self.order.id}/pay/")
+                self.assertEqual(resp.status_code, 503)
+
+        # The third call failed fast without reaching Stripe
+        self.assertEqual(mock_create.call_count, 2)
+
+    @unittest.skipIf(not hasattr(stripe, "RequestsClient"), "stripe not installed")
+    def test_pay_and_webhook_against_fake_stripe(self):
+        server = FakeStripeServer(
+            ("127.0.0.1", 0),
+            webhook_url="http://127.0.0.1:1/unused",
+            webhook_secret="whsec_fake",
+            latency=0,
+            auto_complete=False,
+        )
+        server.verbose = False
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.addCleanup(setattr, stripe, "api_base", stripe.api_base)
+        self.addCleanup(setattr, stripe, "default_http_client", stripe.default_http_client)
+
+        host, port = server.server_address[:2]
+        with override_settings(
+            STRIPE_SECRET_KEY="sk_test_dummy",
+            STRIPE_API_BASE=f"http://{host}:{port}",
+            STRIPE_WEBHOOK_SECRET="whsec_fake",
+        ), patch("orders.views.gateway", StripeGateway()):
+            resp = self.client.post(f"/api/my/orders/{self.order.id}/pay/")
+            self.assertEqual(resp.status_code, 200)
+            session_id = resp.data["session_id"]
+            self.assertEqual(
+                server.sessions[session_id]["metadata"], {"order_id": str(self.order.id)}
+            )
+
+            payload = json.dumps(
+                {
+                    "id": "evt_fake",
+                    "object": "event",
+                    "type": "checkout.session.completed",
+                    "data": {"object": server.sessions[session_id]},
+                }
+            ).encode()
+            resp = self.client.post(
+                "/api/payments/stripe/webhook/",
+                data=payload,
+                content_type="application/json",
+                HTTP_STRIPE_SIGNATURE=sign_payload(payload, "whsec_fake"),
+            )
+
+        self.assertEqual(resp.status_code, 200)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, "PAID")
+        self.assertEqual(self.order.stripe_session_id, session_id)
+
+
+class ExpirePendingOrdersTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="idle", password="123456")
+
+    def make_order(self, status="PENDING", age_hours=0):
+        order = Order.objects.create(
+            user=self.user, status=status, total_amount=10, shipping_address="1 St"
+        )
+        Order.objects.filter(id=order.id).update(
+            created_at=timezone.now() - timedelta(hours=age_hours)
+        )
+        return order
+
+    def test_cancels_only_stale_pending_orders_in_chunks(self):
+        stale = [self.make_order(age_hours=72) for _ in range(5)]
+        fresh = self.make_order(age_hours=1)
+        paid = self.make_order(status="PAID", age_hours=72)
+
+        out = StringIO()
+        call_command(
+            "expire_pending_orders", "--older-than=48", "--chunk-size=2", "--pause=0",
+            stdout=out,
+        )
+
+        self.assertIn("Cancelled 5 order(s) in 3 chunk(s)", out.getvalue())
+        self.assertEqual(
+            Order.objects.filter(id__in=[o.id for o in stale], status="CANCELLED").count(),
+            5,
+        )
+        fresh.refresh_from_db()
+        paid.refresh_from_db()
+        self.assertEqual(fresh.status, "PENDING")
+        self.assertEqual(paid.status, "PAID")
+        self.assertEqual(OutboxMessage.objects.filter(topic="order.cancelled").count(), 5)
+
+    def test_ttl_cannot_undercut_checkout_sessions(self):
+        with self.assertRaises(CommandError):
+            call_command("expire_pending_orders", "--older-than=1", stdout=StringIO())
+
+    def test_dry_run_changes_nothing(self):
+        order = self.make_order(age_hours=72)
+        out = StringIO()
+        call_command("expire_pending_orders", "--dry-run", stdout=out)
+        self.assertIn("1 order(s) would be cancelled", out.getvalue())
+        order.refresh_from_db()
+        self.assertEqual(order.status, "PENDING")
+
+
+class ArchiveOrdersTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="old", password="123456")
+        self.admin = User.objects.create_user(
+            username="admin", password="admin123", is_staff=True
+        )
+        self.product = Product.objects.create(
+            name="Archive Product", price=10, stock=5, slug="archive-product"
+        )
+
+    def make_order(self, status, age_days):
+        order = Order.objects.create(
+            user=self.user, status=status, total_amount=10, shipping_address="1 St"
+        )
+        item = OrderItem(order=order, product=self.product, quantity=1, unit_price=10)
+        item.snapshot_product(self.product)
+        item.save()
+        Order.objects.filter(id=order.id).update(
+            created_at=timezone.now() - timedelta(days=age_days)
+        )
+        return order
+
+    def test_archive_moves_only_old_closed_orders(self):
+        delivered = self.make_order("DELIVERED", 400)
+        cancelled = self.make_order("CANCELLED", 400)
+        paid = self.make_order("PAID", 400)
+        recent = self.make_order("DELIVERED", 10)
+
+        call_command("archive_orders", "--months=12", "--pause=0", stdout=StringIO())
+
+        self.assertEqual(
+            set(ArchivedOrder.objects.values_list("id", flat=True)),
+            {delivered.id, cancelled.id},
+        )
+        self.assertEqual(
+            set(Order.objects.values_list("id", flat=True)), {paid.id, recent.id}
+        )
+        archived = ArchivedOrder.objects.get(id=delivered.id)
+        self.assertEqual(
+            archived.items,
+            [
+                {
+                    "product_id": self.product.id,
+                    "quantity": 1,
+                    "unit_price": "10.00",
+                    "product_name": "Archive Product",
+                    "product_sku": self.product.sku,
+                    "product_slug": "archive-product",
+                    "product_image": "",
+                }
+            ],
+        )
+
+    def test_archived_items_keep_the_purchased_product(self):
+        old = self.make_order("DELIVERED", 400)
+        call_command("archive_orders", "--months=12", "--pause=0", stdout=StringIO())
+        self.product.delete()
+
+        self.client.force_authenticate(self.user)
+        resp = self.client.get(f"/api/my/orders/{old.id}/")
+        self.assertEqual(resp.status_code, 200)
+        item = resp.data["items"][0]
+        self.assertEqual(item["product"]["name"], "Archive Product")
+        self.assertEqual(item["product"]["slug"], "archive-product")
+        self.assertEqual((item["quantity"], item["unit_price"]), (1, "10.00"))
+
+        # Orders archived before the snapshot keys get them from the catalog
+        lamp = Product.objects.create(name="Lamp", price=5, stock=1, slug="lamp")
+        ArchivedOrder.objects.filter(id=old.id).update(
+            items=[{"product_id": lamp.id, "quantity": 2, "unit_price": "5.00"}]
+        )
+        out = StringIO()
+        call_command("backfill_order_item_snapshots", stdout=out)
+        self.assertIn("and 1 archived order(s)", out.getvalue())
+        resp = self.client.get(f"/api/my/orders/{old.id}/")
+        self.assertEqual(resp.data["items"][0]["product"]["name"], "Lamp")
+
+    def test_listing_includes_archive(self):
+        old = self.make_order("DELIVERED", 400)
+        recent = self.make_order("DELIVERED", 10)
+        call_command("archive_orders", "--months=12", "--pause=0", stdout=StringIO())
+
+        self.client.force_authenticate(self.admin)
+        resp = self.client.get("/api/admin/orders/")
+        self.assertEqual([o["id"] for o in resp.data["results"]], [recent.id])
+
+        since = (timezone.now() - timedelta(days=500)).date().isoformat()
+        resp = self.client.get(f"/api/admin/orders/?date_after={since}")
+        self.assertEqual(resp.data["count"], 2)
+        self.assertEqual([o["id"] for o in resp.data["results"]], [recent.id, old.id])
+        self.assertTrue(resp.data["results"][1]["archived"])
+
+        self.client.force_authenticate(self.user)
+        # A customer's history includes archived orders by default
+        resp = self.client.get("/api/my/orders/")
+        self.assertEqual([o["id"] for o in resp.data["results"]], [recent.id, old.id])
+        recently = (timezone.now() - timedelta(days=30)).date().isoformat()
+        resp = self.client.get(f"/api/my/orders/?date_after={recently}")
+        self.assertEqual([o["id"] for o in resp.data["results"]], [recent.id])
+
+        resp = self.client.get(f"/api/my/orders/?date_after={since}&status=DELIVERED")
+        self.assertEqual(resp.data["count"], 2)
+        self.assertEqual(
+            [(o["item_count"], o.get("archived")) for o in resp.data["results"]],
+            [(1, None), (1, True)],
+        )
+        resp = self.client.get(f"/api/my/orders/{old.id}/")
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.data["archived"])
+
+
+class CartSummaryTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="badge", password="123456")
+        self.tent = Product.objects.create(name="Tent", price=100, stock=10, slug="tent")
+        self.lamp = Product.objects.create(name="Lamp", price=20, stock=10, slug="lamp")
+        self.client.force_authenticate(self.user)
+
+    def summary(self):
+        resp = self.client.get("/api/cart/summary/")
+        self.assertEqual(resp.status_code, 200)
+        return resp.data
+
+    def change(self, method, url, data):
+        # Summaries are dropped when the cart change commits
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = getattr(self.client, method)(url, data, format="json")
+        self.assertIn(resp.status_code, (200, 201))
+
+    def add(self, product, quantity):
+        self.change(
+            "post", "/api/cart/add/", {"product_id": product.id, "quantity": quantity}
+        )
+
+    def checkout(self):
+        self.change("post", "/api/my/orders/create_order/", {"shipping_address": "1 St"})
+
+    def test_summary_is_one_query_and_cached(self):
+        self.assertEqual(
+            self.summary(), {"item_count": 0, "quantity": 0, "subtotal": "0.00"}
+        )
+        self.add(self.tent, 2)
+        self.add(self.lamp, 1)
+
+        with self.assertNumQueries(1):
+            data = self.summary()
+        self.assertEqual(data, {"item_count": 2, "quantity": 3, "subtotal": "220.00"})
+        with self.assertNumQueries(0):
+            self.summary()
+
+    def test_cart_changes_and_prices_invalidate_the_summary(self):
+        self.add(self.tent, 2)
+        self.assertEqual(self.summary()["quantity"], 2)
+
+        item = CartItem.objects.get(cart__user=self.user)
+        self.change("patch", f"/api/cart/{item.id}/update/", {"quantity": 5})
+        self.assertEqual(self.summary()["subtotal"], "500.00")
+
+        self.tent.price = 90
+        self.tent.save()
+        self.assertEqual(self.summary()["subtotal"], "450.00")
+
+        self.checkout()
+        self.assertEqual(self.summary()["item_count"], 0)
+
+        with override_settings(CHECKOUT_STRATEGY="optimistic"):
+            self.add(self.lamp, 1)
+            self.assertEqual(self.summary()["item_count"], 1)
+            self.checkout()
+        self.assertEqual(self.summary()["item_count"], 0)
+
+    def test_cart_products_come_from_the_fragment_cache(self):
+        self.add(self.tent, 2)
+        self.add(self.lamp, 1)
+        # Cart, its items and the products missing from the cache
+        with self.assertNumQueries(3):
+            resp = self.client.get("/api/cart/")
+        products = {row["product"]["name"]: row["product"] for row in resp.data["items"]}
+        self.assertEqual(products["Tent"]["price"], "100.00")
+        with self.assertNumQueries(2):
+            self.client.get("/api/cart/")
+
+        self.tent.price = 90
+        self.tent.save()
+        resp = self.client.get("/api/cart/")
+        products = {row["product"]["name"]: row["product"] for row in resp.data["items"]}
+        self.assertEqual(products["Tent"]["price"], "90.00")
+
+
+class BulkOrderStatusTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="bulk", password="123456")
+        self.admin = User.objects.create_user(
+            username="admin", password="admin123", is_staff=True
+        )
+        self.tent = Product.objects.create(name="Tent", price=10, stock=5, slug="tent")
+        self.lamp = Product.objects.create(name="Lamp", price=5, stock=50, slug="lamp")
+        self.client.force_authenticate(self.admin)
+
+    def make_order(self, status="PENDING", tents=2):
+        order = Order.objects.create(
+            user=self.user, status=status, total_amount=10, shipping_address="1 St"
+        )
+        OrderItem.objects.create(order=order, product=self.tent, quantity=tents, unit_price=10)
+        OrderItem.objects.create(order=order, product=self.lamp, quantity=1, unit_price=5)
+        return order
+
+    def bulk(self, **body):
+        resp = self.client.post(
+            "/api/admin/orders/bulk-set-status/", body, format="json"
+        )
+        return resp
+
+    @override_settings(ORDER_BULK_STATUS_CHUNK_SIZE=2)
+    def test_pay_and_cancel_in_bulk(self):
+        orders = [self.make_order() for _ in range(3)]
+        delivered = self.make_order("DELIVERED")
+
+        resp = self.bulk(status="PAID", ids=[o.id for o in orders] + [delivered.id, 999])
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data["counts"], {"updated": 2, "failed": 1, "skipped": 2})
+        results = {row["id"]: row["result"] for row in resp.data["orders"]}
+        self.assertEqual(results[orders[2].id], "failed")
+        self.assertEqual(results[delivered.id], "skipped")
+
+        self.tent.refresh_from_db()
+        self.lamp.refresh_from_db()
+        self.assertEqual((self.tent.stock, self.lamp.stock), (1, 48))
+        paid = Order.objects.filter(status="PAID")
+        self.assertEqual(paid.count(), 2)
+        self.assertFalse(paid.filter(paid_at__isnull=True).exists())
+        self.assertEqual(OutboxMessage.objects.filter(topic="order.paid").count(), 2)
+
+        resp = self.bulk(status="CANCELLED", filter={"status": "PAID"})
+        self.assertEqual(resp.data["counts"], {"updated": 2})
+        self.tent.refresh_from_db()
+        self.assertEqual(self.tent.stock, 5)
+
+    def test_stock_is_updated_once_per_product(self):
+        orders = [self.make_order(tents=1) for _ in range(5)]
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.bulk(status="PAID", ids=[o.id for o in orders])
+        self.assertEqual(resp.data["counts"], {"updated": 5})
+        stock_updates = [
+            q for q in queries if q["sql"].startswith('UPDATE "products_product"')
+        ]
+        self.assertEqual(len(stock_updates), 2)
+        self.tent.refresh_from_db()
+        self.assertEqual(self.tent.stock, 0)
+
+    @override_settings(ORDER_BULK_STATUS_MAX=2)
+    def test_invalid_requests(self):
+        for body in [
+            {"status": "LOST", "ids": [1]},
+            {"status": "PAID"},
+            {"status": "PAID", "filter": {}},
+            {"status": "PAID", "ids": ["1"]},
+            {"status": "PAID", "ids": [1, 2, 3]},
+            {"status": "PAID", "filter": {"date_after": "yesterday"}},
+        ]:
+            self.assertEqual(self.bulk(**body).status_code, 400, body)
+        for _ in range(3):
+            self.make_order()
+        self.assertEqual(
+            self.bulk(status="PAID", filter={"status": "PENDING"}).status_code, 400
+        )
+
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.bulk(status="PAID", ids=[1]).status_code, 403)
+
+
+class OrderHistoryTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="history", password="123456")
+        self.products = [
+            Product.objects.create(
+                name=f"History {index}", price=10, stock=5, slug=f"history-{index}"
+            )
+            for index in range(5)
+        ]
+        self.client.force_authenticate(self.user)
+
+    def make_order(self, lines):
+        order = Order.objects.create(
+            user=self.user, status="PAID", total_amount=10 * lines, shipping_address="1 St"
+        )
+        for product in self.products[:lines]:
+            item = OrderItem(order=order, product=product, quantity=2, unit_price=10)
+            item.snapshot_product(product)
+            item.save()
+        return order
+
+    def test_list_returns_summaries_with_constant_queries(self):
+        self.make_order(1)
+        # Archive horizon (then cached), pagination count + page
+        with self.assertNumQueries(3):
+            resp = self.client.get("/api/my/orders/")
+        big = self.make_order(5)
+        self.make_order(3)
+        with self.assertNumQueries(2):
+            resp = self.client.get("/api/my/orders/")
+
+        self.assertEqual(resp.data["count"], 3)
+        summary = next(o for o in resp.data["results"] if o["id"] == big.id)
+        self.assertEqual(summary["item_count"], 5)
+        self.assertEqual(
+            set(summary),
+            {"id", "status", "total_amount", "created_at", "paid_at", "item_count"},
+        )
+
+    def test_detail_returns_items(self):
+        order = self.make_order(3)
+        resp = self.client.get(f"/api/my/orders/{order.id}/")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.data["items"]), 3)
+        self.assertEqual(resp.data["items"][0]["product"]["name"], "History 0")
+
+    def test_items_keep_the_product_as_purchased(self):
+        product = self.products[0]
+        Product.objects.filter(pk=product.pk).update(sku="H-0")
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=product, quantity=1)
+        resp = self.client.post(
+            "/api/my/orders/create_order/", {"shipping_address": "1 St"}, format="json"
+        )
+        self.assertEqual(resp.status_code, 201)
+        order_id = resp.data["id"]
+
+        Product.objects.filter(pk=product.pk).update(name="Renamed", slug="renamed")
+        # The order and its items: no product or category query
+        with self.assertNumQueries(2):
+            resp = self.client.get(f"/api/my/orders/{order_id}/")
+        self.assertEqual(
+            resp.data["items"][0]["product"],
+            {
+                "id": product.id,
+                "name": "History 0",
+                "sku": "H-0",
+                "slug": "history-0",
+                "image": None,
+            },
+        )
+
+    def test_backfill_copies_current_product_details(self):
+        order = Order.objects.create(
+            user=self.user, status="PAID", total_amount=10, shipping_address="1 St"
+        )
+        item = OrderItem.objects.create(
+            order=order, product=self.products[1], quantity=1, unit_price=10
+        )
+        out = StringIO()
+        call_command("backfill_order_item_snapshots", "--chunk-size=1", stdout=out)
+        self.assertIn("Backfilled 1 order item(s)", out.getvalue())
+        item.refresh_from_db()
+        self.assertEqual(
+            (item.product_name, item.product_slug), ("History 1", "history-1")
+        )
+
+
+class SalesReportTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="shopper", password="123456")
+        self.admin = User.objects.create_user(
+            username="admin", password="admin123", is_staff=True
+        )
+        self.product = Product.objects.create(
+            name="Report Product", price=10, stock=100, slug="report-product"
+        )
+        self.client.force_authenticate(self.admin)
+
+    def make_order(self, status, days_ago, quantity=1, total=10):
+        order = Order.objects.create(
+            user=self.user, status=status, total_amount=total, shipping_address="1 St"
+        )
+        OrderItem.objects.create(
+            order=order, product=self.product, quantity=quantity, unit_price=10
+        )
+        Order.objects.filter(id=order.id).update(
+            created_at=timezone.now() - timedelta(days=days_ago)
+        )
+        return order
+
+    def test_monthly_buckets_with_units_and_average(self):
+        self.make_order("PAID", 0, quantity=2, total=20)
+        self.make_order("DELIVERED", 0, quantity=3, total=40)
+        self.make_order("PENDING", 0, quantity=5, total=50)
+
+        today = timezone.localdate()
+        resp = self.client.get(
+            f"/api/admin/orders/report/?bucket=month&from={today}&to={today}"
+        )
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.data["sales"]), 1)
+        bucket = resp.data["sales"][0]
+        self.assertEqual(bucket["period"], today.replace(day=1))
+        self.assertEqual(bucket["orders"], 2)
+        self.assertEqual(bucket["revenue"], 60)
+        self.assertEqual(bucket["units_sold"], 5)
+        self.assertEqual(str(bucket["average_order_value"]), "30.00")
+
+    def test_closed_buckets_are_cached(self):
+        self.make_order("PAID", 3)
+        url = "/api/admin/orders/report/?bucket=day"
+        first = self.client.get(url)
+        self.assertEqual(sum(b["orders"] for b in first.data["sales"]), 1)
+        self.assertEqual(len(first.data["revenue_by_day"]), 1)
+
+        # A new order in a closed bucket is not picked up from the cache...
+        Order.objects.create(
+            user=self.user, status="PAID", total_amount=10, shipping_address="1 St"
+        )
+        Order.objects.filter(status="PAID").update(
+            created_at=timezone.now() - timedelta(days=3)
+        )
+        second = self.client.get(url)
+        self.assertEqual(sum(b["orders"] for b in second.data["sales"]), 1)
+
+        # ...but refunding an old paid order retires the cached buckets
+        old = Order.objects.filter(status="PAID").first()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                f"/api/admin/orders/{old.id}/set-status/", {"status": "CANCELLED"}
+            )
+        third = self.client.get(url)
+        self.assertEqual(sum(b["orders"] for b in third.data["sales"]), 1)
+        self.assertEqual(len(third.data["sales"]), 30)
+
+    def test_edge_buckets_are_clamped_to_the_range(self):
+        month_start = timezone.localdate().replace(day=1)
+        first = (month_start - timedelta(days=1)).replace(day=1)
+        for day in (2, 20):
+            order = self.make_order("PAID", 0)
+            Order.objects.filter(id=order.id).update(
+                created_at=timezone.make_aware(
+                    datetime.combine(first.replace(day=day), time(12))
+                )
+            )
+        url = "/api/admin/orders/report/?bucket=month"
+        resp = self.client.get(f"{url}&from={first}&to={first.replace(day=10)}")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.data["sales"]), 1)
+        self.assertEqual(resp.data["sales"][0]["period"], first)
+        self.assertEqual(resp.data["sales"][0]["orders"], 1)
+
+        # The partial bucket was not cached for the whole month
+        to = month_start - timedelta(days=1)
+        resp = self.client.get(f"{url}&from={first}&to={to}")
+        self.assertEqual(resp.data["sales"][0]["orders"], 2)
+        resp = self.client.get(f"{url}&from={first.replace(day=15)}&to={to}")
+        self.assertEqual(resp.data["sales"][0]["orders"], 1)
+
+    def test_archived_orders_are_counted(self):
+        self.make_order("DELIVERED", 400, quantity=3, total=30)
+        self.make_order("CANCELLED", 400)
+        self.make_order("PAID", 0, quantity=1, total=10)
+        call_command("archive_orders", "--months=12", "--pause=0", stdout=StringIO())
+        self.assertEqual(ArchivedOrder.objects.count(), 2)
+
+        since = (timezone.localdate() - timedelta(days=420)).isoformat()
+        resp = self.client.get(f"/api/admin/orders/report/?bucket=month&from={since}")
+        self.assertEqual(resp.status_code, 200)
+        sold = [row for row in resp.data["sales"] if row["orders"]]
+        self.assertEqual(
+            [(row["orders"], row["revenue"], row["units_sold"]) for row in sold],
+            [(1, 30, 3), (1, 10, 1)],
+        )
+        self.assertEqual(resp.data["total_orders"], 3)
+        self.assertEqual(resp.data["total_revenue"], 50)
+        self.assertEqual(
+            [(row["status"], row["count"]) for row in resp.data["orders_by_status"]],
+            [("CANCELLED", 1), ("DELIVERED", 1), ("PAID", 1)],
+        )
+
+    def test_invalid_params(self):
+        resp = self.client.get("/api/admin/orders/report/?bucket=year")
+        self.assertEqual(resp.status_code, 400)
+        resp = self.client.get("/api/admin/orders/report/?from=2025-02-01&to=2025-01-01")
+        self.assertEqual(resp.status_code, 400)
+        resp = self.client.get("/api/admin/orders/report/?bucket=day&from=2000-01-01")
+        self.assertEqual(resp.status_code, 400)
+
+
+class UserOrderStatsTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="shopper", password="123456")
+        self.admin = User.objects.create_user(
+            username="admin", password="admin123", is_staff=True, is_superuser=True
+        )
+        self.product = Product.objects.create(
+            name="Stats", price=10, stock=100, slug="stats"
+        )
+        self.cart = Cart.objects.create(user=self.user)
+
+    def place_order(self, quantity):
+        CartItem.objects.create(cart=self.cart, product=self.product, quantity=quantity)
+        self.client.force_authenticate(self.user)
+        resp = self.client.post(
+            "/api/my/orders/create_order/", {"shipping_address": "1 St"}, format="json"
+        )
+        self.assertEqual(resp.status_code, 201)
+        dispatch_batch()
+        return resp.data["id"]
+
+    def set_status(self, order_id, status):
+        self.client.force_authenticate(self.admin)
+        resp = self.client.post(
+            f"/api/admin/orders/{order_id}/set-status/", {"status": status}
+        )
+        self.assertEqual(resp.status_code, 200)
+        dispatch_batch()
+
+    def test_orders_and_status_changes_update_stats(self):
+        first = self.place_order(3)
+        second = self.place_order(2)
+        stats = UserOrderStats.objects.get(user=self.user)
+        self.assertEqual((stats.orders_count, stats.sold_orders_count), (2, 0))
+        self.assertEqual(stats.lifetime_revenue, 0)
+        self.assertEqual(
+            stats.last_order_at, Order.objects.get(pk=second).created_at
+        )
+
+        self.set_status(first, "PAID")
+        self.set_status(second, "PAID")
+        self.set_status(second, "SHIPPED")
+        self.set_status(first, "CANCELLED")
+        stats.refresh_from_db()
+        self.assertEqual((stats.orders_count, stats.sold_orders_count), (2, 1))
+        self.assertEqual(stats.lifetime_revenue, 20)
+
+        self.client.force_authenticate(self.user)
+        resp = self.client.get("/api/auth/me/")
+        self.assertEqual(resp.data["order_stats"]["orders_count"], 2)
+        self.assertEqual(resp.data["order_stats"]["lifetime_revenue"], "20.00")
+
+        # A full rebuild agrees with the incremental figures
+        UserOrderStats.objects.all().delete()
+        call_command("rebuild_user_order_stats", stdout=StringIO())
+        rebuilt = UserOrderStats.objects.get(user=self.user)
+        self.assertEqual(
+            (rebuilt.orders_count, rebuilt.sold_orders_count, rebuilt.lifetime_revenue),
+            (2, 1, 20),
+        )
+        self.assertEqual(rebuilt.last_order_at, stats.last_order_at)
+
+    def test_users_without_orders_and_admin_filters(self):
+        self.client.force_authenticate(self.admin)
+        resp = self.client.get("/api/auth/me/")
+        self.assertEqual(resp.data["order_stats"]["orders_count"], 0)
+
+        self.set_status(self.place_order(1), "PAID")
+        self.client.force_login(self.admin)
+        resp = self.client.get("/admin/accounts/user/", {"orders_count": "1"})
+        self.assertEqual(list(resp.context["cl"].result_list), [self.user])
+        resp = self.client.get("/admin/accounts/user/", {"orders_count": "0"})
+        self.assertEqual(list(resp.context["cl"].result_list), [self.admin])
+        resp = self.client.get(
+            "/admin/orders/order/", {"customer_lifetime_revenue": "< 100"}
+        )
+        self.assertEqual(resp.context["cl"].result_count, 1)
+
+
+class ProductSalesStatsTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="shopper", password="123456")
+        self.admin = User.objects.create_user(
+            username="admin", password="admin123", is_staff=True
+        )
+        self.hit = Product.objects.create(name="Hit", price=10, stock=100, slug="hit")
+        self.flop = Product.objects.create(name="Flop", price=5, stock=100, slug="flop")
+        self.client.force_authenticate(self.admin)
+
+    def make_order(self, quantity, product=None):
+        order = Order.objects.create(
+            user=self.user, total_amount=10 * quantity, shipping_address="1 St"
+        )
+        OrderItem.objects.create(
+            order=order, product=product or self.hit, quantity=quantity, unit_price=10
+        )
+        return order
+
+    def set_status(self, order, status):
+        resp = self.client.post(
+            f"/api/admin/orders/{order.id}/set-status/", {"status": status}
+        )
+        self.assertEqual(resp.status_code, 200)
+        dispatch_batch()
+
+    def test_paid_and_refunded_orders_update_stats(self):
+        first = self.make_order(3)
+        second = self.make_order(2)
+        self.set_status(first, "PAID")
+        self.set_status(second, "PAID")
+        # Leaving and re-entering the sold statuses is not counted twice
+        self.set_status(second, "SHIPPED")
+
+        stats = ProductSalesStats.objects.get(product=self.hit)
+        self.assertEqual(stats.units_sold, 5)
+        self.assertEqual(stats.revenue, 50)
+        self.assertEqual(stats.units_7d, 5)
+        self.assertEqual(stats.units_30d, 5)
+        self.assertIsNotNone(stats.last_sold_at)
+
+        self.set_status(first, "CANCELLED")
+        stats.refresh_from_db()
+        self.assertEqual(stats.units_sold, 2)
+        self.assertEqual(stats.revenue_30d, 20)
+
+        # A full rebuild agrees with the incremental figures
+        call_command("refresh_sales_stats", "--rebuild", stdout=StringIO())
+        rebuilt = ProductSalesStats.objects.get(product=self.hit)
+        self.assertEqual(rebuilt.units_sold, 2)
+        self.assertEqual(rebuilt.units_7d, 2)
+
+    def test_windows_slide_without_sales(self):
+        self.set_status(self.make_order(4), "PAID")
+        ProductSalesDay.objects.update(day=timezone.localdate() - timedelta(days=10))
+
+        self.assertEqual(refresh_windows(), 1)
+        stats = ProductSalesStats.objects.get(product=self.hit)
+        self.assertEqual(stats.units_7d, 0)
+        self.assertEqual(stats.units_30d, 4)
+        self.assertEqual(stats.units_sold, 4)
+
+    def test_product_list_orders_and_filters_by_sales(self):
+        self.set_status(self.make_order(1, product=self.flop), "PAID")
+        self.set_status(self.make_order(6), "PAID")
+
+        resp = self.client.get("/api/products/?ordering=-units_sold")
+        results = resp.data["results"]
+        self.assertEqual([p["slug"] for p in results], ["hit", "flop"])
+        self.assertEqual(results[0]["units_sold"], 6)
+        self.assertEqual(str(results[0]["sales_revenue"]), "60.00")
+
+        # Revenue is for admins only, unit counts are public
+        self.client.force_authenticate(None)
+        resp = self.client.get("/api/products/?ordering=-sales_revenue")
+        results = resp.data["results"]
+        self.assertEqual([p["slug"] for p in results], ["flop", "hit"])
+        self.assertEqual(results[1]["units_sold"], 6)
+        self.assertFalse({"sales_revenue", "revenue_7d", "revenue_30d"} & set(results[1]))
+        self.client.force_authenticate(self.admin)
+
+        resp = self.client.get("/api/products/?min_units_30d=2")
+        self.assertEqual([p["slug"] for p in resp.data["results"]], ["hit"])
+
+        # Never sold products report zeros
+        Product.objects.create(name="New", price=1, stock=1, slug="new")
+        resp = self.client.get("/api/products/?ordering=units_sold")
+        self.assertEqual(resp.data["results"][0]["slug"], "new")
+        self.assertEqual(resp.data["results"][0]["units_sold"], 0)
+
+
+class RelatedProductsTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="shopper", password="123456")
+        self.tent, self.stove, self.lamp, self.rope = [
+            Product.objects.create(name=name, price=10, stock=10, slug=name.lower())
+            for name in ("Tent", "Stove", "Lamp", "Rope")
+        ]
+
+    def sell(self, *products, status="PAID", hours_ago=3):
+        order = Order.objects.create(
+            user=self.user,
+            status=status,
+            total_amount=10,
+            shipping_address="1 St",
+            paid_at=timezone.now() - timedelta(hours=hours_ago),
+        )
+        for product in products:
+            OrderItem.objects.create(
+                order=order, product=product, quantity=1, unit_price=10
+            )
+        return order
+
+    def related(self, product):
+        resp = self.client.get(f"/api/products/{product.id}/related/")
+        self.assertEqual(resp.status_code, 200)
+        return [(row["product"]["slug"], row["score"]) for row in resp.data]
+
+    def test_cooccurrence_counts_orders_per_pair(self):
+        counts = cooccurrence([[1, 2, 2], [1, 2, 3], [4]])
+        self.assertEqual(counts[(1, 2)], 2)
+        self.assertEqual(counts[(2, 1)], 2)
+        self.assertEqual(counts[(3, 1)], 1)
+        self.assertNotIn((1, 1), counts)
+        self.assertNotIn((4, 4), counts)
+
+    def test_full_then_incremental_build(self):
+        self.sell(self.tent, self.stove)
+        self.sell(self.tent, self.stove, self.lamp)
+        self.sell(self.tent, self.lamp)
+        self.sell(self.tent, self.rope, status="PENDING")
+        # Paid too recently: left for the next run
+        self.sell(self.tent, self.rope, hours_ago=0)
+
+        call_command("build_related_products", stdout=StringIO())
+        self.assertEqual(self.related(self.tent), [("stove", 2), ("lamp", 2)])
+        self.assertEqual(self.related(self.rope), [])
+
+        # Pretend the first run happened two hours ago
+        RelatedProductsBuild.objects.update(
+            orders_until=timezone.now() - timedelta(hours=2)
+        )
+        self.sell(self.stove, self.lamp, hours_ago=1)
+        Order.objects.filter(paid_at__gt=timezone.now() - timedelta(hours=1)).update(
+            paid_at=timezone.now() - timedelta(hours=1)
+        )
+        call_command("build_related_products", stdout=StringIO())
+
+        self.assertEqual(
+            self.related(self.tent), [("stove", 2), ("lamp", 2), ("rope", 1)]
+        )
+        self.assertEqual(self.related(self.lamp), [("tent", 2), ("stove", 2)])
+        self.assertEqual(RelatedProductsBuild.objects.count(), 2)
+
+        # A full rebuild gives the same result
+        call_command("build_related_products", "--full", stdout=StringIO())
+        self.assertEqual(self.related(self.lamp), [("tent", 2), ("stove", 2)])
+
+    @override_settings(RELATED_PRODUCTS_TOP_K=1)
+    def test_top_k_and_unknown_product(self):
+        self.sell(self.tent, self.stove)
+        self.sell(self.tent, self.stove, self.lamp)
+        call_command("build_related_products", stdout=StringIO())
+
+        self.assertEqual(self.related(self.tent), [("stove", 2)])
+        resp = self.client.get("/api/products/999999/related/")
+        self.assertEqual(resp.status_code, 404)
+        resp = self.client.get("/api/products/abc/related/")
+        self.assertEqual(resp.status_code, 404)
+
+    @unittest.skipUnless(recommendations.sparse, "numpy/scipy not installed")
+    def test_sparse_and_python_counts_match(self):
+        baskets = [[1, 2, 2], [1, 2, 3], [4], [3, 5, 1], [2, 5]]
+        baskets = [sorted(set(basket)) for basket in baskets if len(set(basket)) > 1]
+        self.assertEqual(
+            recommendations._cooccurrence_sparse(baskets),
+            recommendations._cooccurrence_python(baskets),
+        )
+
+
+class CheckoutStrategyTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="shopper", password="123456")
+        self.product = Product.objects.create(
+            name="Lamp", price=10, stock=5, slug="lamp"
+        )
+        self.client.force_authenticate(self.user)
+        self.client.post(
+            "/api/cart/add/", {"product_id": self.product.id, "quantity": 2}, format="json"
+        )
+
+    def checkout(self):
+        return self.client.post(
+            "/api/my/orders/create_order/", {"shipping_address": "1 St"}, format="json"
+        )
+
+    @override_settings(CHECKOUT_STRATEGY="optimistic")
+    def test_optimistic_checkout(self):
+        version = Cart.objects.get(user=self.user).version
+        resp = self.checkout()
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(str(resp.data["total_amount"]), "20.00")
+
+        cart = Cart.objects.get(user=self.user)
+        self.assertEqual(cart.version, version + 1)
+        self.assertFalse(cart.items.exists())
+        # A second submit finds the cart already converted
+        self.assertEqual(self.checkout().status_code, 400)
+        self.assertEqual(Order.objects.count(), 1)
+
+    @override_settings(CHECKOUT_STRATEGY="optimistic")
+    def test_optimistic_checkout_retries_on_conflict(self):
+        from orders import checkout
+
+        real = checkout.available_stock
+        calls = []
+
+        def concurrent_add(products, lock=False):
+            # The first attempt sees the cart change under its feet
+            if not calls:
+                checkout.touch_cart(Cart.objects.get(user=self.user).pk)
+            calls.append(lock)
+            return real(products, lock=lock)
+
+        with patch.object(checkout, "available_stock", concurrent_add):
+            resp = self.checkout()
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(calls, [False, False])
+        self.assertEqual(Order.objects.count(), 1)
+
+    @override_settings(CHECKOUT_STRATEGY="optimistic", CHECKOUT_RETRY_BACKOFF_SECONDS=0)
+    def test_optimistic_checkout_gives_up(self):
+        from orders import checkout
+
+        real = checkout.available_stock
+
+        def always_changing(products, lock=False):
+            checkout.touch_cart(Cart.objects.get(user=self.user).pk)
+            return real(products, lock=lock)
+
+        with patch.object(checkout, "available_stock", always_changing):
+            resp = self.checkout()
+        self.assertEqual(resp.status_code, 409)
+        self.assertFalse(Order.objects.exists())
+        self.assertTrue(CartItem.objects.filter(cart__user=self.user).exists())
+
+
+class CheckoutStressTests(TransactionTestCase):
+    """
+    Concurrent checkouts of a few hot products with both strategies. Every
+    worker keeps buying until stock runs out; nothing may be oversold.
+    """
+
+    WORKERS = 6
+    ROUNDS = 5
+    STOCK = 6
+
+    def run_strategy(self, strategy):
+        products, user_ids = setup_scenario(self.WORKERS, self.STOCK, hot_products=2)
+        stats = run_workers(strategy, products, user_ids, self.ROUNDS)
+        self.assertEqual(
+            check_invariants(products, self.STOCK, user_ids, stats.counts["added"]),
+            [],
+        )
+        self.assertLessEqual(stats.counts["paid"], 2 * self.STOCK)
+        return stats.counts
+
+    def test_no_oversell_with_either_strategy(self):
+        # The in-memory test database reports contention as "table is
+        # locked" errors, so only the invariants are asserted here
+        pessimistic = self.run_strategy("pessimistic")
+        optimistic = self.run_strategy("optimistic")
+        self.assertGreater(pessimistic["orders"] + optimistic["orders"], 0)
+
+    def test_processes_against_file_database(self):
+        out = StringIO()
+        call_command(
+            "checkout_stress",
+            "--processes",
+            "--immediate",
+            "--workers=3",
+            "--rounds=4",
+            "--stock=5",
+            stdout=out,
+            stderr=StringIO(),
+        )
+        output = out.getvalue()
+        self.assertIn("pessimistic: ", output)
+        self.assertIn("optimistic: ", output)
+        self.assertIn("No invariant violations.", output)
+
+
+class IdempotencyKeyTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="retrier", password="123456")
+        self.product = Product.objects.create(
+            name="Retry Product", price=25, stock=5, slug="retry-product"
+        )
+        self.client.force_authenticate(self.user)
+
+    def add_to_cart(self):
+        self.client.post(
+            "/api/cart/add/", {"product_id": self.product.id, "quantity": 1}, format="json"
+        )
+
+    def create_order(self, key, address="1 St"):
+        return self.client.post(
+            "/api/my/orders/create_order/",
+            {"shipping_address": address},
+            format="json",
+            HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_create_order_retry_replays_first_response(self):
+        self.add_to_cart()
+        first = self.create_order("abc")
+        self.assertEqual(first.status_code, 201)
+
+        # The retry does not check out again (the cart is empty by now)
+        self.add_to_cart()
+        second = self.create_order("abc")
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second["Idempotent-Replayed"], "true")
+        self.assertEqual(Order.objects.count(), 1)
+
+        # Same key, different request
+        third = self.create_order("abc", address="2 St")
+        self.assertEqual(third.status_code, 422)
+
+        # A new key is a new checkout
+        self.assertEqual(self.create_order("def").status_code, 201)
+        self.assertEqual(Order.objects.count(), 2)
+
+    @override_settings(STRIPE_SECRET_KEY="sk_test_dummy")
+    def test_pay_creates_one_session_and_does_not_store_server_errors(self):
+        order = Order.objects.create(
+            user=self.user, total_amount=25, shipping_address="1 St"
+        )
+        OrderItem.objects.create(
+            order=order, product=self.product, quantity=1, unit_price=25
+        )
+        url = f"/api/my/orders/{order.id}/pay/"
+        session = type("Session", (), {"id": "cs_1", "url": "https://pay/cs_1"})
+
+        with patch(
+            "orders.views.gateway.create_checkout_session",
+            side_effect=[PaymentsUnavailable("down"), session, session],
+        ) as create:
+            self.assertEqual(
+                self.client.post(url, HTTP_IDEMPOTENCY_KEY="pay-1").status_code, 503
+            )
+            for _ in range(2):
+                resp = self.client.post(url, HTTP_IDEMPOTENCY_KEY="pay-1")
+                self.assertEqual(resp.status_code, 200)
+        self.assertEqual(create.call_count, 2)
+
+    def in_flight(self, key):
+        """Row left by a first create_order request that is still running."""
+        request = SimpleNamespace(
+            method="POST",
+            path="/api/my/orders/create_order/",
+            data={"shipping_address": "1 St"},
+        )
+        return IdempotencyKey.objects.create(
+            user=self.user,
+            key=key,
+            fingerprint=fingerprint(request),
+            expires_at=timezone.now() + timedelta(minutes=1),
+        )
+
+    def test_duplicate_waits_for_in_flight_request(self):
+        record = self.in_flight("slow")
+
+        def first_request_finishes(seconds):
+            IdempotencyKey.objects.filter(pk=record.pk).update(
+                response_status=201, response_body={"id": 42}
+            )
+
+        with patch("orders.idempotency.time.sleep", side_effect=first_request_finishes):
+            resp = self.create_order("slow")
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(resp.data, {"id": 42})
+        self.assertFalse(Order.objects.exists())
+
+    @override_settings(IDEMPOTENCY_WAIT_SECONDS=0)
+    def test_duplicate_gives_up_while_first_request_runs(self):
+        self.in_flight("stuck")
+        self.assertEqual(self.create_order("stuck").status_code, 409)
+
+    def test_expired_keys_are_purged(self):
+        IdempotencyKey.objects.create(
+            user=self.user,
+            key="old",
+            fingerprint="x",
+            response_status=201,
+            expires_at=timezone.now() - timedelta(seconds=1),
+        )
+        out = StringIO()
+        call_command("purge_idempotency_keys", stdout=out)
+        self.assertIn("Removed 1", out.getvalue())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
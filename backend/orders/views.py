@@ -1,3 +1,5 @@
+import logging
+
 from rest_framework import viewsets, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
@@ -5,44 +7,49 @@ from rest_framework.views import APIView
 
 from django.conf import settings
 from django.db import transaction
-from django.db.models import F, Sum, Count
-from django.db.models.functions import TruncDate
+from django.db.models import Sum, Count, Value, prefetch_related_objects
+from django.http import Http404
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import OrderingFilter
-
-try:  # Stripe is optional; provide placeholder to allow tests without the package installed.
-    import stripe  # type: ignore
-except ImportError:  # pragma: no cover
-    class _StripePlaceholder:
-        class error:
-            class SignatureVerificationError(Exception):
-                ...
-
-        class Webhook:
-            @staticmethod
-            def construct_event(*args, **kwargs):
-                raise ImportError("stripe package not installed")
-
-        class checkout:
-            class Session:
-                @staticmethod
-                def create(*args, **kwargs):
-                    raise ImportError("stripe package not installed")
-
-    stripe = _StripePlaceholder()
+from rest_framework.generics import get_object_or_404
 
 from .permissions import IsAdmin
-from .models import Cart, CartItem, Order, OrderItem
-from .filters import OrderFilter
+from .models import ArchivedOrder, Cart, CartItem, Order
+from .filters import ArchivedOrderFilter, OrderFilter
+from .archive import archive_needed
+from .reports import (
+    BUCKET_KINDS,
+    MAX_BUCKETS,
+    default_range,
+    iter_buckets,
+    note_status_change,
+    sales_report,
+)
+from .outbox import enqueue_order_status
+from .idempotency import idempotent
+from .bulk import bulk_set_status
+from .cart import cart_summary
+from .checkout import CheckoutConflict, CheckoutError, mark_paid, place_order, touch_cart
+from .payments import PaymentsUnavailable, gateway, stripe
 from .serializers import (
+    ArchivedOrderSerializer,
+    ArchivedOrderSummarySerializer,
     CartSerializer,
+    CartSummarySerializer,
     CreateOrderSerializer,
     OrderSerializer,
+    OrderSummarySerializer,
     AddToCartSerializer,
     UpdateCartItemSerializer,
 )
+from products.fragments import get_fragments
 from products.models import Product
+from products.inventory import InsufficientStock, available_stock, deduct_stock, restock
+from backend.throttling import IPTokenBucketThrottle, UserTokenBucketThrottle
+
+logger = logging.getLogger(__name__)
 
 
 # ---------------------------------------------------
@@ -56,19 +63,35 @@ class CartViewSet(viewsets.ViewSet):
 
     Routes generated:
     - GET    /api/cart/             → get cart
+    - GET    /api/cart/summary/     → item count, units and subtotal only
+      (one aggregate query, cached per user until the cart changes)
     - POST   /api/cart/add/         → add item
     - PATCH  /api/cart/item/<id>/   → update quantity
     - DELETE /api/cart/item/<id>/   → remove item
     """
 
     permission_classes = [permissions.IsAuthenticated]
+    throttle_scope = "cart"
 
     def list(self, request):
         """Return user's cart"""
         cart, _ = Cart.objects.get_or_create(user=request.user)
-        return Response(CartSerializer(cart).data)
-
-    @action(detail=False, methods=["post"])
+        prefetch_related_objects([cart], "items")
+        product_ids = [item.product_id for item in cart.items.all()]
+        fragments = get_fragments(product_ids)
+        context = {"request": request, "product_fragments": fragments}
+        return Response(CartSerializer(cart, context=context).data)
+
+    @action(detail=False, methods=["get"])
+    def summary(self, request):
+        summary = cart_summary(request.user.pk)
+        return Response(CartSummarySerializer(summary).data)
+
+    @action(
+        detail=False,
+        methods=["post"],
+        throttle_classes=[UserTokenBucketThrottle, IPTokenBucketThrottle],
+    )
     def add(self, request):
         serializer = AddToCartSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -77,21 +100,24 @@ class CartViewSet(viewsets.ViewSet):
         quantity = serializer.validated_data["quantity"]
 
         cart, _ = Cart.objects.get_or_create(user=request.user)
-        item, created = CartItem.objects.get_or_create(cart=cart, product=product)
-
-        new_quantity = quantity if created else item.quantity + quantity
+        with transaction.atomic():
+            touch_cart(cart.pk, request.user.pk)
+            item = CartItem.objects.filter(cart=cart, product=product).first()
+            new_quantity = quantity + (item.quantity if item else 0)
 
-        if new_quantity > product.stock:
-            return Response(
-                {
-                    "detail": "Not enough stock available",
-                    "available_stock": product.stock,
-                },
-                status=400,
-            )
+            if new_quantity > product.stock:
+                return Response(
+                    {
+                        "detail": "Not enough stock available",
+                        "available_stock": product.stock,
+                    },
+                    status=400,
+                )
 
-        item.quantity = new_quantity
-        item.save()
+            if item is None:
+                item = CartItem(cart=cart, product=product)
+            item.quantity = new_quantity
+            item.save()
 
         return Response({"detail": "Added to cart"}, status=200)
 
@@ -116,8 +142,10 @@ class CartViewSet(viewsets.ViewSet):
                 status=400,
             )
 
-        item.quantity = new_quantity
-        item.save()
+        with transaction.atomic():
+            touch_cart(item.cart_id, request.user.pk)
+            item.quantity = new_quantity
+            item.save()
 
         return Response({"detail": "Quantity updated"}, status=200)
 
@@ -128,40 +156,162 @@ class CartViewSet(viewsets.ViewSet):
         except CartItem.DoesNotExist:
             return Response({"detail": "Item not found"}, status=404)
 
-        item.delete()
+        with transaction.atomic():
+            touch_cart(item.cart_id, request.user.pk)
+            item.delete()
         return Response({"detail": "Item removed"}, status=200)
 
     @action(detail=False, methods=["delete"])
     def clear(self, request):
         cart, _ = Cart.objects.get_or_create(user=request.user)
-        cart.items.all().delete()
+        with transaction.atomic():
+            touch_cart(cart.pk, request.user.pk)
+            cart.items.all().delete()
         return Response({"detail": "Cart cleared"}, status=200)
 
 
+# ---------------------------------------------------
+# ARCHIVED ORDERS
+# ---------------------------------------------------
+
+
+class ArchiveAwareOrderMixin:
+    """
+    Transparently includes archived orders in order listings.
+
+    Archived orders are read when `date_after` reaches back past the
+    archive horizon, or, with `include_archived_by_default`, whenever no
+    `date_after` is given; otherwise listing behaves exactly as before.
+    Detail requests for an archived id are served from the archive.
+    """
+
+    # Columns shared by Order and ArchivedOrder used to merge and paginate
+    merge_columns = ["id", "created_at", "total_amount", "status"]
+    archived_list_serializer_class = ArchivedOrderSerializer
+    include_archived_by_default = False
+
+    def get_archived_queryset(self):
+        raise NotImplementedError
+
+    def get_merged_live_queryset(self):
+        """Live orders serialized on a page merged with archived ones."""
+        return self.get_queryset().prefetch_related("items")
+
+    def list(self, request, *args, **kwargs):
+        if not archive_needed(request.query_params, self.include_archived_by_default):
+            return super().list(request, *args, **kwargs)
+
+        live = self.filter_queryset(self.get_queryset())
+        archived = ArchivedOrderFilter(
+            request.query_params, queryset=self.get_archived_queryset(), request=request
+        ).qs
+        ordering = OrderingFilter().get_ordering(request, live, self) or ["-created_at"]
+
+        combined = (
+            live.order_by()
+            .values(*self.merge_columns)
+            .annotate(archived=Value(False))
+            .union(
+                archived.order_by()
+                .values(*self.merge_columns)
+                .annotate(archived=Value(True)),
+                all=True,
+            )
+            .order_by(*ordering, "-id")
+        )
+
+        page = self.paginate_queryset(combined)
+        rows = page if page is not None else list(combined)
+
+        live_ids = [row["id"] for row in rows if not row["archived"]]
+        archived_ids = [row["id"] for row in rows if row["archived"]]
+        live_by_id = {
+            order.id: order
+            for order in self.get_merged_live_queryset().filter(id__in=live_ids)
+        }
+        archived_by_id = ArchivedOrder.objects.in_bulk(archived_ids)
+
+        data = [
+            self.archived_list_serializer_class(archived_by_id[row["id"]]).data
+            if row["archived"]
+            else self.get_serializer(live_by_id[row["id"]]).data
+            for row in rows
+        ]
+
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:
+            archived = get_object_or_404(
+                self.get_archived_queryset(), pk=kwargs[self.lookup_field]
+            )
+            return Response(
+                ArchivedOrderSerializer(archived, context=self.get_serializer_context()).data
+            )
+
+
 # ---------------------------------------------------
 # USER ORDER VIEWSET
 # ---------------------------------------------------
 
 
-class UserOrderViewSet(viewsets.ReadOnlyModelViewSet):
+class UserOrderViewSet(ArchiveAwareOrderMixin, viewsets.ReadOnlyModelViewSet):
     """
     User endpoint:
-    - GET /api/my/orders/ → list user's orders
+    - GET /api/my/orders/ → list user's orders as summaries (date, status,
+      total and item count, counted in SQL); items are not loaded
+    - GET /api/my/orders/<id>/ → one order with its items (product details
+      as purchased, see OrderItem)
     - POST /api/my/orders/create/ → create order from cart
     - POST /api/my/orders/<id>/cancel/ → cancel order
+
+    The history includes archived orders, unless ?date_after= starts after
+    the newest of them.
+    Checkout uses settings.CHECKOUT_STRATEGY (see orders/checkout.py); an
+    optimistic checkout that keeps conflicting answers 409.
+    create_order and pay honour an `Idempotency-Key` header: retries replay
+    the first response instead of running again.
     """
 
     serializer_class = OrderSerializer
     permission_classes = [permissions.IsAuthenticated]
+    archived_list_serializer_class = ArchivedOrderSummarySerializer
+    include_archived_by_default = True
 
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_class = OrderFilter
     ordering_fields = ["total_amount", "created_at", "status"]
+    throttle_scope = "checkout"
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user).order_by("-created_at")
-
-    @action(detail=False, methods=["post"])
+        orders = Order.objects.filter(user=self.request.user).order_by("-created_at")
+        if self.action == "list":
+            return orders.annotate(item_count=Count("items"))
+        if self.action == "retrieve":
+            return orders.prefetch_related("items")
+        return orders
+
+    def get_serializer_class(self):
+        if self.action == "list":
+            return OrderSummarySerializer
+        return OrderSerializer
+
+    def get_merged_live_queryset(self):
+        return self.get_queryset()
+
+    def get_archived_queryset(self):
+        return ArchivedOrder.objects.filter(user=self.request.user)
+
+    @action(
+        detail=False,
+        methods=["post"],
+        throttle_classes=[UserTokenBucketThrottle, IPTokenBucketThrottle],
+    )
+    @idempotent
     def create_order(self, request):
         user = request.user
 
@@ -171,55 +321,22 @@ class UserOrderViewSet(viewsets.ReadOnlyModelViewSet):
         shipping_address = serializer.validated_data["shipping_address"]
 
         try:
-            with transaction.atomic():
-                cart = Cart.objects.select_for_update().get(user=user)
-                cart_items = list(
-                    cart.items.select_related("product").select_for_update()
-                )
-
-                if not cart_items:
-                    return Response({"detail": "Cart is empty"}, status=400)
-
-                product_ids = [item.product_id for item in cart_items]
-                products = Product.objects.select_for_update().filter(
-                    id__in=product_ids
-                )
-                stock_by_product = {product.id: product.stock for product in products}
-
-                for item in cart_items:
-                    available = stock_by_product.get(item.product_id, 0)
-                    if item.quantity > available:
-                        return Response(
-                            {
-                                "detail": "Not enough stock available",
-                                "product": item.product.name,
-                                "available_stock": available,
-                            },
-                            status=400,
-                        )
-
-                total = sum(item.product.price * item.quantity for item in cart_items)
-
-                order = Order.objects.create(
-                    user=user,
-                    status="PENDING",
-                    total_amount=total,
-                    shipping_address=shipping_address,
-                )
-
-                for item in cart_items:
-                    OrderItem.objects.create(
-                        order=order,
-                        product=item.product,
-                        quantity=item.quantity,
-                        unit_price=item.product.price,
-                    )
-
-                cart.items.all().delete()
+            order = place_order(user, shipping_address)
+        except CheckoutError as exc:
+            return Response({"detail": str(exc)}, status=400)
+        except InsufficientStock as exc:
+            return Response(
+                {
+                    "detail": "Not enough stock available",
+                    "product": exc.product.name,
+                    "available_stock": exc.available,
+                },
+                status=400,
+            )
+        except CheckoutConflict as exc:
+            return Response({"detail": str(exc)}, status=409)
 
-            return Response(OrderSerializer(order).data, status=201)
-        except Cart.DoesNotExist:
-            return Response({"detail": "Cart does not exist"}, status=400)
+        return Response(OrderSerializer(order).data, status=201)
 
     @action(detail=True, methods=["post"])
     def cancel(self, request, pk=None):
@@ -230,12 +347,15 @@ class UserOrderViewSet(viewsets.ReadOnlyModelViewSet):
                 {"detail": "Only PENDING orders can be cancelled"}, status=400
             )
 
-        order.status = "CANCELLED"
-        order.save()
+        with transaction.atomic():
+            order.status = "CANCELLED"
+            order.save()
+            enqueue_order_status(order, old_status="PENDING")
 
         return Response({"detail": "Order cancelled"}, status=200)
 
     @action(detail=True, methods=["post"])
+    @idempotent
     def pay(self, request, pk=None):
         """
         Create a Stripe Checkout session for this order.
@@ -248,15 +368,18 @@ class UserOrderViewSet(viewsets.ReadOnlyModelViewSet):
                 {"detail": "Only PENDING orders can be paid"}, status=400
             )
 
-        # Validate stock availability before creating session
-        items = list(order.items.select_related("product").select_for_update())
+        # Validate stock availability before creating session. Nothing is
+        # locked: stock is only deducted once the payment is confirmed.
+        items = list(order.items.select_related("product"))
+        stock_by_product = available_stock([item.product for item in items])
         for item in items:
-            if item.product.stock < item.quantity:
+            available = stock_by_product.get(item.product_id, 0)
+            if available < item.quantity:
                 return Response(
                     {
                         "detail": "Not enough stock available",
                         "product": item.product.name,
-                        "available_stock": item.product.stock,
+                        "available_stock": available,
                     },
                     status=400,
                 )
@@ -267,8 +390,6 @@ class UserOrderViewSet(viewsets.ReadOnlyModelViewSet):
                 status=500,
             )
 
-        stripe.api_key = settings.STRIPE_SECRET_KEY
-
         success_url = request.data.get("success_url")
         cancel_url = request.data.get("cancel_url")
 
@@ -277,22 +398,20 @@ class UserOrderViewSet(viewsets.ReadOnlyModelViewSet):
             success_url = success_url or f"{base}/checkout/success"
             cancel_url = cancel_url or f"{base}/checkout/cancel"
 
-        line_items = []
-        for item in order.items.select_related("product"):
-            unit_amount = int(item.unit_price * 100)
-            line_items.append(
-                {
-                    "quantity": item.quantity,
-                    "price_data": {
-                        "currency": "usd",
-                        "unit_amount": unit_amount,
-                        "product_data": {"name": item.product.name},
-                    },
-                }
-            )
+        line_items = [
+            {
+                "quantity": item.quantity,
+                "price_data": {
+                    "currency": "usd",
+                    "unit_amount": int(item.unit_price * 100),
+                    "product_data": {"name": item.product.name},
+                },
+            }
+            for item in items
+        ]
 
         try:
-            session = stripe.checkout.Session.create(
+            session = gateway.create_checkout_session(
                 payment_method_types=["card"],
                 mode="payment",
                 line_items=line_items,
@@ -300,6 +419,11 @@ class UserOrderViewSet(viewsets.ReadOnlyModelViewSet):
                 cancel_url=cancel_url,
                 metadata={"order_id": order.id},
             )
+        except PaymentsUnavailable:
+            return Response(
+                {"detail": "Payment provider unavailable, please retry shortly"},
+                status=503,
+            )
         except ImportError:
             return Response(
                 {"detail": "Stripe SDK not installed. Run `pip install stripe`."},
@@ -319,13 +443,15 @@ class UserOrderViewSet(viewsets.ReadOnlyModelViewSet):
 # ---------------------------------------------------
 
 
-class AdminOrderViewSet(viewsets.ReadOnlyModelViewSet):
+class AdminOrderViewSet(ArchiveAwareOrderMixin, viewsets.ReadOnlyModelViewSet):
     """
     Admin-only:
     - GET /api/orders/
     - Filtering enabled
-    - Change order status
+    - Change order status, one order or many at once (bulk-set-status)
     - Basic sales report
+
+    Archived orders are included when ?date_after= reaches back to them.
     """
 
     queryset = Order.objects.all().order_by("-created_at")
@@ -336,6 +462,9 @@ class AdminOrderViewSet(viewsets.ReadOnlyModelViewSet):
     filterset_class = OrderFilter
     ordering_fields = ["total_amount", "created_at", "status"]
 
+    def get_archived_queryset(self):
+        return ArchivedOrder.objects.all()
+
     @action(detail=True, methods=["post"], url_path="set-status")
     def set_status(self, request, pk=None):
         order = self.get_object()
@@ -348,86 +477,214 @@ class AdminOrderViewSet(viewsets.ReadOnlyModelViewSet):
                 status=400,
             )
 
-        old_status = order.status
+        try:
+            with transaction.atomic():
+                order = Order.objects.select_for_update().get(pk=order.pk)
+                old_status = order.status
+                items = list(order.items.select_related("product"))
+                lines = [(item.product, item.quantity) for item in items]
+
+                if old_status != "PAID" and new_status == "PAID":
+                    # Deduct stock at payment time
+                    deduct_stock(lines)
+                elif old_status == "PAID" and new_status == "CANCELLED":
+                    # Restock if a paid order is cancelled/refunded
+                    restock(lines)
+
+                order.status = new_status
+
+                if new_status == "PAID" and not order.paid_at:
+                    order.paid_at = order.paid_at or timezone.now()
+
+                order.save()
+                if new_status != old_status:
+                    enqueue_order_status(order, old_status)
+                    note_status_change(order, old_status)
+        except InsufficientStock as exc:
+            return Response(
+                {
+                    "detail": "Not enough stock available",
+                    "product": exc.product.name,
+                    "available_stock": exc.available,
+                },
+                status=400,
+            )
 
-        with transaction.atomic():
-            if old_status != "PAID" and new_status == "PAID":
-                # Deduct stock at payment time
-                items = list(order.items.select_related("product").select_for_update())
-                for item in items:
-                    if item.product.stock < item.quantity:
-                        return Response(
-                            {
-                                "detail": "Not enough stock available",
-                                "product": item.product.name,
-                                "available_stock": item.product.stock,
-                            },
-                            status=400,
-                        )
-                for item in items:
-                    Product.objects.filter(id=item.product_id).update(
-                        stock=F("stock") - item.quantity
-                    )
-            elif old_status == "PAID" and new_status == "CANCELLED":
-                # Restock if a paid order is cancelled/refunded
-                for item in order.items.select_related("product"):
-                    Product.objects.filter(id=item.product_id).update(
-                        stock=F("stock") + item.quantity
-                    )
+        return Response({"detail": "Status updated", "status": order.status})
 
-            order.status = new_status
+    @action(detail=False, methods=["post"], url_path="bulk-set-status")
+    def bulk_set_status(self, request):
+        """
+        Change the status of many orders at once.
 
-            if new_status == "PAID" and not order.paid_at:
-                order.paid_at = order.paid_at or timezone.now()
+        Body:
+        - status: the new status
+        - ids: list of order ids, or
+        - filter: OrderFilter parameters selecting the orders
+          (e.g. {"status": "PAID", "date_before": "2025-06-01"})
 
-            order.save()
+        At most ORDER_BULK_STATUS_MAX orders per request. Returns counts per
+        result and one report row per order (see orders/bulk.py).
+        """
+        new_status = request.data.get("status")
+        valid_statuses = dict(Order.STATUS_CHOICES).keys()
+        if new_status not in valid_statuses:
+            return Response(
+                {"detail": f"Invalid status. Allowed: {', '.join(valid_statuses)}"},
+                status=400,
+            )
 
-        return Response({"detail": "Status updated", "status": order.status})
+        ids, filters = request.data.get("ids"), request.data.get("filter")
+        if ids is not None:
+            if not isinstance(ids, list) or not all(
+                isinstance(pk, int) and not isinstance(pk, bool) for pk in ids
+            ):
+                return Response({"detail": "ids must be a list of integers"}, status=400)
+        elif isinstance(filters, dict) and filters:
+            filterset = OrderFilter(filters, queryset=Order.objects.all())
+            if not filterset.is_valid():
+                return Response(filterset.errors, status=400)
+            limit = settings.ORDER_BULK_STATUS_MAX + 1
+            ids = list(filterset.qs.order_by("id").values_list("id", flat=True)[:limit])
+        else:
+            return Response(
+                {"detail": "Pass a list of order ids or a non-empty filter"},
+                status=400,
+            )
+
+        if len(ids) > settings.ORDER_BULK_STATUS_MAX:
+            return Response(
+                {
+                    "detail": f"At most {settings.ORDER_BULK_STATUS_MAX} orders "
+                    "per request, narrow the selection"
+                },
+                status=400,
+            )
+
+        report = bulk_set_status(ids, new_status)
+        counts = {}
+        for row in report:
+            counts[row["result"]] = counts.get(row["result"], 0) + 1
+        return Response({"status": new_status, "counts": counts, "orders": report})
 
     @action(detail=False, methods=["get"], url_path="report")
     def report(self, request):
         """
-        Basic sales report for admins.
+        Sales report for admins.
+
+        Query params (on top of the order filters):
+        - bucket: day (default), week or month
+        - from / to: date range (YYYY-MM-DD), defaults to the last 30 days,
+          12 weeks or 12 months
 
         Returns:
         - total_orders
         - total_revenue
         - orders_by_status
-        - revenue_by_day (last 30 days)
+        - sales: per bucket orders, revenue, average_order_value, units_sold
+          (PAID, SHIPPED and DELIVERED orders)
+        - revenue_by_day (days with sales over the last 30 days)
+
+        Archived orders are included in every figure.
         """
 
         queryset = self.filter_queryset(self.get_queryset())
+        archived = ArchivedOrderFilter(
+            request.query_params, queryset=ArchivedOrder.objects.all(), request=request
+        ).qs
 
-        total_orders = queryset.count()
-        total_revenue = queryset.aggregate(total=Sum("total_amount"))["total"] or 0
+        kind = request.query_params.get("bucket", "day")
+        if kind not in BUCKET_KINDS:
+            return Response(
+                {"detail": f"Invalid bucket. Allowed: {', '.join(BUCKET_KINDS)}"},
+                status=400,
+            )
+
+        default_from, default_to = default_range(kind)
+        try:
+            date_from = self._parse_date_param("from", default_from)
+            date_to = self._parse_date_param("to", default_to)
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=400)
+
+        if date_from > date_to:
+            return Response({"detail": "`from` must not be after `to`"}, status=400)
+        if len(list(iter_buckets(date_from, date_to, kind))) > MAX_BUCKETS:
+            return Response(
+                {"detail": f"Too many buckets (max {MAX_BUCKETS})"}, status=400
+            )
 
-        orders_by_status = (
-            queryset.values("status")
-            .annotate(count=Count("id"), revenue=Sum("total_amount"))
-            .order_by("status")
+        # Everything that narrows the queryset must be part of the cache key
+        cache_scope = repr(
+            sorted(
+                (key, value)
+                for key, values in request.query_params.lists()
+                if key not in ("bucket", "from", "to", "page", "ordering")
+                for value in values
+            )
         )
 
-        revenue_by_day = (
-            queryset.filter(status="PAID")
-            .annotate(day=TruncDate("created_at"))
-            .values("day")
-            .annotate(revenue=Sum("total_amount"), orders=Count("id"))
-            .order_by("-day")[:30]
+        by_status = {}
+        for rows in (queryset, archived):
+            for row in (
+                rows.order_by()
+                .values("status")
+                .annotate(count=Count("id"), revenue=Sum("total_amount"))
+            ):
+                totals = by_status.setdefault(
+                    row["status"], {"status": row["status"], "count": 0, "revenue": 0}
+                )
+                totals["count"] += row["count"]
+                totals["revenue"] += row["revenue"] or 0
+        orders_by_status = [by_status[status] for status in sorted(by_status)]
+        total_orders = sum(row["count"] for row in orders_by_status)
+        total_revenue = sum(row["revenue"] for row in orders_by_status)
+
+        sales = sales_report(queryset, kind, date_from, date_to, cache_scope, archived)
+
+        day_from, day_to = default_range("day")
+        daily = (
+            sales
+            if kind == "day" and (date_from, date_to) == (day_from, day_to)
+            else sales_report(queryset, "day", day_from, day_to, cache_scope, archived)
         )
+        revenue_by_day = [
+            {"day": row["period"], "revenue": row["revenue"], "orders": row["orders"]}
+            for row in reversed(daily)
+            if row["orders"]
+        ]
 
         return Response(
             {
                 "total_orders": total_orders,
                 "total_revenue": total_revenue,
-                "orders_by_status": list(orders_by_status),
-                "revenue_by_day": list(revenue_by_day),
+                "orders_by_status": orders_by_status,
+                "bucket": kind,
+                "from": date_from,
+                "to": date_to,
+                "sales": sales,
+                "revenue_by_day": revenue_by_day,
             }
         )
 
+    def _parse_date_param(self, name, default):
+        value = self.request.query_params.get(name)
+        if not value:
+            return default
+        parsed = parse_date(value)
+        if parsed is None:
+            raise ValueError(f"Invalid `{name}` date, expected YYYY-MM-DD")
+        return parsed
+
 
 class StripeWebhookView(APIView):
     """
     Handles Stripe webhook events.
+
+    checkout.session.completed moves a PENDING order to PAID. A payment for
+    an order that is no longer pending (e.g. cancelled by
+    `expire_pending_orders`) leaves the order and stock untouched and is
+    logged as an error so the payment can be refunded.
     """
 
     permission_classes = [permissions.AllowAny]
@@ -463,30 +720,16 @@ class StripeWebhookView(APIView):
             session = event["data"]["object"]
             order_id = session.get("metadata", {}).get("order_id")
             if order_id:
-                with transaction.atomic():
-                    try:
-                        order = Order.objects.select_for_update().get(id=order_id)
-                    except Order.DoesNotExist:
-                        return Response(status=200)
-
-                    if order.status != "PAID":
-                        items = list(
-                            order.items.select_related("product").select_for_update()
-                        )
-                        for item in items:
-                            if item.product.stock < item.quantity:
-                                return Response(status=400)
-
-                        for item in items:
-                            Product.objects.filter(id=item.product_id).update(
-                                stock=F("stock") - item.quantity
-                            )
-
-                        order.status = "PAID"
-                        order.paid_at = order.paid_at or timezone.now()
-                        order.stripe_session_id = session.get(
-                            "id", order.stripe_session_id
-                        )
-                        order.save(update_fields=["status", "paid_at", "stripe_session_id"])
+                try:
+                    order = mark_paid(order_id, session.get("id", ""))
+                except InsufficientStock:
+                    return Response(status=400)
+                if order is not None and order.status != "PAID":
+                    logger.error(
+                        "Stripe session %s paid order %s in status %s; refund needed",
+                        session.get("id"),
+                        order.id,
+                        order.status,
+                    )
 
         return Response(status=200)
@@ -1,12 +1,22 @@
 from django.contrib import admin
-from .models import Product, Category
+from .models import Product, Category, ProductSalesStats, StockShard
+from .inventory import reshard
 
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ("id", "name", "slug")
+    list_display = ("id", "name", "slug", "parent", "depth")
+    list_filter = ("depth",)
     search_fields = ("name", "slug")
-    ordering = ("name",)
+    ordering = ("path",)
+    readonly_fields = ("path", "depth")
+
+
+class StockShardInline(admin.TabularInline):
+    model = StockShard
+    extra = 0
+    readonly_fields = ("index", "quantity")
+    can_delete = False
 
 
 @admin.register(Product)
@@ -16,3 +26,29 @@ class ProductAdmin(admin.ModelAdmin):
     search_fields = ("name", "description", "sku")
     ordering = ("name",)
     prepopulated_fields = {"slug": ("name",)}
+    inlines = [StockShardInline]
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if not change and obj.stock_shards:
+            reshard(obj, total=obj.stock)
+        elif "stock" in form.changed_data:
+            reshard(obj, total=obj.stock)
+        elif "stock_shards" in form.changed_data:
+            reshard(obj)
+
+
+@admin.register(ProductSalesStats)
+class ProductSalesStatsAdmin(admin.ModelAdmin):
+    list_display = (
+        "product",
+        "units_sold",
+        "revenue",
+        "units_7d",
+        "units_30d",
+        "last_sold_at",
+    )
+    ordering = ("-units_sold",)
+    search_fields = ("product__name", "product__sku")
+    list_select_related = ("product",)
+    readonly_fields = [f.name for f in ProductSalesStats._meta.fields]
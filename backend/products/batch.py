@@ -0,0 +1,122 @@
+"""
+Many products in one request (GET /api/products/batch/).
+
+Cart and wishlist pages refresh prices and stock of a known set of products.
+Each product's representation is cached on its own key (products.cache
+.product_cache_key; the full one is the fragment of products.fragments), so
+a batch is one `get_many` plus a single `id IN (...)` / `slug IN (...)`
+query for the misses. Entries follow the catalog version and are dropped
+by stock and sales changes (forget_products).
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+from .cache import get_catalog_version, product_cache_key
+from .fragments import fragment_queryset
+from .models import Product
+from .serializers import ProductAvailabilitySerializer, ProductSerializer
+
+
+# Primary keys are 64-bit integers; larger values overflow the query
+MAX_ID = 2**63 - 1
+
+
+class BatchError(ValueError):
+    """The batch parameters are invalid."""
+
+
+def parse_values(params, name):
+    """Values of a comma separated and/or repeated query parameter."""
+    values = []
+    for raw in params.getlist(name):
+        values.extend(value.strip() for value in raw.split(",") if value.strip())
+    # Keep the first occurrence of duplicates
+    return list(dict.fromkeys(values))
+
+
+def parse_batch(params):
+    """Return (ids, slugs) from ?ids= and ?slugs=; raise BatchError."""
+    ids = parse_values(params, "ids")
+    slugs = parse_values(params, "slugs")
+    if not ids and not slugs:
+        raise BatchError("Pass product ids (?ids=) or slugs (?slugs=)")
+    if len(ids) + len(slugs) > settings.PRODUCT_BATCH_MAX_SIZE:
+        raise BatchError(
+            f"At most {settings.PRODUCT_BATCH_MAX_SIZE} products per request"
+        )
+    try:
+        ids = [int(value) for value in ids]
+    except ValueError:
+        raise BatchError("ids must be integers")
+    if any(abs(pk) > MAX_ID for pk in ids):
+        raise BatchError("ids out of range")
+    return ids, slugs
+
+
+def _render(products, compact):
+    # No request: the entries are shared by every client (see
+    # products.fragments)
+    serializer_class = ProductAvailabilitySerializer if compact else ProductSerializer
+    data = serializer_class(products, many=True).data
+    return {row["id"]: row for row in data}
+
+
+def _load(compact, lookup):
+    if compact:
+        queryset = Product.objects.filter(lookup)
+        return list(queryset.only(*ProductAvailabilitySerializer.Meta.fields, "slug"))
+    return list(fragment_queryset().filter(lookup))
+
+
+def get_products(ids=(), slugs=(), compact=False):
+    """
+    Representations of the products with these ids and slugs, in request
+    order (ids first), and {"ids": [...], "slugs": [...]} of those that
+    matched nothing.
+    """
+    mode = "compact" if compact else "full"
+    timeout = settings.PRODUCT_FRAGMENT_CACHE_TIMEOUT
+    version = get_catalog_version()
+
+    # Slugs resolve to ids through their own cached mapping
+    slug_keys = {slug: f"products:slug:{version}:{slug}" for slug in slugs}
+    cached_slugs = cache.get_many(slug_keys.values()) if slugs else {}
+    slug_ids = {slug: cached_slugs.get(key) for slug, key in slug_keys.items()}
+
+    wanted = list(dict.fromkeys([*ids, *(pk for pk in slug_ids.values() if pk)]))
+    keys = {pk: product_cache_key(pk, mode, version) for pk in wanted}
+    cached = cache.get_many(keys.values()) if keys else {}
+    found = {pk: cached[key] for pk, key in keys.items() if key in cached}
+
+    missing_ids = [pk for pk in wanted if pk not in found]
+    unresolved = [slug for slug, pk in slug_ids.items() if pk is None]
+    if missing_ids or unresolved:
+        # A single query for everything the cache did not have
+        products = _load(compact, Q(id__in=missing_ids) | Q(slug__in=unresolved))
+        rendered = _render(products, compact)
+        found.update(rendered)
+        for product in products:
+            if product.slug in slug_ids:
+                slug_ids[product.slug] = product.pk
+        cache.set_many(
+            {product_cache_key(pk, mode, version): row for pk, row in rendered.items()},
+            timeout,
+        )
+        cache.set_many(
+            {
+                slug_keys[product.slug]: product.pk
+                for product in products
+                if product.slug in slug_keys
+            },
+            timeout,
+        )
+
+    order = [*ids, *(slug_ids[slug] for slug in slugs if slug_ids[slug] is not None)]
+    results = [found[pk] for pk in dict.fromkeys(order) if pk in found]
+    missing = {
+        "ids": [pk for pk in ids if pk not in found],
+        "slugs": [slug for slug in slugs if slug_ids[slug] is None],
+    }
+    return results, missing
@@ -0,0 +1,145 @@
+"""
+Bulk price and stock changes for the admin (ProductViewSet.bulk_update).
+
+A change is absolute ({"set": v}) or relative ({"add": d}, and for prices
+{"percent": p}). Each chunk of PRODUCT_BULK_UPDATE_CHUNK_SIZE products is
+one UPDATE computed in SQL (relative stock changes therefore never
+overwrite a concurrent checkout's deduction), in its own transaction.
+Sharded products get their stock through `reshard`, one by one.
+
+QuerySet.update() fires no signals, so instead of one invalidation per
+product the catalog version is bumped once and the touched categories'
+snapshots are marked dirty once, when all chunks are written. The suggest
+index only holds names and SKUs, so it is unaffected.
+"""
+
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DecimalField, F, IntegerField, Value
+from django.db.models.functions import Greatest, Round
+
+from . import snapshots
+from .cache import bump_catalog_version
+from .inventory import available_stock, reshard
+from .models import Product
+
+PRICE_OPERATIONS = ("set", "add", "percent")
+STOCK_OPERATIONS = ("set", "add")
+
+
+class BulkUpdateError(ValueError):
+    """The requested change is invalid."""
+
+
+def _parse_change(change, name, operations, parse):
+    if change is None:
+        return None
+    if not isinstance(change, dict) or len(change) != 1:
+        raise BulkUpdateError(
+            f'{name} must be {{"<operation>": value}} with one of: {", ".join(operations)}'
+        )
+    (operation, raw), = change.items()
+    if operation not in operations:
+        raise BulkUpdateError(f"{name}: unknown operation {operation!r}")
+    try:
+        value = parse(raw)
+    except (TypeError, ValueError, InvalidOperation):
+        raise BulkUpdateError(f"{name}: invalid value {raw!r}")
+    if operation == "set" and value < 0:
+        raise BulkUpdateError(f"{name} cannot be negative")
+    return operation, value
+
+
+def _parse_int(raw):
+    if isinstance(raw, bool) or not isinstance(raw, (int, str)):
+        raise TypeError(raw)
+    return int(raw)
+
+
+def _parse_decimal(raw):
+    if isinstance(raw, bool) or not isinstance(raw, (int, str, float)):
+        raise TypeError(raw)
+    value = Decimal(str(raw))
+    if not value.is_finite():
+        raise ValueError(raw)
+    return value
+
+
+def parse_changes(data):
+    """Return (price change, stock change) from the request body."""
+    price = _parse_change(data.get("price"), "price", PRICE_OPERATIONS, _parse_decimal)
+    stock = _parse_change(data.get("stock"), "stock", STOCK_OPERATIONS, _parse_int)
+    if price is None and stock is None:
+        raise BulkUpdateError("Pass a price and/or stock change")
+    return price, stock
+
+
+def _price_expression(operation, value):
+    price_field = DecimalField(max_digits=10, decimal_places=2)
+    if operation == "set":
+        return Value(value.quantize(Decimal("0.01")), output_field=price_field)
+    if operation == "add":
+        new_price = F("price") + Value(value, output_field=price_field)
+    else:
+        factor = 1 + value / 100
+        new_price = F("price") * Value(factor, output_field=price_field)
+    return Greatest(
+        Round(new_price, 2, output_field=price_field),
+        Value(Decimal("0"), output_field=price_field),
+    )
+
+
+def _stock_expression(operation, value):
+    if operation == "set":
+        return Value(value)
+    return Greatest(F("stock") + value, Value(0), output_field=IntegerField())
+
+
+def _new_stock(current, operation, value):
+    return value if operation == "set" else max(current + value, 0)
+
+
+def bulk_update_products(product_ids, price=None, stock=None, chunk_size=None):
+    """
+    Apply `price` / `stock` changes (operation, value) to the products.
+    Returns the number of products updated.
+    """
+    chunk_size = chunk_size or settings.PRODUCT_BULK_UPDATE_CHUNK_SIZE
+    product_ids = sorted(set(product_ids))
+    changes = {}
+    if price is not None:
+        changes["price"] = _price_expression(*price)
+
+    updated, category_ids = 0, set()
+    try:
+        for start in range(0, len(product_ids), chunk_size):
+            chunk = product_ids[start : start + chunk_size]
+            with transaction.atomic():
+                rows = Product.objects.filter(id__in=chunk)
+                if stock is None:
+                    rows.update(**changes)
+                else:
+                    sharded = list(
+                        rows.filter(stock_shards__gt=0).only("id", "stock", "stock_shards")
+                    )
+                    rows.filter(stock_shards=0).update(
+                        stock=_stock_expression(*stock), **changes
+                    )
+                    if sharded and changes:
+                        rows.filter(stock_shards__gt=0).update(**changes)
+                    # The shard sum, not the derived column, is authoritative
+                    current = available_stock(sharded)
+                    for product in sharded:
+                        reshard(product, total=_new_stock(current[product.pk], *stock))
+
+                matched = list(rows.values_list("category_id", flat=True))
+                updated += len(matched)
+                category_ids.update(pk for pk in matched if pk is not None)
+    finally:
+        if updated:
+            # One invalidation for the whole batch instead of one per product
+            bump_catalog_version()
+            snapshots.mark_dirty(snapshots.scopes_for_categories(category_ids))
+    return updated
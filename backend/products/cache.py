@@ -0,0 +1,52 @@
+import time
+
+from django.core.cache import cache
+
+CATALOG_VERSION_KEY = "products:catalog_version"
+
+
+def get_catalog_version():
+    """
+    Return the current catalog version.
+
+    Cached catalog data is keyed by this value, so bumping it invalidates all
+    of it at once. Versions are timestamps, so an evicted version can never
+    resurrect entries written under an older one.
+    """
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(CATALOG_VERSION_KEY, version, None):
+            version = cache.get(CATALOG_VERSION_KEY, version)
+    return version
+
+
+def bump_catalog_version():
+    """Invalidate every cached entry derived from products or categories."""
+    cache.set(CATALOG_VERSION_KEY, time.time_ns(), None)
+
+
+# Per-product cache entries, one per representation ("full", "staff",
+# "compact")
+PRODUCT_CACHE_MODES = ("full", "staff", "compact")
+
+
+def product_cache_key(product_id, mode, version=None):
+    version = get_catalog_version() if version is None else version
+    return f"products:item:{version}:{mode}:{product_id}"
+
+
+def forget_products(product_ids):
+    """
+    Drop the per-product entries of some products. For changes that skip
+    the model signals (stock updates), which would otherwise bump the
+    catalog version.
+    """
+    version = get_catalog_version()
+    cache.delete_many(
+        [
+            product_cache_key(pk, mode, version)
+            for pk in product_ids
+            for mode in PRODUCT_CACHE_MODES
+        ]
+    )
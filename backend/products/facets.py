@@ -0,0 +1,101 @@
+import hashlib
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, Count, IntegerField, Value, When
+from rest_framework.exceptions import ValidationError
+
+from .cache import get_catalog_version
+
+AVAILABLE_FACETS = ("category", "price")
+
+# Query params that do not change the filtered result set
+IGNORED_PARAMS = {"page", "page_size", "ordering", "facets"}
+
+
+def parse_facets(value):
+    """
+    Parse the `facets` query param ("category,price") into a tuple.
+    """
+    names = tuple(sorted({name.strip() for name in value.split(",") if name.strip()}))
+    unknown = [name for name in names if name not in AVAILABLE_FACETS]
+    if unknown:
+        raise ValidationError(
+            {"facets": f"Unknown facet(s): {', '.join(unknown)}. "
+             f"Allowed: {', '.join(AVAILABLE_FACETS)}"}
+        )
+    return names
+
+
+def _price_bucket_expression(boundaries):
+    whens = [
+        When(price__lt=boundary, then=Value(index))
+        for index, boundary in enumerate(boundaries)
+    ]
+    return Case(*whens, default=Value(len(boundaries)), output_field=IntegerField())
+
+
+def compute_facets(queryset, names):
+    """
+    Compute facet counts for an already filtered Product queryset.
+
+    All requested facets come from a single GROUP BY over the requested
+    dimensions; each facet is then folded in Python from the grouped rows.
+    """
+    boundaries = [Decimal(str(b)) for b in settings.PRODUCT_PRICE_FACET_BOUNDARIES]
+
+    group_by = []
+    queryset = queryset.order_by()
+    if "category" in names:
+        group_by += ["category__slug", "category__name"]
+    if "price" in names:
+        queryset = queryset.annotate(price_bucket=_price_bucket_expression(boundaries))
+        group_by.append("price_bucket")
+
+    rows = queryset.values(*group_by).annotate(count=Count("id"))
+
+    categories = {}
+    price_counts = [0] * (len(boundaries) + 1)
+    for row in rows:
+        if "category" in names:
+            slug = row["category__slug"]
+            entry = categories.setdefault(
+                slug, {"slug": slug, "name": row["category__name"], "count": 0}
+            )
+            entry["count"] += row["count"]
+        if "price" in names:
+            price_counts[row["price_bucket"]] += row["count"]
+
+    facets = {}
+    if "category" in names:
+        facets["category"] = sorted(
+            categories.values(), key=lambda c: (-c["count"], c["name"] or "")
+        )
+    if "price" in names:
+        edges = [None] + boundaries + [None]
+        facets["price"] = [
+            {"min": edges[i], "max": edges[i + 1], "count": count}
+            for i, count in enumerate(price_counts)
+        ]
+    return facets
+
+
+def get_facets(queryset, names, query_params):
+    """
+    Return facet counts, cached per filter combination and catalog version.
+    """
+    params = sorted(
+        (key, value)
+        for key, values in query_params.lists()
+        if key not in IGNORED_PARAMS
+        for value in values
+    )
+    digest = hashlib.md5(repr((names, params)).encode()).hexdigest()
+    key = f"products:facets:{get_catalog_version()}:{digest}"
+
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(queryset, names)
+        cache.set(key, facets, settings.PRODUCT_FACETS_CACHE_TIMEOUT)
+    return facets
@@ -1,5 +1,7 @@
 import django_filters
-from .models import Product
+from rest_framework.filters import OrderingFilter
+
+from .models import Category, Product
 
 
 class ProductFilter(django_filters.FilterSet):
@@ -10,7 +12,10 @@ class ProductFilter(django_filters.FilterSet):
     - min_price: filters products with price >= value
     - max_price: filters products with price <= value
     - min_stock: filters products with stock >= value
-    - category: filters by category slug (case-insensitive)
+    - category: filters by category slug (case-insensitive), including
+      every descendant category
+    - min_units_sold / min_units_30d: best sellers (requires the queryset
+      to be annotated with products.sales.with_sales_stats)
 
     These filters allow flexible querying for the admin panel or
     frontend product list pages.
@@ -22,8 +27,12 @@ class ProductFilter(django_filters.FilterSet):
     min_price = django_filters.NumberFilter(field_name="price", lookup_expr="gte")
     max_price = django_filters.NumberFilter(field_name="price", lookup_expr="lte")
     min_stock = django_filters.NumberFilter(field_name="stock", lookup_expr="gte")
-    category = django_filters.CharFilter(
-        field_name="category__slug", lookup_expr="iexact"
+    category = django_filters.CharFilter(method="filter_category")
+    min_units_sold = django_filters.NumberFilter(
+        field_name="units_sold", lookup_expr="gte"
+    )
+    min_units_30d = django_filters.NumberFilter(
+        field_name="units_30d", lookup_expr="gte"
     )
 
     class Meta:
@@ -34,4 +43,34 @@ class ProductFilter(django_filters.FilterSet):
             "min_price",
             "max_price",
             "min_stock",
+            "min_units_sold",
+            "min_units_30d",
         ]
+
+    def filter_category(self, queryset, name, value):
+        # A constant prefix match on the indexed materialized path is a single
+        # range scan covering the whole subtree.
+        path = (
+            Category.objects.filter(slug__iexact=value)
+            .values_list("path", flat=True)
+            .first()
+        )
+        if path is None:
+            return queryset.none()
+        return queryset.filter(category__path__startswith=path)
+
+
+class ProductOrderingFilter(OrderingFilter):
+    """
+    OrderingFilter that only accepts the view's `staff_ordering_fields`
+    (revenue) from admin users; for everyone else they are ignored like
+    any unknown field.
+    """
+
+    def get_valid_fields(self, queryset, view, context={}):
+        fields = super().get_valid_fields(queryset, view, context)
+        request = context.get("request")
+        if request is not None and request.user.is_staff:
+            return fields
+        staff_only = set(getattr(view, "staff_ordering_fields", ()))
+        return [field for field in fields if field[0] not in staff_only]
@@ -0,0 +1,85 @@
+"""
+Serialized product fragments.
+
+ProductSerializer output (with the nested category and the sales
+statistics) is cached per product under products.cache.product_cache_key,
+i.e. per product id and catalog version. Product and Category signals bump
+the version, so any change retires every fragment at once; stock and sales
+updates, which skip the signals, drop the fragments of their products
+(forget_products).
+
+Responses that render many products (the product list, the cart, related
+products, the batch endpoint) fetch all fragments with one `get_many` and
+only serialize the misses. Admin users get StaffProductSerializer fragments
+(with revenue), cached under their own mode.
+
+Fragments are shared by every client, so they are rendered without the
+request: the image URL is built on settings.MEDIA_BASE_URL (see
+serializers.media_url) instead of the scheme and host of whichever request
+filled the cache.
+
+A miss that reads a product just before a concurrent stock change commits
+can store the old stock after that change dropped the fragment; such a
+fragment stays stale until the next change or PRODUCT_FRAGMENT_CACHE_TIMEOUT
+(5 minutes by default). Checkout re-checks stock, so this only affects what
+is displayed.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .cache import get_catalog_version, product_cache_key
+from .models import Product
+from .sales import with_sales_stats
+from .serializers import ProductSerializer, StaffProductSerializer
+
+
+def fragment_queryset():
+    """Products loaded the way ProductSerializer expects them."""
+    return with_sales_stats(Product.objects.select_related("category"))
+
+
+def get_fragments(products, staff=False):
+    """
+    Return {product id: serialized product} for model instances (annotated
+    like fragment_queryset) or plain ids, which are loaded on a miss.
+    """
+    mode, serializer_class = (
+        ("staff", StaffProductSerializer) if staff else ("full", ProductSerializer)
+    )
+    instances = {
+        product.pk: product for product in products if isinstance(product, Product)
+    }
+    ids = list(dict.fromkeys(getattr(product, "pk", product) for product in products))
+    if not ids:
+        return {}
+
+    version = get_catalog_version()
+    keys = {pk: product_cache_key(pk, mode, version) for pk in ids}
+    cached = cache.get_many(keys.values())
+    fragments = {pk: cached[key] for pk, key in keys.items() if key in cached}
+
+    misses = [pk for pk in ids if pk not in fragments]
+    if misses:
+        to_load = [pk for pk in misses if pk not in instances]
+        if to_load:
+            instances.update(
+                (product.pk, product)
+                for product in fragment_queryset().filter(id__in=to_load)
+            )
+        missing = [instances[pk] for pk in misses if pk in instances]
+        data = serializer_class(missing, many=True).data
+        rendered = {row["id"]: row for row in data}
+        fragments.update(rendered)
+        cache.set_many(
+            {keys[pk]: row for pk, row in rendered.items()},
+            settings.PRODUCT_FRAGMENT_CACHE_TIMEOUT,
+        )
+    return fragments
+
+
+def serialize_products(products, staff=False):
+    """Serialized products in the given order (unknown ids are left out)."""
+    fragments = get_fragments(products, staff=staff)
+    ids = [getattr(product, "pk", product) for product in products]
+    return [fragments[pk] for pk in ids if pk in fragments]
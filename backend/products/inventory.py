@@ -0,0 +1,251 @@
+"""
+Stock accounting shared by checkout, payment and admin flows.
+
+Products with `stock_shards == 0` keep their stock in `Product.stock` and are
+updated with conditional `F()` expressions. Products with `stock_shards > 0`
+split their stock over `StockShard` rows: decrements hit one random shard,
+shards are rebalanced when none can serve a request on its own, and
+`Product.stock` is refreshed from the shard sum right after commit so reads
+keep using the plain column.
+"""
+
+import random
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from . import snapshots
+from .cache import forget_products
+from .models import Product, StockShard
+
+
+class InsufficientStock(Exception):
+    """Raised when a product cannot cover the requested quantity."""
+
+    def __init__(self, product, requested, available):
+        self.product = product
+        self.requested = requested
+        self.available = available
+        super().__init__(
+            f"Not enough stock for {product.name}: {requested} > {available}"
+        )
+
+
+def _aggregate(lines):
+    """Sum `(product, quantity)` pairs per product, keeping one instance."""
+    products = {}
+    quantities = defaultdict(int)
+    for product, quantity in lines:
+        products[product.pk] = product
+        quantities[product.pk] += quantity
+    # Stable order keeps lock acquisition order consistent across requests
+    return [(products[pk], quantities[pk]) for pk in sorted(products)]
+
+
+def available_stock(products, lock=False):
+    """
+    Return {product_id: available units} for the given products.
+
+    With `lock=True`, unsharded product rows are locked for the rest of the
+    transaction; sharded products are summed without locking anything.
+    """
+    plain_ids = [p.pk for p in products if not p.stock_shards]
+    sharded_ids = [p.pk for p in products if p.stock_shards]
+
+    available = {}
+    if plain_ids:
+        queryset = Product.objects.filter(id__in=plain_ids).order_by("id")
+        if lock:
+            queryset = queryset.select_for_update()
+        available.update(queryset.values_list("id", "stock"))
+    if sharded_ids:
+        available.update(
+            StockShard.objects.filter(product_id__in=sharded_ids)
+            .values("product_id")
+            .annotate(total=Sum("quantity"))
+            .values_list("product_id", "total")
+        )
+        for pk in sharded_ids:
+            available.setdefault(pk, 0)
+    return available
+
+
+def deduct_stock(lines):
+    """
+    Remove stock for `(product, quantity)` pairs inside the current transaction.
+
+    Raises InsufficientStock (leaving the caller to roll back) when a product
+    cannot cover its quantity.
+    """
+    lines, sharded = _aggregate(lines), []
+    for product, quantity in lines:
+        if product.stock_shards:
+            _take_from_shards(product, quantity)
+            sharded.append(product.pk)
+            continue
+
+        updated = Product.objects.filter(id=product.pk, stock__gte=quantity).update(
+            stock=F("stock") - quantity
+        )
+        if not updated:
+            available = (
+                Product.objects.filter(id=product.pk)
+                .values_list("stock", flat=True)
+                .first()
+            )
+            raise InsufficientStock(product, quantity, available or 0)
+
+    _after_commit([product.pk for product, _ in lines], sharded)
+
+
+def _after_commit(product_ids, sharded):
+    """
+    Refresh sharded products' stock column, drop cached stock and flag the
+    catalog snapshots listing the products.
+    """
+
+    def refresh():
+        if sharded:
+            sync_product_stock(sharded)
+        forget_products(product_ids)
+        snapshots.mark_products_dirty(product_ids)
+
+    transaction.on_commit(refresh)
+
+
+def restock(lines):
+    """Give back stock for `(product, quantity)` pairs (cancellations, refunds)."""
+    lines, sharded = _aggregate(lines), []
+    for product, quantity in lines:
+        if product.stock_shards:
+            index = random.randrange(product.stock_shards)
+            if not StockShard.objects.filter(product_id=product.pk, index=index).update(
+                quantity=F("quantity") + quantity
+            ):
+                _rebalance(product, quantity)
+            sharded.append(product.pk)
+        else:
+            Product.objects.filter(id=product.pk).update(stock=F("stock") + quantity)
+
+    _after_commit([product.pk for product, _ in lines], sharded)
+
+
+def _take_from_shards(product, quantity):
+    shards = StockShard.objects.filter(product_id=product.pk)
+
+    # Fast path: one conditional UPDATE on a random shard
+    index = random.randrange(product.stock_shards)
+    if shards.filter(index=index, quantity__gte=quantity).update(
+        quantity=F("quantity") - quantity
+    ):
+        return
+
+    # Any other shard able to serve the whole quantity
+    candidates = list(
+        shards.filter(quantity__gte=quantity)
+        .exclude(index=index)
+        .values_list("index", flat=True)
+    )
+    random.shuffle(candidates)
+    for index in candidates:
+        if shards.filter(index=index, quantity__gte=quantity).update(
+            quantity=F("quantity") - quantity
+        ):
+            return
+
+    _rebalance(product, -quantity)
+
+
+def _rebalance(product, delta):
+    """
+    Slow path: lock every shard, apply `delta` to the total and spread the
+    result evenly again.
+    """
+    rows = list(
+        StockShard.objects.select_for_update()
+        .filter(product_id=product.pk)
+        .order_by("index")
+    )
+    total = sum(row.quantity for row in rows)
+    if total + delta < 0:
+        raise InsufficientStock(product, -delta, total)
+
+    _spread(product, rows, total + delta)
+
+
+def _spread(product, rows, total):
+    """Distribute `total` units evenly over the product's shard rows."""
+    by_index = {row.index: row for row in rows}
+    count = product.stock_shards
+    base, extra = divmod(total, count)
+
+    to_create, to_update = [], []
+    for index in range(count):
+        quantity = base + (1 if index < extra else 0)
+        row = by_index.pop(index, None)
+        if row is None:
+            to_create.append(StockShard(product_id=product.pk, index=index, quantity=quantity))
+        elif row.quantity != quantity:
+            row.quantity = quantity
+            to_update.append(row)
+
+    StockShard.objects.bulk_create(to_create)
+    StockShard.objects.bulk_update(to_update, ["quantity"])
+    if by_index:
+        StockShard.objects.filter(pk__in=[row.pk for row in by_index.values()]).delete()
+
+
+def reshard(product, total=None):
+    """
+    Apply `product.stock_shards` and (optionally) a new absolute stock.
+
+    When `total` is None the current stock is kept: the shard sum for an
+    already sharded product, `Product.stock` otherwise. Setting
+    `stock_shards` to 0 folds the shards back into `Product.stock`.
+    """
+    with transaction.atomic():
+        rows = list(
+            StockShard.objects.select_for_update()
+            .filter(product_id=product.pk)
+            .order_by("index")
+        )
+        if total is None:
+            if rows:
+                total = sum(row.quantity for row in rows)
+            else:
+                total = (
+                    Product.objects.filter(pk=product.pk)
+                    .values_list("stock", flat=True)
+                    .get()
+                )
+
+        if product.stock_shards:
+            _spread(product, rows, total)
+        elif rows:
+            StockShard.objects.filter(product_id=product.pk).delete()
+
+        Product.objects.filter(pk=product.pk).update(stock=total)
+        product.stock = total
+        transaction.on_commit(lambda: forget_products([product.pk]))
+
+
+def sync_product_stock(product_ids=None):
+    """
+    Refresh `Product.stock` from the shard sums in one UPDATE.
+
+    Runs outside the checkout transaction, so it never extends its locks.
+    Without ids, every sharded product is refreshed.
+    """
+    queryset = Product.objects.filter(stock_shards__gt=0)
+    if product_ids is not None:
+        queryset = queryset.filter(id__in=product_ids)
+
+    totals = (
+        StockShard.objects.filter(product_id=OuterRef("pk"))
+        .values("product_id")
+        .annotate(total=Sum("quantity"))
+        .values("total")
+    )
+    return queryset.update(stock=Coalesce(Subquery(totals), Value(0)))
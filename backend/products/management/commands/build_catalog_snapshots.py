@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from products import snapshots
+
+
+class Command(BaseCommand):
+    help = (
+        "Pre-render the anonymous product list pages of categories changed "
+        "since the last build (or of every category with --all)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Rebuild every category, not only the dirty or missing ones.",
+        )
+
+    def handle(self, *args, **options):
+        built = snapshots.build(full=options["all"])
+        pages = sum(built.values())
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rendered {pages} page(s) for {len(built)} category scope(s)."
+            )
+        )
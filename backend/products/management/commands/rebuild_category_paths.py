@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from products.cache import bump_catalog_version
+from products.models import Category
+
+
+class Command(BaseCommand):
+    help = "Recompute the materialized path and depth of every category."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            updated, orphaned = Category.rebuild_paths(batch_size=options["batch_size"])
+
+        if updated:
+            bump_catalog_version()
+
+        self.stdout.write(self.style.SUCCESS(f"Updated {updated} category path(s)."))
+        if orphaned:
+            self.stderr.write(
+                self.style.WARNING(
+                    "Categories unreachable from a root (parent cycle): "
+                    + ", ".join(str(pk) for pk in orphaned)
+                )
+            )
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from products.inventory import sync_product_stock
+
+
+class Command(BaseCommand):
+    help = "Refresh Product.stock from the stock shards of sharded products."
+
+    def handle(self, *args, **options):
+        updated = sync_product_stock()
+        self.stdout.write(self.style.SUCCESS(f"Synced {updated} sharded product(s)."))
@@ -0,0 +1,78 @@
+import gzip
+import re
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+
+from . import snapshots
+
+_slug = re.compile(r"^[-\w]+$")
+
+
+class CatalogSnapshotMiddleware:
+    """
+    Serve anonymous `GET /api/products/` pages from the files written by
+    `build_catalog_snapshots`, before sessions, auth, URL resolution or DRF
+    run. Only requests whose parameters are limited to category, ordering and
+    page are candidates; anything else (filters, search, facets, a logged-in
+    user, the browsable API) or a category whose pages are dirty falls
+    through to ProductViewSet.
+
+    The gzip file is streamed as is (FileResponse, so servers can sendfile
+    it) to clients accepting gzip and inflated for the others.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        path = self.snapshot_path(request)
+        if path is None:
+            return self.get_response(request)
+
+        try:
+            handle = open(path, "rb")
+        except OSError:
+            # Swapped out or never built: render it the slow way
+            return self.get_response(request)
+
+        if "gzip" in request.headers.get("Accept-Encoding", ""):
+            response = FileResponse(handle, content_type="application/json")
+            response["Content-Encoding"] = "gzip"
+        else:
+            with handle:
+                response = HttpResponse(
+                    gzip.decompress(handle.read()), content_type="application/json"
+                )
+        response["Vary"] = "Accept, Accept-Encoding, Authorization"
+        response["X-Catalog-Snapshot"] = "hit"
+        return response
+
+    def snapshot_path(self, request):
+        if not settings.CATALOG_SNAPSHOTS_ENABLED:
+            return None
+        if request.method != "GET" or request.path != "/api/products/":
+            return None
+        if "Authorization" in request.headers:
+            return None
+        if "text/html" in request.headers.get("Accept", ""):
+            return None
+
+        params = request.GET
+        if set(params) - {"category", "ordering", "page"}:
+            return None
+        if any(len(params.getlist(name)) > 1 for name in params):
+            return None
+
+        scope = params.get("category", snapshots.ALL)
+        ordering = params.get("ordering", settings.CATALOG_SNAPSHOT_ORDERINGS[0])
+        page = params.get("page", "1")
+        if not _slug.match(scope) or (scope.startswith("_") and scope != snapshots.ALL):
+            return None
+        if ordering not in settings.CATALOG_SNAPSHOT_ORDERINGS:
+            return None
+        if not page.isdigit() or page != str(int(page)) or page == "0":
+            return None
+        if snapshots.is_dirty(scope):
+            return None
+        return snapshots.page_path(scope, ordering, page)
@@ -1,15 +1,127 @@
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Concat, Substr
 from django.utils.text import slugify
 
 
+def category_path_segment(pk):
+    """Fixed-width path segment, so ordering by path yields tree order."""
+    return f"{pk:08d}/"
+
+
 class Category(models.Model):
+    """
+    Product category, optionally nested under a parent category.
+
+    `path` is a materialized path made of the ids of every ancestor and the
+    category itself (e.g. "00000001/00000004/"). Every descendant's path
+    starts with it, so a whole subtree is one indexed prefix (range) query.
+    `path` and `depth` are maintained on save; run
+    `manage.py rebuild_category_paths` after writing parents in bulk.
+    """
+
     name = models.CharField(max_length=200)
     slug = models.SlugField(unique=True, blank=True)
+    parent = models.ForeignKey(
+        "self",
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name="children",
+    )
+    path = models.CharField(max_length=255, db_index=True, editable=False, blank=True)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    def creates_cycle(self, parent):
+        """Return True if nesting this category under `parent` forms a loop."""
+        if self.pk is None or parent is None:
+            return False
+        return category_path_segment(self.pk)[:-1] in parent.path.split("/")
+
+    def clean(self):
+        if self.creates_cycle(self.parent):
+            raise ValidationError(
+                {"parent": "A category cannot be nested under itself or its descendants."}
+            )
 
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
-        super().save(*args, **kwargs)
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self._update_path()
+
+    def _update_path(self):
+        """Recompute this category's path and move its subtree if it changed."""
+        old_path = (
+            Category.objects.filter(pk=self.pk).values_list("path", flat=True).first()
+        )
+        parent_path = ""
+        if self.parent_id:
+            parent_path = (
+                Category.objects.filter(pk=self.parent_id)
+                .values_list("path", flat=True)
+                .get()
+            )
+        new_path = parent_path + category_path_segment(self.pk)
+        new_depth = new_path.count("/") - 1
+
+        if old_path and new_path != old_path and new_path.startswith(old_path):
+            raise ValidationError(
+                {"parent": "A category cannot be nested under itself or its descendants."}
+            )
+
+        if new_path != old_path:
+            if old_path:
+                Category.objects.filter(path__startswith=old_path).exclude(
+                    pk=self.pk
+                ).update(
+                    path=Concat(Value(new_path), Substr("path", len(old_path) + 1)),
+                    depth=F("depth") + (new_depth - (old_path.count("/") - 1)),
+                )
+            Category.objects.filter(pk=self.pk).update(path=new_path, depth=new_depth)
+
+        self.path = new_path
+        self.depth = new_depth
+
+    def get_descendants(self, include_self=True):
+        queryset = Category.objects.filter(path__startswith=self.path)
+        if not include_self:
+            queryset = queryset.exclude(pk=self.pk)
+        return queryset
+
+    @classmethod
+    def rebuild_paths(cls, batch_size=500):
+        """
+        Recompute every path and depth from the parent links.
+
+        Returns a tuple (updated, orphaned) where `orphaned` lists the ids of
+        categories unreachable from any root (i.e. parent cycles).
+        """
+        rows = list(cls.objects.values_list("id", "parent_id", "path", "depth"))
+        children = {}
+        for pk, parent_id, _, _ in rows:
+            children.setdefault(parent_id, []).append(pk)
+
+        computed = {}
+        stack = [(pk, "") for pk in children.get(None, [])]
+        while stack:
+            pk, parent_path = stack.pop()
+            path = parent_path + category_path_segment(pk)
+            computed[pk] = path
+            stack.extend((child, path) for child in children.get(pk, []))
+
+        changed = [
+            cls(id=pk, path=computed[pk], depth=computed[pk].count("/") - 1)
+            for pk, _, path, depth in rows
+            if pk in computed and (path, depth) != (computed[pk], computed[pk].count("/") - 1)
+        ]
+        cls.objects.bulk_update(changed, ["path", "depth"], batch_size=batch_size)
+
+        orphaned = [pk for pk, _, _, _ in rows if pk not in computed]
+        return len(changed), orphaned
 
     def __str__(self):
         return self.name
@@ -25,6 +137,9 @@ class Product(models.Model):
     sku = models.CharField(max_length=50, blank=True)
     image = models.ImageField(upload_to="products/", blank=True)
     is_active = models.BooleanField(default=True)
+    # 0 keeps `stock` authoritative. N > 0 splits it over N StockShard rows
+    # (see products.inventory) and `stock` becomes their derived sum.
+    stock_shards = models.PositiveSmallIntegerField(default=0)
 
     def save(self, *args, **kwargs):
         if not self.slug:
@@ -33,3 +148,157 @@ class Product(models.Model):
 
     def __str__(self):
         return self.name
+
+
+class StockShard(models.Model):
+    """
+    One slice of a hot product's stock.
+
+    Checkouts decrement a random shard instead of the product row, so
+    concurrent orders for the same product rarely wait on the same lock.
+
+    Fields:
+        product (ForeignKey): The sharded product.
+        index (PositiveSmallInteger): Shard number, 0 to stock_shards - 1.
+        quantity (PositiveInteger): Units held by this shard.
+    """
+
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="stock_shard_rows"
+    )
+    index = models.PositiveSmallIntegerField()
+    quantity = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product", "index"], name="unique_stock_shard_index"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}[{self.index}] = {self.quantity}"
+
+
+class ProductSalesStats(models.Model):
+    """
+    Precomputed sales figures for one product (see products.sales).
+
+    Totals are adjusted incrementally when an order enters or leaves the sold
+    statuses; the rolling windows are recomputed from ProductSalesDay.
+
+    Fields:
+        product (OneToOne): The product, also the primary key.
+        units_sold / revenue: All-time net units and revenue.
+        last_sold_at (DateTime): Payment time of the latest sale.
+        units_7d / revenue_7d / units_30d / revenue_30d: Rolling windows,
+            today included.
+    """
+
+    product = models.OneToOneField(
+        Product, on_delete=models.CASCADE, primary_key=True, related_name="sales_stats"
+    )
+    units_sold = models.IntegerField(default=0, db_index=True)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    last_sold_at = models.DateTimeField(null=True, blank=True)
+    units_7d = models.IntegerField(default=0, db_index=True)
+    revenue_7d = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    units_30d = models.IntegerField(default=0, db_index=True)
+    revenue_30d = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.product_id}: {self.units_sold} sold"
+
+
+class ProductSalesDay(models.Model):
+    """Net units and revenue of one product for one (local) day."""
+
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="sales_days"
+    )
+    day = models.DateField(db_index=True)
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product", "day"], name="unique_product_sales_day"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} {self.day}: {self.units}"
+
+
+class ProductPair(models.Model):
+    """
+    Number of sold orders containing both `product` and `other`.
+
+    Stored in both directions so a product's neighbours are one index range.
+    Maintained by products.recommendations.
+    """
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+    other = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+    orders = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product", "other"], name="unique_product_pair"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} + {self.other_id}: {self.orders}"
+
+
+class RelatedProduct(models.Model):
+    """
+    One of the top-K products most often bought together with `product`.
+
+    Fields:
+        product (ForeignKey): The product being viewed.
+        related (ForeignKey): The recommended product.
+        rank (PositiveSmallInteger): 1 for the strongest neighbour.
+        score (PositiveInteger): Orders containing both products.
+    """
+
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="related_rows"
+    )
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+    rank = models.PositiveSmallIntegerField()
+    score = models.PositiveIntegerField()
+
+    class Meta:
+        ordering = ["product", "rank"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product", "rank"], name="unique_related_product_rank"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} #{self.rank}: {self.related_id}"
+
+
+class RelatedProductsBuild(models.Model):
+    """
+    One run of `build_related_products`. The latest run's `orders_until`
+    is where the next incremental update resumes.
+    """
+
+    full = models.BooleanField(default=False)
+    orders_until = models.DateTimeField()
+    orders = models.PositiveIntegerField(default=0)
+    finished_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        get_latest_by = "orders_until"
+
+    def __str__(self):
+        kind = "full" if self.full else "incremental"
+        return f"{kind} build up to {self.orders_until}"
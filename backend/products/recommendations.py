@@ -0,0 +1,152 @@
+"""
+"Frequently bought together" recommendations.
+
+Baskets (the distinct product ids of one sold order) are turned into a
+sparse product x product co-occurrence matrix: with B the orders x products
+incidence matrix, C = Bᵀ·B counts, for every pair, the orders containing
+both. NumPy/SciPy do this in a couple of vectorized operations when they are
+installed; a pure Python counter is used otherwise.
+
+Pair counts are kept in ProductPair so new orders can be folded in without
+recounting the whole history; only the products touched by a batch get their
+top-K RelatedProduct rows recomputed.
+"""
+
+from collections import Counter
+from itertools import permutations
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from .models import ProductPair, RelatedProduct
+
+try:  # NumPy/SciPy are optional and only speed up large builds
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # pragma: no cover
+    np = sparse = None
+
+
+def cooccurrence(baskets):
+    """
+    Return {(product_id, other_id): orders} for every ordered pair of
+    distinct products sharing at least one basket.
+    """
+    baskets = [sorted(set(basket)) for basket in baskets]
+    baskets = [basket for basket in baskets if len(basket) > 1]
+    if not baskets:
+        return {}
+    if sparse is None:
+        return _cooccurrence_python(baskets)
+    return _cooccurrence_sparse(baskets)
+
+
+def _cooccurrence_python(baskets):
+    counts = Counter()
+    for basket in baskets:
+        counts.update(permutations(basket, 2))
+    return dict(counts)
+
+
+def _cooccurrence_sparse(baskets):
+    ids = np.unique(np.fromiter((pk for b in baskets for pk in b), dtype=np.int64))
+    sizes = np.fromiter((len(b) for b in baskets), dtype=np.int64, count=len(baskets))
+    rows = np.repeat(np.arange(len(baskets)), sizes)
+    cols = np.searchsorted(
+        ids, np.fromiter((pk for b in baskets for pk in b), dtype=np.int64)
+    )
+    incidence = sparse.csr_matrix(
+        (np.ones(len(cols), dtype=np.int32), (rows, cols)),
+        shape=(len(baskets), len(ids)),
+    )
+
+    matrix = (incidence.T @ incidence).tocoo()
+    off_diagonal = matrix.row != matrix.col
+    return dict(
+        zip(
+            zip(
+                ids[matrix.row[off_diagonal]].tolist(),
+                ids[matrix.col[off_diagonal]].tolist(),
+            ),
+            matrix.data[off_diagonal].tolist(),
+        )
+    )
+
+
+def rebuild_pairs(baskets, batch_size=1000):
+    """Replace every pair count with the ones from `baskets`."""
+    counts = cooccurrence(baskets)
+    with transaction.atomic():
+        ProductPair.objects.all().delete()
+        ProductPair.objects.bulk_create(
+            [
+                ProductPair(product_id=a, other_id=b, orders=n)
+                for (a, b), n in counts.items()
+            ],
+            batch_size=batch_size,
+        )
+        RelatedProduct.objects.all().delete()
+        refresh_related({a for a, _ in counts})
+    return counts
+
+
+def add_baskets(baskets, batch_size=1000):
+    """Fold the baskets of newly sold orders into the stored pair counts."""
+    counts = cooccurrence(baskets)
+    if not counts:
+        return counts
+    touched = {a for a, _ in counts}
+
+    with transaction.atomic():
+        existing = {
+            (pair.product_id, pair.other_id): pair
+            for pair in ProductPair.objects.select_for_update().filter(
+                product_id__in=touched, other_id__in=touched
+            )
+        }
+        to_create, to_update = [], []
+        for (a, b), n in counts.items():
+            pair = existing.get((a, b))
+            if pair is None:
+                to_create.append(ProductPair(product_id=a, other_id=b, orders=n))
+            else:
+                pair.orders += n
+                to_update.append(pair)
+        ProductPair.objects.bulk_create(to_create, batch_size=batch_size)
+        ProductPair.objects.bulk_update(to_update, ["orders"], batch_size=batch_size)
+        refresh_related(touched)
+    return counts
+
+
+def refresh_related(product_ids, top_k=None, chunk_size=500):
+    """Recompute the top-K RelatedProduct rows of the given products."""
+    top_k = top_k or settings.RELATED_PRODUCTS_TOP_K
+    product_ids = sorted(product_ids)
+    for start in range(0, len(product_ids), chunk_size):
+        _refresh_related_chunk(product_ids[start : start + chunk_size], top_k)
+
+
+def _refresh_related_chunk(product_ids, top_k):
+    ranked = (
+        ProductPair.objects.filter(product_id__in=product_ids)
+        .annotate(
+            rank=Window(
+                RowNumber(),
+                partition_by=F("product_id"),
+                order_by=[F("orders").desc(), F("other_id").asc()],
+            )
+        )
+        .filter(rank__lte=top_k)
+        .values_list("product_id", "other_id", "rank", "orders")
+    )
+    with transaction.atomic():
+        RelatedProduct.objects.filter(product_id__in=product_ids).delete()
+        RelatedProduct.objects.bulk_create(
+            [
+                RelatedProduct(product_id=a, related_id=b, rank=rank, score=n)
+                for a, b, rank, n in ranked
+            ],
+            batch_size=1000,
+        )
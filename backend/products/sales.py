@@ -0,0 +1,162 @@
+"""
+Precomputed per-product sales statistics.
+
+Every sale or refund adjusts one ProductSalesDay row and the product's
+ProductSalesStats totals with `F()` updates, so the product list can order
+and filter on best sellers without aggregating order items. The rolling
+7/30-day windows are re-summed from the (at most 30) day rows of the
+touched products; `refresh_sales_stats` does the same for every product
+once a day so windows also slide when nothing is sold.
+"""
+
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from . import snapshots
+from .cache import forget_products
+from .models import ProductSalesDay, ProductSalesStats
+
+WINDOWS = (7, 30)
+
+# Annotation name -> (ProductSalesStats field, value for never sold products)
+SALES_FIELDS = {
+    "units_sold": ("units_sold", 0),
+    "sales_revenue": ("revenue", Decimal("0")),
+    "units_7d": ("units_7d", 0),
+    "revenue_7d": ("revenue_7d", Decimal("0")),
+    "units_30d": ("units_30d", 0),
+    "revenue_30d": ("revenue_30d", Decimal("0")),
+}
+
+
+def with_sales_stats(queryset):
+    """
+    Annotate products with their sales statistics through a single LEFT
+    JOIN, so they can be rendered, filtered and ordered on.
+    """
+    return queryset.annotate(
+        last_sold_at=F("sales_stats__last_sold_at"),
+        **{
+            name: Coalesce(f"sales_stats__{field}", Value(empty))
+            for name, (field, empty) in SALES_FIELDS.items()
+        },
+    )
+
+
+def record_sales(lines, sold_at, sign=1):
+    """
+    Add (`sign=1`) or remove (`sign=-1`, refunds) `(product_id, units,
+    revenue)` lines sold at `sold_at`.
+
+    Refunds are booked on the day of the original sale so daily and
+    rolling figures stay net.
+    """
+    lines = list(lines)
+    day = timezone.localdate(sold_at)
+    with transaction.atomic():
+        for product_id, units, revenue in sorted(lines):
+            units, revenue = sign * units, sign * revenue
+            _add_day(product_id, day, units, revenue)
+            _add_totals(product_id, units, revenue, sold_at if sign > 0 else None)
+        product_ids = [product_id for product_id, _, _ in lines]
+        refresh_windows(product_ids)
+        # Serialized products carry these figures, snapshot pages are
+        # ordered by them
+        transaction.on_commit(lambda: _forget(product_ids))
+
+
+def _forget(product_ids):
+    forget_products(product_ids)
+    snapshots.mark_products_dirty(product_ids)
+
+
+def _add_day(product_id, day, units, revenue):
+    rows = ProductSalesDay.objects.filter(product_id=product_id, day=day)
+    changes = {"units": F("units") + units, "revenue": F("revenue") + revenue}
+    if rows.update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            ProductSalesDay.objects.create(
+                product_id=product_id, day=day, units=units, revenue=revenue
+            )
+    except IntegrityError:
+        # Created concurrently since our UPDATE
+        rows.update(**changes)
+
+
+def _add_totals(product_id, units, revenue, sold_at):
+    rows = ProductSalesStats.objects.filter(product_id=product_id)
+    changes = {
+        "units_sold": F("units_sold") + units,
+        "revenue": F("revenue") + revenue,
+        "updated_at": timezone.now(),
+    }
+    if sold_at is not None:
+        changes["last_sold_at"] = Greatest(
+            Coalesce("last_sold_at", Value(sold_at)), Value(sold_at)
+        )
+    if rows.update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            ProductSalesStats.objects.create(
+                product_id=product_id,
+                units_sold=units,
+                revenue=revenue,
+                last_sold_at=sold_at,
+            )
+    except IntegrityError:
+        rows.update(**changes)
+
+
+def refresh_windows(product_ids=None, today=None, batch_size=500):
+    """
+    Recompute the rolling windows from the day rows, for the given products
+    or (without ids) for every product that has stats. Returns the number of
+    rows changed.
+    """
+    today = today or timezone.localdate()
+    since = {days: today - timedelta(days=days - 1) for days in WINDOWS}
+
+    days = ProductSalesDay.objects.filter(day__gte=since[30], day__lte=today)
+    stats = ProductSalesStats.objects.order_by("product_id")
+    if product_ids is not None:
+        days = days.filter(product_id__in=product_ids)
+        stats = stats.filter(product_id__in=product_ids)
+
+    sums = {
+        row.pop("product_id"): row
+        for row in days.values("product_id").annotate(
+            units_7d=Sum("units", filter=Q(day__gte=since[7])),
+            revenue_7d=Sum("revenue", filter=Q(day__gte=since[7])),
+            units_30d=Sum("units"),
+            revenue_30d=Sum("revenue"),
+        )
+    }
+
+    fields = ["units_7d", "revenue_7d", "units_30d", "revenue_30d"]
+    changed = []
+    for row in stats.only("product_id", *fields).iterator():
+        values = sums.get(row.product_id, {})
+        new = {
+            "units_7d": values.get("units_7d") or 0,
+            "revenue_7d": values.get("revenue_7d") or Decimal("0"),
+            "units_30d": values.get("units_30d") or 0,
+            "revenue_30d": values.get("revenue_30d") or Decimal("0"),
+        }
+        if any(getattr(row, name) != value for name, value in new.items()):
+            for name, value in new.items():
+                setattr(row, name, value)
+            changed.append(row)
+
+    ProductSalesStats.objects.bulk_update(changed, fields, batch_size=batch_size)
+    changed_ids = [row.product_id for row in changed]
+    if changed_ids:
+        transaction.on_commit(lambda: _forget(changed_ids))
+    return len(changed)
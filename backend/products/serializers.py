@@ -1,16 +1,126 @@
+from django.conf import settings
+from django.core.files.storage import default_storage
 from rest_framework import serializers
-from .models import Product, Category
+from .models import Product, Category, RelatedProduct
+
+
+def media_url(name):
+    """
+    Absolute URL of a stored file on settings.MEDIA_BASE_URL. Not taken from
+    the request: product representations are cached and shared by everyone.
+    """
+    if not name:
+        return None
+    return settings.MEDIA_BASE_URL.rstrip("/") + "/" + default_storage.url(name).lstrip("/")
+
+
+class MediaImageField(serializers.ImageField):
+    """ImageField rendered with media_url, on reads and writes alike."""
+
+    def to_representation(self, value):
+        return media_url(value.name if value else None)
 
 
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = "__all__"
+        read_only_fields = ["path", "depth"]
+
+    def validate_parent(self, value):
+        if self.instance is not None and self.instance.creates_cycle(value):
+            raise serializers.ValidationError(
+                "A category cannot be nested under itself or its descendants."
+            )
+        return value
+
+
+class CategoryTreeSerializer(serializers.ModelSerializer):
+    """
+    Nested category representation. `children` is filled in by the view
+    from a single path-ordered query, never through per-node lookups.
+    """
+
+    children = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Category
+        fields = ["id", "name", "slug", "depth", "children"]
+
+    def get_children(self, obj):
+        return CategoryTreeSerializer(
+            getattr(obj, "tree_children", []), many=True
+        ).data
 
 
 class ProductSerializer(serializers.ModelSerializer):
     category = CategorySerializer(read_only=True)
+    image = MediaImageField(required=False)
+
+    # Sales statistics, only rendered when the queryset was annotated
+    # with products.sales.with_sales_stats (the product endpoints). Unit
+    # counts are public; revenue is only in StaffProductSerializer.
+    units_sold = serializers.IntegerField(read_only=True)
+    last_sold_at = serializers.DateTimeField(read_only=True)
+    units_7d = serializers.IntegerField(read_only=True)
+    units_30d = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Product
         fields = "__all__"
+
+
+class StaffProductSerializer(ProductSerializer):
+    """ProductSerializer plus the revenue statistics, for admin users."""
+
+    sales_revenue = serializers.DecimalField(
+        max_digits=14, decimal_places=2, read_only=True
+    )
+    revenue_7d = serializers.DecimalField(
+        max_digits=14, decimal_places=2, read_only=True
+    )
+    revenue_30d = serializers.DecimalField(
+        max_digits=14, decimal_places=2, read_only=True
+    )
+
+
+class ProductAvailabilitySerializer(serializers.ModelSerializer):
+    """Just what a cart needs to refresh a product (batch lookup, compact)."""
+
+    class Meta:
+        model = Product
+        fields = ["id", "price", "stock", "is_active"]
+
+
+class ProductFragmentField(serializers.Field):
+    """
+    A related product rendered like ProductSerializer, taken from the
+    {product id: fragment} dict in context["product_fragments"] when the
+    view fetched them in bulk (products.fragments.get_fragments). Falls
+    back to serializing the related object the same way.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def get_attribute(self, instance):
+        fragments = self.context.get("product_fragments")
+        product_id = getattr(instance, f"{self.source}_id")
+        if fragments is not None and product_id in fragments:
+            return fragments[product_id]
+        product = super().get_attribute(instance)
+        return ProductSerializer(product).data
+
+    def to_representation(self, value):
+        return value
+
+
+class RelatedProductSerializer(serializers.ModelSerializer):
+    """A "frequently bought together" neighbour and how many orders had both."""
+
+    product = ProductFragmentField(source="related")
+
+    class Meta:
+        model = RelatedProduct
+        fields = ["rank", "score", "product"]
@@ -0,0 +1,56 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import snapshots
+from .cache import bump_catalog_version
+from .models import Category, Product
+from .suggest import index as suggest_index
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_catalog_cache(sender, **kwargs):
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=Product)
+def update_suggest_index(sender, instance, **kwargs):
+    transaction.on_commit(lambda: suggest_index.update(instance))
+
+
+@receiver(post_delete, sender=Product)
+def remove_from_suggest_index(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: suggest_index.remove(pk))
+
+
+@receiver(pre_save, sender=Product)
+def remember_snapshot_category(sender, instance, **kwargs):
+    # A product moving between categories changes both categories' pages
+    instance._snapshot_old_category_id = (
+        Product.objects.filter(pk=instance.pk).values_list("category_id", flat=True).first()
+        if instance.pk
+        else None
+    )
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def mark_snapshots_dirty(sender, instance, **kwargs):
+    category_ids = {
+        instance.category_id,
+        getattr(instance, "_snapshot_old_category_id", None),
+    } - {None}
+    transaction.on_commit(
+        lambda: snapshots.mark_dirty(snapshots.scopes_for_categories(category_ids))
+    )
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def mark_all_snapshots_dirty(sender, **kwargs):
+    # Renames and moves show up in every product's nested category
+    transaction.on_commit(lambda: snapshots.mark_dirty(snapshots.all_scopes()))
@@ -0,0 +1,196 @@
+"""
+Pre-rendered catalog pages.
+
+`build_catalog_snapshots` renders the anonymous product list
+(`ProductViewSet.list`) for every category (and the whole catalog) and every
+ordering in CATALOG_SNAPSHOT_ORDERINGS, page by page, into gzip files:
+
+    <CATALOG_SNAPSHOT_DIR>/<category slug or _all>/<ordering>/<page>.json.gz
+
+Each category directory is written next to the live one and swapped in with
+an atomic symlink rename, so readers never see half a category.
+
+Product and Category changes drop a dirty marker for the affected category
+pages (the product's old and new category, their ancestors and `_all`);
+the next build only re-renders those. Stock movements (products.inventory)
+and recorded sales (products.sales) do the same for their products, since
+pages show stock and can be ordered by units sold. CatalogSnapshotMiddleware
+serves a page straight from its file (no ORM, no DRF) unless its category is
+dirty. Run the builder often (every minute is cheap when nothing is dirty).
+
+Nothing is marked while CATALOG_SNAPSHOTS_ENABLED is off, so build with
+--all when switching snapshots on.
+"""
+
+import gzip
+import math
+import os
+import shutil
+import uuid
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from rest_framework.test import APIRequestFactory
+
+from .models import Category, Product
+
+ALL = "_all"
+DIRTY = "_dirty"
+
+
+def root():
+    return Path(settings.CATALOG_SNAPSHOT_DIR)
+
+
+def page_path(scope, ordering, page):
+    return root() / scope / ordering / f"{page}.json.gz"
+
+
+def is_dirty(scope):
+    return (root() / DIRTY / scope).exists()
+
+
+def _active():
+    # Disabled, or nothing built yet: nothing to invalidate
+    return settings.CATALOG_SNAPSHOTS_ENABLED and root().exists()
+
+
+def mark_dirty(scopes):
+    """Flag category scopes (slugs or ALL) for re-rendering."""
+    if not _active():
+        return
+    directory = root() / DIRTY
+    directory.mkdir(parents=True, exist_ok=True)
+    for scope in scopes:
+        (directory / scope).touch()
+
+
+def mark_products_dirty(product_ids):
+    """Flag the scopes listing these products (their stock or sales changed)."""
+    if not _active():
+        return
+    category_ids = set(
+        Product.objects.filter(id__in=product_ids).values_list("category_id", flat=True)
+    )
+    mark_dirty(scopes_for_categories(category_ids - {None}))
+
+
+def scopes_for_categories(category_ids):
+    """Scopes whose pages list products of these categories."""
+    paths = Category.objects.filter(id__in=category_ids).values_list("path", flat=True)
+    ancestor_ids = {int(segment) for path in paths for segment in path.split("/") if segment}
+    slugs = Category.objects.filter(id__in=ancestor_ids).values_list("slug", flat=True)
+    return {ALL, *slugs}
+
+
+def all_scopes():
+    return {ALL, *Category.objects.values_list("slug", flat=True)}
+
+
+def dirty_scopes():
+    directory = root() / DIRTY
+    if not directory.exists():
+        return set()
+    return {marker.name for marker in directory.iterdir()}
+
+
+def _render_page(view, factory, scope, ordering, page):
+    params = {"page": page}
+    # The default ordering is rendered without the parameter, like the live
+    # list, so next/previous links match
+    if ordering != settings.CATALOG_SNAPSHOT_ORDERINGS[0]:
+        params["ordering"] = ordering
+    if scope != ALL:
+        params["category"] = scope
+    base = urlsplit(settings.CATALOG_SNAPSHOT_BASE_URL)
+    request = factory.get(
+        "/api/products/",
+        params,
+        HTTP_HOST=base.netloc,
+        secure=base.scheme == "https",
+        HTTP_ACCEPT="application/json",
+    )
+    response = view(request)
+    response.render()
+    return response
+
+
+def build_scope(scope):
+    """
+    Render every page of every ordering of one scope and swap it in.
+    Returns the number of pages written.
+    """
+    # Imported here: views import this app's signals indirectly
+    from .views import ProductViewSet
+
+    # Clear the marker first: a change committed while we render re-creates
+    # it, so the scope stays dirty and is picked up by the next build
+    (root() / DIRTY / scope).unlink(missing_ok=True)
+
+    view = ProductViewSet.as_view({"get": "list"})
+    factory = APIRequestFactory()
+    staging = root() / f".{scope}.{uuid.uuid4().hex}"
+    written = 0
+
+    for ordering in settings.CATALOG_SNAPSHOT_ORDERINGS:
+        page, pages = 1, 1
+        while page <= pages:
+            response = _render_page(view, factory, scope, ordering, page)
+            if response.status_code != 200:
+                break
+            if page == 1:
+                page_size = len(response.data["results"]) or 1
+                pages = max(1, math.ceil(response.data["count"] / page_size))
+            target = staging / ordering / f"{page}.json.gz"
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_bytes(gzip.compress(response.content, mtime=0))
+            written += 1
+            page += 1
+
+    _swap(scope, staging)
+    return written
+
+
+def _swap(scope, staging):
+    """Point <root>/<scope> at `staging` atomically and drop the old tree."""
+    link = root() / scope
+    previous = os.path.realpath(link) if link.is_symlink() else None
+    if link.exists() and not link.is_symlink():
+        shutil.rmtree(link)
+
+    temporary_link = root() / f".{scope}.link.{uuid.uuid4().hex}"
+    os.symlink(staging.name, temporary_link)
+    os.replace(temporary_link, link)
+    if previous:
+        shutil.rmtree(previous, ignore_errors=True)
+
+
+def remove_scope(scope):
+    link = root() / scope
+    if link.is_symlink():
+        target = os.path.realpath(link)
+        link.unlink()
+        shutil.rmtree(target, ignore_errors=True)
+    (root() / DIRTY / scope).unlink(missing_ok=True)
+
+
+def build(full=False):
+    """
+    Rebuild dirty and missing scopes (every scope with `full=True`), drop
+    scopes of deleted categories. Returns {scope: pages written}.
+    """
+    root().mkdir(parents=True, exist_ok=True)
+    wanted = all_scopes()
+    existing = {
+        entry.name for entry in root().iterdir() if not entry.name.startswith((".", DIRTY))
+    }
+
+    for scope in existing - wanted:
+        remove_scope(scope)
+
+    if full:
+        todo = wanted
+    else:
+        todo = (dirty_scopes() & wanted) | (wanted - existing)
+    return {scope: build_scope(scope) for scope in sorted(todo)}
@@ -0,0 +1,201 @@
+"""
+In-process prefix index for search-as-you-type suggestions.
+
+Every active product contributes a few normalized terms (its full name, each
+later word of the name, its SKU) to one sorted list of `(term, rank,
+product_id)` tuples. A lookup is a `bisect` to the first term >= the query
+followed by a short forward scan while terms still start with it, so it never
+touches the database.
+
+The index is built on first use (and warmed when the WSGI/ASGI application
+starts) and patched in place by the Product signals after each commit; a
+patch adopts the catalog version its own save produced. At most every
+PRODUCT_SUGGEST_REFRESH_SECONDS a lookup compares that version with the
+shared one, and when another process changed products a background thread
+rebuilds the index while lookups keep using the current one.
+
+Patches insert into and delete from the live sorted list under the lock (a
+C-level memmove, instead of copying the list and payloads on every save),
+so lookups hold the lock for their short bisect-and-scan too.
+"""
+
+import bisect
+import re
+import threading
+import time
+import unicodedata
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+
+from .cache import get_catalog_version
+from .models import Product
+
+# Rank of a term: full name matches first, then word and SKU matches
+NAME, WORD, SKU = 0, 1, 2
+
+_separators = re.compile(r"[^\w]+")
+
+
+def normalize(text):
+    """Lowercase, strip accents and collapse punctuation to single spaces."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return _separators.sub(" ", text.lower()).strip()
+
+
+def product_terms(name, sku):
+    name = normalize(name)
+    terms = set()
+    if name:
+        terms.add((name, NAME))
+        words = name.split(" ")
+        for index in range(1, len(words)):
+            terms.add((" ".join(words[index:]), WORD))
+    sku = normalize(sku)
+    if sku:
+        terms.add((sku, SKU))
+    return terms
+
+
+class PrefixIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = []  # sorted (term, rank, product_id)
+        self._terms = {}  # product_id -> its entries
+        self._products = {}  # product_id -> suggestion payload
+        self._version = None
+        self._checked_at = 0.0
+        self._rebuild = None  # background rebuild thread, while it runs
+
+    @property
+    def ready(self):
+        return self._version is not None
+
+    def build(self):
+        """(Re)build the whole index from the database."""
+        version = get_catalog_version()
+        entries, terms, products = [], {}, {}
+        rows = Product.objects.filter(is_active=True).values_list(
+            "id", "name", "slug", "sku"
+        )
+        for pk, name, slug, sku in rows.iterator(chunk_size=2000):
+            own = [(term, rank, pk) for term, rank in product_terms(name, sku)]
+            entries.extend(own)
+            terms[pk] = own
+            products[pk] = {"id": pk, "name": name, "slug": slug, "sku": sku}
+        entries.sort()
+
+        with self._lock:
+            self._entries, self._terms, self._products = entries, terms, products
+            self._version = version
+            self._checked_at = time.monotonic()
+
+    def update(self, product):
+        """Re-index one product (or drop it when it is inactive)."""
+        with self._lock:
+            if not self.ready:
+                return
+            self._discard(product.pk)
+            if product.is_active:
+                own = [
+                    (term, rank, product.pk)
+                    for term, rank in product_terms(product.name, product.sku)
+                ]
+                for entry in own:
+                    bisect.insort(self._entries, entry)
+                self._terms[product.pk] = own
+                self._products[product.pk] = {
+                    "id": product.pk,
+                    "name": product.name,
+                    "slug": product.slug,
+                    "sku": product.sku,
+                }
+            # The save being applied bumped the version: it is not a reason
+            # to rebuild
+            self._version = get_catalog_version()
+
+    def remove(self, product_id):
+        with self._lock:
+            if self.ready:
+                self._discard(product_id)
+                self._version = get_catalog_version()
+
+    def _discard(self, product_id):
+        """Drop one product's entries and payload; call with the lock held."""
+        for entry in self._terms.pop(product_id, []):
+            position = bisect.bisect_left(self._entries, entry)
+            if position < len(self._entries) and self._entries[position] == entry:
+                del self._entries[position]
+        self._products.pop(product_id, None)
+
+    def _refresh_if_stale(self):
+        if not self.ready:
+            self.build()
+            return
+        now = time.monotonic()
+        if now - self._checked_at < settings.PRODUCT_SUGGEST_REFRESH_SECONDS:
+            return
+        self._checked_at = now
+        if get_catalog_version() == self._version:
+            return
+        with self._lock:
+            if self._rebuild is not None:
+                return
+            self._rebuild = threading.Thread(
+                target=self._rebuild_in_background, name="suggest-rebuild", daemon=True
+            )
+        self._rebuild.start()
+
+    def _rebuild_in_background(self):
+        try:
+            self.build()
+        except DatabaseError:
+            # Keep serving the current index; the next check retries
+            pass
+        finally:
+            connection.close()
+            with self._lock:
+                self._rebuild = None
+
+    def suggest(self, query, limit=10):
+        """Products with a term starting with `query`, best matches first."""
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        self._refresh_if_stale()
+
+        # Scan a bounded window so one-letter queries stay cheap
+        window = limit * 4
+        found = []
+        with self._lock:
+            entries, products = self._entries, self._products
+            position = bisect.bisect_left(entries, (prefix,))
+            while position < len(entries) and len(found) < window:
+                term, rank, pk = entries[position]
+                if not term.startswith(prefix):
+                    break
+                found.append((rank, term, pk))
+                position += 1
+
+            results, seen = [], set()
+            for _, _, pk in sorted(found):
+                if pk in seen or pk not in products:
+                    continue
+                seen.add(pk)
+                results.append(products[pk])
+                if len(results) == limit:
+                    break
+        return results
+
+
+index = PrefixIndex()
+
+
+def warm_up():
+    """Build the index now; called when the web application starts."""
+    try:
+        index.build()
+    except DatabaseError:
+        # Tables missing (fresh checkout, migrations pending): build lazily
+        pass
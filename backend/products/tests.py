@@ -1,3 +1,668 @@
-from django.test import TestCase
+import gzip
+import json
+import shutil
+import tempfile
+import threading
+from io import StringIO
+from unittest.mock import patch
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from . import snapshots
+from .cache import bump_catalog_version
+from .fragments import get_fragments
+from .inventory import InsufficientStock, deduct_stock, reshard, restock
+from .models import Category, Product, StockShard
+from .sales import record_sales
+from .serializers import ProductSerializer
+from .suggest import index as suggest_index
+
+User = get_user_model()
+
+
+class ProductFacetTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.shoes = Category.objects.create(name="Shoes")
+        self.hats = Category.objects.create(name="Hats")
+        Product.objects.create(name="Runner", price=30, stock=5, category=self.shoes)
+        Product.objects.create(name="Boot", price=120, stock=5, category=self.shoes)
+        Product.objects.create(name="Cap", price=15, stock=5, category=self.hats)
+
+    def test_list_without_facets_is_unchanged(self):
+        resp = self.client.get("/api/products/")
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotIn("facets", resp.data)
+
+    def test_facets_follow_filters(self):
+        resp = self.client.get("/api/products/?facets=category,price&min_price=20")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data["count"], 2)
+
+        categories = resp.data["facets"]["category"]
+        self.assertEqual(categories, [{"slug": "shoes", "name": "Shoes", "count": 2}])
+
+        price = {(b["min"], b["max"]): b["count"] for b in resp.data["facets"]["price"]}
+        self.assertEqual(price[(25, 50)], 1)
+        self.assertEqual(price[(100, 250)], 1)
+        self.assertEqual(sum(price.values()), 2)
+
+    def test_facets_are_cached_until_catalog_changes(self):
+        url = "/api/products/?facets=category"
+        self.client.get(url)
+        with self.assertNumQueries(2):  # count + page, no facet query
+            self.client.get(url + "&page=1")
+
+        Product.objects.create(name="Beanie", price=10, stock=1, category=self.hats)
+        resp = self.client.get(url)
+        counts = {c["slug"]: c["count"] for c in resp.data["facets"]["category"]}
+        self.assertEqual(counts, {"shoes": 2, "hats": 2})
+
+    def test_unknown_facet_is_rejected(self):
+        resp = self.client.get("/api/products/?facets=color")
+        self.assertEqual(resp.status_code, 400)
+
+
+class CategoryTreeTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.clothing = Category.objects.create(name="Clothing")
+        self.shoes = Category.objects.create(name="Shoes", parent=self.clothing)
+        self.boots = Category.objects.create(name="Boots", parent=self.shoes)
+        self.books = Category.objects.create(name="Books")
+
+        Product.objects.create(name="Shirt", price=20, category=self.clothing)
+        Product.objects.create(name="Sneaker", price=50, category=self.shoes)
+        Product.objects.create(name="Chelsea", price=90, category=self.boots)
+        Product.objects.create(name="Novel", price=10, category=self.books)
+
+    def test_paths_and_depth(self):
+        self.assertEqual(self.boots.depth, 2)
+        self.assertTrue(self.boots.path.startswith(self.shoes.path))
+        self.assertTrue(self.shoes.path.startswith(self.clothing.path))
+
+    def test_category_filter_includes_descendants(self):
+        resp = self.client.get("/api/products/?category=clothing")
+        names = sorted(p["name"] for p in resp.data["results"])
+        self.assertEqual(names, ["Chelsea", "Shirt", "Sneaker"])
+
+        resp = self.client.get("/api/products/?category=SHOES")
+        names = sorted(p["name"] for p in resp.data["results"])
+        self.assertEqual(names, ["Chelsea", "Sneaker"])
+
+        resp = self.client.get("/api/products/?category=missing")
+        self.assertEqual(resp.data["count"], 0)
+
+    def test_moving_a_category_moves_its_subtree(self):
+        self.shoes.parent = self.books
+        self.shoes.save()
+
+        self.boots.refresh_from_db()
+        self.assertTrue(self.boots.path.startswith(self.books.path))
+        self.assertEqual(self.boots.depth, 2)
+
+        resp = self.client.get("/api/products/?category=books")
+        self.assertEqual(resp.data["count"], 3)
+
+    def test_tree_endpoint(self):
+        with self.assertNumQueries(1):
+            resp = self.client.get("/api/categories/tree/")
+        self.assertEqual(resp.status_code, 200)
+        roots = {node["slug"]: node for node in resp.data}
+        self.assertEqual(set(roots), {"clothing", "books"})
+        shoes = roots["clothing"]["children"][0]
+        self.assertEqual(shoes["slug"], "shoes")
+        self.assertEqual(shoes["children"][0]["slug"], "boots")
+
+        resp = self.client.get("/api/categories/tree/?root=shoes")
+        self.assertEqual([n["slug"] for n in resp.data], ["shoes"])
+
+    def test_parent_filter(self):
+        resp = self.client.get("/api/categories/", {"parent": "root"})
+        self.assertEqual(
+            sorted(c["slug"] for c in resp.data["results"]), ["books", "clothing"]
+        )
+        resp = self.client.get("/api/categories/", {"parent": self.shoes.id})
+        self.assertEqual([c["slug"] for c in resp.data["results"]], ["boots"])
+        resp = self.client.get("/api/categories/", {"parent": "abc"})
+        self.assertEqual(resp.status_code, 400)
+
+    def test_deleting_a_category_with_children_is_refused(self):
+        admin = User.objects.create_user(username="admin", password="x", is_staff=True)
+        self.client.force_authenticate(admin)
+        resp = self.client.delete(f"/api/categories/{self.shoes.id}/")
+        self.assertEqual(resp.status_code, 409)
+        self.assertTrue(Category.objects.filter(pk=self.shoes.pk).exists())
+
+        resp = self.client.delete(f"/api/categories/{self.boots.id}/")
+        self.assertEqual(resp.status_code, 204)
+
+    def test_cycle_is_rejected(self):
+        admin = User.objects.create_user(username="admin", password="x", is_staff=True)
+        self.client.force_authenticate(admin)
+        resp = self.client.patch(
+            f"/api/categories/{self.clothing.id}/", {"parent": self.boots.id}, format="json"
+        )
+        self.assertEqual(resp.status_code, 400)
+
+    def test_rebuild_paths(self):
+        Category.objects.update(path="", depth=0)
+        call_command("rebuild_category_paths", stdout=StringIO())
+        self.boots.refresh_from_db()
+        self.assertEqual(self.boots.depth, 2)
+        self.assertTrue(self.boots.path.startswith(self.clothing.path))
+
+
+class StockShardTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(
+            name="Flash Deal", price=5, stock=10, stock_shards=4
+        )
+        reshard(self.product)
+
+    def shard_quantities(self):
+        return list(
+            StockShard.objects.filter(product=self.product)
+            .order_by("index")
+            .values_list("quantity", flat=True)
+        )
+
+    def test_reshard_spreads_stock(self):
+        self.assertEqual(self.shard_quantities(), [3, 3, 2, 2])
+
+    def test_deduct_rebalances_when_no_shard_is_big_enough(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                deduct_stock([(self.product, 7)])
+
+        self.assertEqual(sum(self.shard_quantities()), 3)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 3)
+
+    def test_deduct_beyond_total_raises(self):
+        with self.assertRaises(InsufficientStock) as ctx:
+            with transaction.atomic():
+                deduct_stock([(self.product, 6), (self.product, 5)])
+        self.assertEqual(ctx.exception.available, 10)
+        self.assertEqual(sum(self.shard_quantities()), 10)
+
+    def test_restock_and_unshard(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            restock([(self.product, 5)])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 15)
+
+        self.product.stock_shards = 0
+        self.product.save()
+        reshard(self.product)
+        self.assertFalse(StockShard.objects.filter(product=self.product).exists())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 15)
+
+
+class ProductSuggestTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.tent = Product.objects.create(
+            name="Trail Tent 2P", price=199, stock=3, slug="trail-tent", sku="TT-200"
+        )
+        self.torch = Product.objects.create(
+            name="Tórch Lamp", price=20, stock=3, slug="torch-lamp", sku="LMP-1"
+        )
+        Product.objects.create(
+            name="Hidden Tarp", price=10, stock=3, slug="tarp", is_active=False
+        )
+        suggest_index.build()
+
+    def suggest(self, query, **params):
+        resp = self.client.get("/api/products/suggest/", {"q": query, **params})
+        self.assertEqual(resp.status_code, 200)
+        return [row["slug"] for row in resp.data]
+
+    def test_prefix_matches_names_words_and_skus(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(self.suggest("t"), ["torch-lamp", "trail-tent"])
+        self.assertEqual(self.suggest("TORCH"), ["torch-lamp"])
+        self.assertEqual(self.suggest("lamp"), ["torch-lamp"])
+        self.assertEqual(self.suggest("tt-2"), ["trail-tent"])
+        self.assertEqual(self.suggest("tarp"), [])
+        self.assertEqual(self.suggest("t", limit=1), ["torch-lamp"])
+        self.assertEqual(self.suggest(""), [])
+
+    def test_full_name_matches_rank_first(self):
+        Product.objects.create(name="Lamp Oil", price=5, stock=1, slug="lamp-oil")
+        suggest_index.build()
+        self.assertEqual(self.suggest("lamp"), ["lamp-oil", "torch-lamp"])
+
+    def test_index_follows_product_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tent.name = "Summit Tent"
+            self.tent.save()
+        self.assertEqual(self.suggest("trail"), [])
+        self.assertEqual(self.suggest("summit"), ["trail-tent"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            stove = Product.objects.create(
+                name="Stove", price=30, stock=1, slug="stove"
+            )
+        self.assertEqual(self.suggest("sto"), ["stove"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            stove.delete()
+            self.torch.is_active = False
+            self.torch.save()
+        self.assertEqual(self.suggest("sto"), [])
+        self.assertEqual(self.suggest("torch"), [])
+
+    def test_local_saves_do_not_trigger_a_rebuild(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tent.name = "Summit Tent"
+            self.tent.save()
+
+        suggest_index._checked_at = 0.0
+        with patch.object(suggest_index, "build") as build:
+            self.assertEqual(self.suggest("summit"), ["trail-tent"])
+        build.assert_not_called()
+
+    def test_stale_index_is_rebuilt_in_the_background(self):
+        bump_catalog_version()  # another process changed the catalog
+        suggest_index._checked_at = 0.0
+        finish = threading.Event()
+        with patch.object(suggest_index, "build", side_effect=finish.wait) as build:
+            # The current index answers while the rebuild runs
+            self.assertEqual(self.suggest("torch"), ["torch-lamp"])
+            rebuild = suggest_index._rebuild
+            self.assertIsNotNone(rebuild)
+            finish.set()
+            rebuild.join()
+        build.assert_called_once_with()
+        self.assertIsNone(suggest_index._rebuild)
+
+
+class CatalogSnapshotTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings_override = override_settings(
+            CATALOG_SNAPSHOTS_ENABLED=True,
+            CATALOG_SNAPSHOT_DIR=directory,
+            CATALOG_SNAPSHOT_BASE_URL="http://testserver",
+            CATALOG_SNAPSHOT_ORDERINGS=["name", "-price"],
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.outdoor = Category.objects.create(name="Outdoor", slug="outdoor")
+        self.camping = Category.objects.create(
+            name="Camping", slug="camping", parent=self.outdoor
+        )
+        self.kitchen = Category.objects.create(name="Kitchen", slug="kitchen")
+        for index in range(12):
+            Product.objects.create(
+                name=f"Tent {index:02}",
+                slug=f"tent-{index}",
+                price=100 + index,
+                stock=5,
+                category=self.camping,
+            )
+        self.pan = Product.objects.create(
+            name="Pan", slug="pan", price=30, stock=5, category=self.kitchen
+        )
+
+    def live(self, params):
+        with self.settings(CATALOG_SNAPSHOTS_ENABLED=False):
+            resp = self.client.get("/api/products/", params)
+        self.assertNotIn("X-Catalog-Snapshot", resp)
+        return resp.json()
+
+    def test_pages_match_the_live_list_without_queries(self):
+        built = snapshots.build()
+        self.assertEqual(set(built), {"_all", "outdoor", "camping", "kitchen"})
+        self.assertEqual(built["camping"], 4)  # 2 pages x 2 orderings
+
+        for params in [
+            {},
+            {"category": "outdoor", "ordering": "-price", "page": "2"},
+            {"category": "kitchen"},
+        ]:
+            with self.assertNumQueries(0):
+                resp = self.client.get("/api/products/", params)
+            self.assertEqual(resp["X-Catalog-Snapshot"], "hit")
+            self.assertEqual(resp["Content-Type"], "application/json")
+            self.assertEqual(resp.json(), self.live(params))
+
+    def test_gzip_clients_get_the_file_as_is(self):
+        snapshots.build()
+        resp = self.client.get(
+            "/api/products/", {"page": "2"}, HTTP_ACCEPT_ENCODING="gzip, br"
+        )
+        self.assertEqual(resp["Content-Encoding"], "gzip")
+        body = gzip.decompress(b"".join(resp.streaming_content))
+        self.assertEqual(json.loads(body), self.live({"page": "2"}))
+
+    def test_other_requests_fall_through(self):
+        snapshots.build()
+        for params in [
+            {"search": "tent"},
+            {"ordering": "stock"},
+            {"page": "9"},
+            {"category": "../kitchen"},
+            {"category": ["kitchen", "camping"]},
+        ]:
+            resp = self.client.get("/api/products/", params)
+            self.assertNotIn("X-Catalog-Snapshot", resp, params)
+        resp = self.client.get("/api/products/", HTTP_AUTHORIZATION="Bearer x")
+        self.assertNotIn("X-Catalog-Snapshot", resp)
+
+    def test_changes_rebuild_only_affected_categories(self):
+        snapshots.build()
+        self.assertEqual(snapshots.build(), {})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pan.category = self.camping
+            self.pan.save()
+        self.assertEqual(
+            snapshots.dirty_scopes(), {"_all", "outdoor", "camping", "kitchen"}
+        )
+        resp = self.client.get("/api/products/", {"category": "kitchen"})
+        self.assertNotIn("X-Catalog-Snapshot", resp)
+        self.assertEqual(resp.data["count"], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(pk=self.pan.pk).update(price=31)
+            Product.objects.get(slug="tent-0").save()
+        snapshots.build()
+        self.assertEqual(snapshots.dirty_scopes(), set())
+
+        Product.objects.create(name="Mug", slug="mug", price=5, stock=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.get(slug="mug").save()
+        self.assertEqual(snapshots.dirty_scopes(), {"_all"})
+        self.assertEqual(set(snapshots.build()), {"_all"})
+
+        resp = self.client.get("/api/products/", {"category": "kitchen"})
+        self.assertEqual(resp["X-Catalog-Snapshot"], "hit")
+        self.assertEqual(resp.json()["count"], 0)
+
+    def test_deleted_categories_are_pruned(self):
+        snapshots.build()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pan.delete()
+            self.kitchen.delete()
+        self.assertIn("outdoor", snapshots.dirty_scopes())
+
+        out = StringIO()
+        call_command("build_catalog_snapshots", stdout=out)
+        self.assertIn("3 category scope(s)", out.getvalue())
+        resp = self.client.get("/api/products/", {"category": "kitchen"})
+        self.assertNotIn("X-Catalog-Snapshot", resp)
+
+    def test_stock_and_sales_changes_mark_pages_dirty(self):
+        snapshots.build()
+        with self.captureOnCommitCallbacks(execute=True):
+            deduct_stock([(self.pan, 2)])
+        self.assertEqual(snapshots.dirty_scopes(), {"_all", "kitchen"})
+        resp = self.client.get("/api/products/", {"category": "kitchen"})
+        self.assertNotIn("X-Catalog-Snapshot", resp)
+
+        snapshots.build()
+        tent = Product.objects.get(slug="tent-0")
+        with self.captureOnCommitCallbacks(execute=True):
+            record_sales([(tent.pk, 3, tent.price * 3)], timezone.now())
+        self.assertEqual(snapshots.dirty_scopes(), {"_all", "outdoor", "camping"})
+
+    def test_nothing_is_marked_while_disabled(self):
+        snapshots.build()
+        with self.settings(CATALOG_SNAPSHOTS_ENABLED=False):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.pan.save()
+                restock([(self.pan, 1)])
+        self.assertEqual(snapshots.dirty_scopes(), set())
+
+
+@override_settings(PRODUCT_BATCH_MAX_SIZE=5)
+class ProductBatchTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.tent = Product.objects.create(name="Tent", price=100, stock=4, slug="tent")
+        self.lamp = Product.objects.create(name="Lamp", price=20, stock=9, slug="lamp")
+        self.stove = Product.objects.create(
+            name="Stove", price=40, stock=0, slug="stove", is_active=False
+        )
+
+    def batch(self, **params):
+        resp = self.client.get("/api/products/batch/", params)
+        self.assertEqual(resp.status_code, 200, resp.data)
+        return resp.data
+
+    def test_returns_products_in_request_order(self):
+        data = self.batch(ids=f"{self.lamp.id},999", slugs="stove,tent,nope")
+        self.assertEqual(
+            [row["slug"] for row in data["results"]], ["lamp", "stove", "tent"]
+        )
+        self.assertEqual(data["missing"], {"ids": [999], "slugs": ["nope"]})
+        self.assertEqual(data["results"][0]["units_sold"], 0)
+
+    def test_compact_rows_are_cached_per_product(self):
+        with self.assertNumQueries(1):
+            data = self.batch(ids=f"{self.tent.id},{self.lamp.id}", compact="1")
+        self.assertEqual(
+            data["results"][0],
+            {"id": self.tent.id, "price": "100.00", "stock": 4, "is_active": True},
+        )
+        # Cached rows are reused, only the new product is read
+        with self.assertNumQueries(1):
+            data = self.batch(ids=f"{self.lamp.id},{self.stove.id}", compact="1")
+        self.assertEqual(data["results"][1]["is_active"], False)
+        with self.assertNumQueries(0):
+            self.batch(ids=f"{self.stove.id},{self.tent.id}", compact="true")
+        # Slugs resolve through a cached slug -> id mapping
+        with self.assertNumQueries(1):
+            self.batch(slugs="tent", compact="1")
+        with self.assertNumQueries(0):
+            self.batch(slugs="tent", compact="1")
+
+    def test_stock_changes_and_saves_invalidate_entries(self):
+        self.batch(ids=str(self.tent.id), compact="1")
+        with self.captureOnCommitCallbacks(execute=True):
+            deduct_stock([(self.tent, 3)])
+        data = self.batch(ids=str(self.tent.id), compact="1")
+        self.assertEqual(data["results"][0]["stock"], 1)
+
+        self.tent.price = 90
+        self.tent.save()
+        data = self.batch(ids=str(self.tent.id), compact="1")
+        self.assertEqual(data["results"][0]["price"], "90.00")
+
+    def test_invalid_requests(self):
+        for params in [
+            {},
+            {"ids": "1,x"},
+            {"ids": "1,2,3", "slugs": "a,b,c"},
+            {"ids": "99999999999999999999999"},
+        ]:
+            resp = self.client.get("/api/products/batch/", params)
+            self.assertEqual(resp.status_code, 400, params)
+
+
+@override_settings(PRODUCT_BULK_UPDATE_CHUNK_SIZE=2, PRODUCT_BULK_UPDATE_MAX=5)
+class ProductBulkUpdateTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = get_user_model().objects.create_user(
+            username="admin", password="admin123", is_staff=True
+        )
+        self.tents = Category.objects.create(name="Tents", slug="tents")
+        self.products = [
+            Product.objects.create(
+                name=f"Tent {index}",
+                slug=f"tent-{index}",
+                sku=f"T-{index}",
+                price="19.99",
+                stock=10,
+                category=self.tents,
+            )
+            for index in range(3)
+        ]
+        self.other = Product.objects.create(
+            name="Mug", slug="mug", sku="M-1", price=5, stock=10
+        )
+        self.client.force_authenticate(self.admin)
+
+    def bulk(self, **body):
+        return self.client.post("/api/products/bulk-update/", body, format="json")
+
+    def values(self, field):
+        return [
+            getattr(product, field)
+            for product in Product.objects.order_by("id")
+        ]
+
+    def test_relative_price_change_by_filter_invalidates_once(self):
+        self.client.get("/api/products/batch/", {"ids": str(self.products[0].id)})
+        with patch("products.bulk.bump_catalog_version") as bump:
+            resp = self.bulk(filter={"category": "tents"}, price={"percent": "-10"})
+        self.assertEqual(resp.status_code, 200, resp.data)
+        self.assertEqual(resp.data, {"updated": 3})
+        bump.assert_called_once_with()
+        self.assertEqual(
+            [str(price) for price in self.values("price")],
+            ["17.99", "17.99", "17.99", "5.00"],
+        )
+
+        self.bulk(ids=[self.products[0].id], price={"add": "-50"})
+        resp = self.client.get("/api/products/batch/", {"ids": str(self.products[0].id)})
+        self.assertEqual(resp.data["results"][0]["price"], "0.00")
+
+    def test_stock_changes_by_sku_and_sharded_products(self):
+        sharded = self.products[2]
+        sharded.stock_shards = 2
+        sharded.save()
+        reshard(sharded)
+
+        resp = self.bulk(skus=["T-0", "T-2", "M-1"], stock={"add": -4})
+        self.assertEqual(resp.data, {"updated": 3})
+        self.assertEqual(self.values("stock"), [6, 10, 6, 6])
+        self.assertEqual(
+            sum(StockShard.objects.filter(product=sharded).values_list("quantity", flat=True)),
+            6,
+        )
+
+        self.bulk(ids=[p.id for p in self.products], stock={"add": -8})
+        self.assertEqual(self.values("stock"), [0, 2, 0, 6])
+        self.bulk(ids=[self.other.id], stock={"set": 40}, price={"set": "4.5"})
+        self.other.refresh_from_db()
+        self.assertEqual((self.other.stock, str(self.other.price)), (40, "4.50"))
+
+    def test_invalid_requests(self):
+        for body in [
+            {"ids": [self.other.id]},
+            {"ids": [self.other.id], "price": {"set": "-1"}},
+            {"ids": [self.other.id], "price": {"double": 2}},
+            {"ids": [self.other.id], "stock": {"add": "lots"}},
+            {"ids": ["x"], "stock": {"add": 1}},
+            {"filter": {}, "stock": {"add": 1}},
+            {"stock": {"add": 1}},
+            {"filter": {"min_price": "cheap"}, "stock": {"add": 1}},
+        ]:
+            self.assertEqual(self.bulk(**body).status_code, 400, body)
+
+        for index in range(3):
+            Product.objects.create(name=f"Extra {index}", slug=f"extra-{index}", price=1)
+        resp = self.bulk(filter={"max_price": "100"}, stock={"add": 1})
+        self.assertEqual(resp.status_code, 400)
+
+        self.client.force_authenticate(None)
+        self.assertIn(self.bulk(ids=[1], stock={"add": 1}).status_code, (401, 403))
+
+
+class ProductFragmentTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name="Camping")
+        self.tent = Product.objects.create(
+            name="Tent", price=100, stock=4, slug="tent", category=self.category
+        )
+        self.lamp = Product.objects.create(name="Lamp", price=20, stock=9, slug="lamp")
+
+    def list_products(self):
+        with patch.object(
+            ProductSerializer,
+            "to_representation",
+            autospec=True,
+            side_effect=ProductSerializer.to_representation,
+        ) as rendered:
+            resp = self.client.get("/api/products/", {"ordering": "name"})
+        self.assertEqual(resp.status_code, 200)
+        return resp.data["results"], rendered.call_count
+
+    def test_list_only_serializes_misses(self):
+        rows, rendered = self.list_products()
+        self.assertEqual([row["name"] for row in rows], ["Lamp", "Tent"])
+        self.assertEqual(rendered, 2)
+        rows, rendered = self.list_products()
+        self.assertEqual(rendered, 0)
+        self.assertEqual(rows[1]["category"]["name"], "Camping")
+
+        # Fragments are shared with the other endpoints
+        get_fragments([self.tent.id, self.lamp.id])
+        resp = self.client.get("/api/products/batch/", {"ids": self.tent.id})
+        self.assertEqual(resp.data["results"], [rows[1]])
+
+    def test_product_and_category_changes_invalidate(self):
+        self.list_products()
+        self.category.name = "Outdoor"
+        self.category.save()
+        rows, rendered = self.list_products()
+        self.assertEqual(rendered, 2)
+        self.assertEqual(rows[1]["category"]["name"], "Outdoor")
+
+        self.lamp.price = 25
+        self.lamp.save()
+        rows, _ = self.list_products()
+        self.assertEqual(rows[0]["price"], "25.00")
+
+    @override_settings(
+        ALLOWED_HOSTS=["cache-filler.example", "testserver"],
+        MEDIA_BASE_URL="https://shop.example",
+    )
+    def test_fragments_do_not_depend_on_the_request_host(self):
+        Product.objects.filter(pk=self.tent.pk).update(image="products/tent.jpg")
+        image = "https://shop.example/" + default_storage.url("products/tent.jpg").lstrip("/")
+        resp = self.client.get(
+            "/api/products/", {"ordering": "name"}, HTTP_HOST="cache-filler.example"
+        )
+        self.assertEqual(resp.data["results"][1]["image"], image)
+        for url in ("/api/products/", f"/api/products/{self.tent.id}/"):
+            resp = self.client.get(url, secure=True)
+            self.assertNotIn("cache-filler", json.dumps(resp.data, default=str))
+        self.assertEqual(resp.data["image"], image)
+
+    @override_settings(MEDIA_BASE_URL="https://shop.example")
+    def test_write_responses_render_images_like_reads(self):
+        Product.objects.filter(pk=self.tent.pk).update(image="products/tent.jpg")
+        admin = User.objects.create_user(username="admin", password="x", is_staff=True)
+        self.client.force_authenticate(admin)
+        resp = self.client.patch(f"/api/products/{self.tent.id}/", {"price": "90.00"})
+        self.assertEqual(resp.status_code, 200)
+        written = resp.data["image"]
+        self.assertTrue(written.startswith("https://shop.example/"))
+        resp = self.client.get(f"/api/products/{self.tent.id}/")
+        self.assertEqual(resp.data["image"], written)
+
+    def test_stock_changes_drop_the_fragment(self):
+        self.list_products()
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                deduct_stock([(self.tent, 3)])
+        rows, rendered = self.list_products()
+        self.assertEqual(rendered, 1)
+        self.assertEqual(rows[1]["stock"], 1)
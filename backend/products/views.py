@@ -1,12 +1,31 @@
+from django.conf import settings
+from django.db.models import ProtectedError
 from rest_framework import viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import SAFE_METHODS, BasePermission
+from rest_framework.response import Response
+from rest_framework.generics import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
 
-from .models import Product, Category
-from .serializers import ProductSerializer, CategorySerializer
-from .filters import ProductFilter
+from .models import Product, Category, RelatedProduct
+from .serializers import (
+    ProductSerializer,
+    StaffProductSerializer,
+    CategorySerializer,
+    CategoryTreeSerializer,
+    RelatedProductSerializer,
+)
+from .filters import ProductFilter, ProductOrderingFilter
 from .permissions import ReadOnlyOrAdmin
+from .facets import get_facets, parse_facets
+from .fragments import get_fragments, serialize_products
+from .batch import BatchError, get_products, parse_batch
+from .bulk import BulkUpdateError, bulk_update_products, parse_changes
+from .inventory import reshard
+from .sales import with_sales_stats
+from .suggest import index as suggest_index
 
 
 class ProductViewSet(viewsets.ModelViewSet):
@@ -18,21 +37,192 @@ class ProductViewSet(viewsets.ModelViewSet):
     - Full CRUD access for admin users.
     - Supports filtering (price, stock, category).
     - Supports searching by name or description.
-    - Supports ordering (name, price, stock).
+    - Supports ordering (name, price, stock) and best-seller ordering
+      (units_sold, units_7d, units_30d, last_sold_at) from the precomputed
+      ProductSalesStats table. Revenue figures (and ordering on
+      sales_revenue) are only exposed to admin users.
+    - GET /api/products/suggest/?q=<prefix>&limit=<n> returns search-as-you-
+      type suggestions from an in-process prefix index (no database query).
+    - GET /api/products/batch/?ids=1,2&slugs=tent returns many products in
+      one request (?compact=1: only id, price, stock and is_active), served
+      from per-product cache entries; at most PRODUCT_BATCH_MAX_SIZE.
+    - GET /api/products/<id>/related/ lists the products most often bought
+      together with this one (built offline by `build_related_products`).
     - Pagination is applied globally through DRF settings.
+    - Listed and retrieved products are assembled from per-product
+      serialized fragments (products/fragments.py), so only cache misses
+      are serialized. Image URLs (here and in create/update responses) are
+      built on MEDIA_BASE_URL, not on the request's host.
+    - Optional facet counts for the filtered result set
+      (?facets=category,price).
+    - Writing `stock` or `stock_shards` on a sharded product redistributes
+      its stock shards.
+    - POST /api/products/bulk-update/ (admin) changes the price and/or stock
+      of many products at once (see bulk_update).
     """
 
-    queryset = Product.objects.all()
+    queryset = Product.objects.select_related("category")
     serializer_class = ProductSerializer
     permission_classes = [ReadOnlyOrAdmin]
 
     # Enable filters, search and ordering
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, SearchFilter, ProductOrderingFilter]
     filterset_class = ProductFilter
     search_fields = ["name", "description"]
-    ordering_fields = ["price", "stock", "name"]
+    ordering_fields = [
+        "price",
+        "stock",
+        "name",
+        "units_sold",
+        "sales_revenue",
+        "units_7d",
+        "units_30d",
+        "last_sold_at",
+    ]
+    staff_ordering_fields = ["sales_revenue"]
     ordering = ["name"]
 
+    def get_queryset(self):
+        return with_sales_stats(super().get_queryset())
+
+    def get_serializer_class(self):
+        if self.request.user.is_staff:
+            return StaffProductSerializer
+        return ProductSerializer
+
+    def perform_create(self, serializer):
+        product = serializer.save()
+        if product.stock_shards:
+            reshard(product, total=product.stock)
+
+    def perform_update(self, serializer):
+        product = serializer.save()
+        changed = serializer.validated_data
+        if "stock" in changed or "stock_shards" in changed:
+            reshard(product, total=changed.get("stock"))
+
+    @action(detail=False, methods=["get"])
+    def suggest(self, request):
+        try:
+            limit = int(request.query_params.get("limit", settings.PRODUCT_SUGGEST_LIMIT))
+        except ValueError:
+            return Response({"detail": "limit must be an integer"}, status=400)
+        limit = max(1, min(limit, settings.PRODUCT_SUGGEST_MAX_LIMIT))
+
+        query = request.query_params.get("q", "")
+        return Response(suggest_index.suggest(query, limit=limit))
+
+    @action(detail=False, methods=["get"])
+    def batch(self, request):
+        try:
+            ids, slugs = parse_batch(request.query_params)
+        except BatchError as exc:
+            return Response({"detail": str(exc)}, status=400)
+
+        compact = request.query_params.get("compact", "").lower() in ("1", "true")
+        results, missing = get_products(ids, slugs, compact=compact)
+        return Response({"results": results, "missing": missing})
+
+    @action(detail=False, methods=["post"], url_path="bulk-update")
+    def bulk_update(self, request):
+        """
+        Change the price and/or stock of many products.
+
+        Body:
+        - ids: list of product ids, or skus: list of SKUs, or
+          filter: ProductFilter parameters (e.g. {"category": "tents"})
+        - price: {"set": "19.99"}, {"add": "-5"} or {"percent": "10"}
+        - stock: {"set": 100} or {"add": -3}
+
+        Prices and stock never go below zero. At most PRODUCT_BULK_UPDATE_MAX
+        products per request.
+        """
+        try:
+            price, stock = parse_changes(request.data)
+        except BulkUpdateError as exc:
+            return Response({"detail": str(exc)}, status=400)
+
+        ids, skus = request.data.get("ids"), request.data.get("skus")
+        filters = request.data.get("filter")
+        if ids is not None:
+            if not isinstance(ids, list) or not all(
+                isinstance(pk, int) and not isinstance(pk, bool) for pk in ids
+            ):
+                return Response({"detail": "ids must be a list of integers"}, status=400)
+            products = Product.objects.filter(id__in=ids)
+        elif skus is not None:
+            if not isinstance(skus, list) or not all(
+                isinstance(sku, str) and sku for sku in skus
+            ):
+                return Response({"detail": "skus must be a list of SKUs"}, status=400)
+            products = Product.objects.filter(sku__in=skus)
+        elif isinstance(filters, dict) and filters:
+            filterset = ProductFilter(filters, queryset=with_sales_stats(Product.objects.all()))
+            if not filterset.is_valid():
+                return Response(filterset.errors, status=400)
+            products = filterset.qs
+        else:
+            return Response(
+                {"detail": "Pass a list of ids, a list of skus or a non-empty filter"},
+                status=400,
+            )
+
+        limit = settings.PRODUCT_BULK_UPDATE_MAX
+        matched = list(products.order_by("id").values_list("id", flat=True)[: limit + 1])
+        if len(matched) > limit:
+            return Response(
+                {"detail": f"At most {limit} products per request, narrow the selection"},
+                status=400,
+            )
+
+        updated = bulk_update_products(matched, price=price, stock=stock)
+        return Response({"updated": updated})
+
+    @action(detail=True, methods=["get"])
+    def related(self, request, pk=None):
+        # Also answers 404 for a malformed id
+        get_object_or_404(Product.objects.only("id"), pk=pk)
+
+        rows = list(
+            RelatedProduct.objects.filter(product_id=pk, related__is_active=True)
+            .only("related_id", "rank", "score")
+            .order_by("rank")
+        )
+        fragments = get_fragments([row.related_id for row in rows])
+        return Response(
+            RelatedProductSerializer(
+                rows, many=True, context={"product_fragments": fragments}
+            ).data
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        product = self.get_object()
+        fragments = get_fragments([product], staff=request.user.is_staff)
+        return Response(fragments[product.pk])
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+
+        facets = None
+        if request.query_params.get("facets"):
+            names = parse_facets(request.query_params["facets"])
+            facets = get_facets(queryset, names, request.query_params)
+
+        # Rows come from the page query, their representations from the
+        # fragment cache (only misses are serialized)
+        staff = request.user.is_staff
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            data = serialize_products(page, staff=staff)
+            response = self.get_paginated_response(data)
+        else:
+            data = serialize_products(list(queryset), staff=staff)
+            response = Response({"results": data} if facets else data)
+
+        if facets is not None:
+            response.data["facets"] = facets
+        return response
+
 
 class CategoryViewSet(viewsets.ModelViewSet):
     """
@@ -42,7 +232,12 @@ class CategoryViewSet(viewsets.ModelViewSet):
     - Read-only for regular users.
     - Full access for admin users.
     - Supports searching by category name.
-    - Supports ordering alphabetically.
+    - Supports ordering alphabetically or in tree order (?ordering=path).
+    - Supports filtering by parent (?parent=<id>, ?parent=root).
+    - GET /api/categories/tree/ returns the nested tree (?root=<slug> for a
+      single subtree).
+    - A category with subcategories cannot be deleted (409); move or delete
+      the subcategories first.
     """
 
     queryset = Category.objects.all()
@@ -51,5 +246,52 @@ class CategoryViewSet(viewsets.ModelViewSet):
 
     filter_backends = [SearchFilter, OrderingFilter]
     search_fields = ["name"]
-    ordering_fields = ["name"]
+    ordering_fields = ["name", "path"]
     ordering = ["name"]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        parent = self.request.query_params.get("parent")
+        if parent == "root":
+            queryset = queryset.filter(parent__isnull=True)
+        elif parent:
+            try:
+                parent_id = int(parent)
+            except ValueError:
+                raise ValidationError({"parent": 'Must be a category id or "root".'})
+            queryset = queryset.filter(parent_id=parent_id)
+        return queryset
+
+    def destroy(self, request, *args, **kwargs):
+        category = self.get_object()
+        try:
+            self.perform_destroy(category)
+        except ProtectedError:
+            return Response(
+                {"detail": "This category has subcategories; move or delete them first."},
+                status=409,
+            )
+        return Response(status=204)
+
+    @action(detail=False, methods=["get"])
+    def tree(self, request):
+        queryset = Category.objects.order_by("path")
+
+        root_slug = request.query_params.get("root")
+        if root_slug:
+            root = get_object_or_404(Category, slug=root_slug)
+            queryset = root.get_descendants().order_by("path")
+
+        # Path order guarantees parents are seen before their children
+        nodes = {}
+        roots = []
+        for category in queryset:
+            category.tree_children = []
+            nodes[category.pk] = category
+            parent = nodes.get(category.parent_id)
+            if parent is not None:
+                parent.tree_children.append(category)
+            else:
+                roots.append(category)
+
+        return Response(CategoryTreeSerializer(roots, many=True).data)
@@ -1,9 +1,15 @@
 import type { Product } from "./product.type";
 
+// Product details copied onto the order item at checkout
+export type OrderedProduct = Pick<Product, "id" | "name" | "slug"> & {
+  sku: string;
+  image: string | null;
+};
+
 export type OrderItem = {
   id: number;
   order: number;
-  product: Product;
+  product: OrderedProduct;
   quantity: number;
   unit_price: number;
 };